@@ -17,177 +17,1400 @@ The implementation follows computational thinking principles including:
 - Algorithm Design: Structured input, processing, and output flow
 """
 
-import gradio as gr
+import atexit
+import bisect
+import functools
+import inspect
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from string import Template
 
+# The web UI libraries take seconds and over 100 MB to load. Worker processes
+# (see WORKER PROCESSES) run this file again as "__mp_main__" before their
+# first job, but their jobs only use bubble_sort.py, so they skip them
+# (and the gr.Request annotations are strings, which Gradio still reads).
+if __name__ != "__mp_main__":
+    import gradio as gr
+    from fastapi.responses import PlainTextResponse
 
-class BubbleSortVisualizer:
+# The sorting engine itself (no UI) lives in bubble_sort.py
+from bubble_sort import (
+    VARIANTS,
+    BubbleSortVisualizer,
+    SortStopped,
+    bubble_sort_stats,
+    format_log_entry,
+    is_array,
+    load_numbers_file,
+    log_page_job,
+    max_steps,
+    parse_bulk,
+    parse_input,
+    remove_trace_file,
+    stats_job,
+    trace_file_job,
+    trace_id,
+)
+
+
+# Inputs that could need more steps than this are sorted lazily by the UI
+EAGER_STEP_LIMIT = 10_000
+
+# Inputs that could need more steps than this are always stepped through on
+# the server; smaller ones can be sent to the browser player in one go
+BROWSER_STEP_LIMIT = 2_000_000
+
+# Names shown for the bubble sort variants (see VARIANTS in bubble_sort.py)
+VARIANT_LABELS = {
+    "classic": "Classic",
+    "last_swap": "Last-swap bound",
+    "cocktail": "Cocktail shaker",
+}
+
+
+# STEP LOG
+# The "All Steps" log is shown one page at a time, and the full log can be
+# downloaded as a file that is written step by step, so neither ever builds
+# one huge string in memory.
+
+# Most steps shown per page of the log
+LOG_PAGE_SIZE = 1000
+
+# Most numbers printed on one page of the log. Every entry prints the array
+# once or twice, so long arrays get fewer steps per page (see log_page_steps)
+# and a page stays well under a megabyte for any input
+LOG_PAGE_VALUES = 100_000
+
+# Folder for the downloadable log files (one file per session). It is made
+# by the first download, not on import (worker processes import this file
+# too), and deleted when the app exits
+LOG_DIR = None
+LOG_DIR_LOCK = threading.Lock()
+
+
+def log_file_prefix(visualizer):
+    """
+    Get the start of the names of a visualizer's log files.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+    
+    Returns:
+        str: File name prefix, unique among the visualizers alive
+    """
+    return f"bubble_sort_log_{id(visualizer)}_"
+
+
+def log_file_path(visualizer):
+    """
+    Get where a trace's downloadable log is written.
+    
+    Python hands out the id() of a freed visualizer again, so the name
+    also holds the trace ID: a log left behind under a reused id is then
+    only ever reused for the very same trace.
+    
+    Creates LOG_DIR if no log was written yet.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer holding the trace
+        
+    Returns:
+        str: File path inside LOG_DIR
+    """
+    global LOG_DIR
+    with LOG_DIR_LOCK:
+        if LOG_DIR is None:
+            LOG_DIR = tempfile.mkdtemp(prefix="bubble_sort_logs_")
+            atexit.register(shutil.rmtree, LOG_DIR, ignore_errors=True)
+    key = trace_id(visualizer.initial, visualizer.variant)
+    return os.path.join(LOG_DIR, f"{log_file_prefix(visualizer)}{key}.txt")
+
+
+def log_page_steps(visualizer):
+    """
+    Get how many steps one page of a trace's log shows.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The session's visualizer, or None
+    
+    Returns:
+        int: Steps per page, between 1 and LOG_PAGE_SIZE
+    """
+    n = len(visualizer.initial) if visualizer is not None else 0
+    return max(1, min(LOG_PAGE_SIZE, LOG_PAGE_VALUES // max(2 * n, 1)))
+
+
+# PER-SESSION STATE
+# Every browser session gets its own BubbleSortVisualizer, stored in a gr.State
+# component. Handlers receive it as an input and hand it back as an output, so
+# one user's Start never overwrites another user's trace.
+
+# How many events Gradio may run at the same time (shared by all sessions)
+CONCURRENCY_LIMIT = int(os.environ.get("BUBBLE_SORT_CONCURRENCY_LIMIT", 16))
+
+# Drop a session's trace if it has not been used for this many seconds
+SESSION_TTL_SECONDS = 60 * 60
+
+
+def release_visualizer(visualizer):
+    """
+    Free a session's trace when Gradio discards the session.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The session's visualizer, or None
+    """
+    # Cached traces may still be in use by other sessions; the cache
+    # closes them once it has evicted them and no session holds them
+    if visualizer is None:
+        return
+    if visualizer.shared:
+        TRACE_CACHE.release(visualizer)
+    else:
+        close_visualizer(visualizer)
+
+
+def close_visualizer(visualizer):
+    """
+    Free a trace that nobody uses any more (closing its trace file, if any).
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+    """
+    visualizer.clear()
+    remove_log_file(visualizer)
+    with STEP_CACHES_LOCK:
+        STEP_CACHES.pop(visualizer, None)
+
+
+def remove_log_file(visualizer):
+    """
+    Delete a visualizer's downloaded log files (full or partial), if any.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+    """
+    if LOG_DIR is None:
+        return  # Nothing was downloaded yet
+    # Found by prefix: the trace (and so its ID) may already be cleared.
+    # Logs still being written (.part files) are left to their writers
+    prefix = log_file_prefix(visualizer)
+    for name in os.listdir(LOG_DIR):
+        if name.startswith(prefix) and name.endswith(".txt"):
+            try:
+                os.remove(os.path.join(LOG_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+# COMPUTE BUDGETS
+# Sorting happens inside the requests, so one huge input could keep a worker
+# busy for minutes. Each request may only sort for a limited time, a
+# session's trace may only grow so big, and Reset or a new Start stop the
+# session's Start that is still running. When a limit is hit the app shows
+# less (only the statistics, or the furthest step reached) instead of
+# making everyone wait. All limits can be changed with environment variables.
+
+# Longest a single request may spend sorting or counting, in seconds
+REQUEST_SECONDS = float(os.environ.get("BUBBLE_SORT_REQUEST_SECONDS", 2))
+
+# Longest a click on Next, Prev, the slider, Play or the log pages may spend
+# producing the steps of a lazy sort, in seconds. That sort runs in this
+# process and holds the GIL, so every other session waits while it runs
+STEP_SECONDS = float(os.environ.get("BUBBLE_SORT_STEP_SECONDS", 0.1))
+
+# Longest writing the downloadable log may take, in seconds
+DOWNLOAD_SECONDS = float(os.environ.get("BUBBLE_SORT_DOWNLOAD_SECONDS", 30))
+
+# Biggest downloadable log, in bytes (it stops with a note at this size)
+DOWNLOAD_MAX_BYTES = int(os.environ.get("BUBBLE_SORT_DOWNLOAD_MAX_BYTES", 256 * 1024 * 1024))
+
+# Inputs whose sort has more steps than this only get their statistics
+MAX_TRACE_STEPS = int(os.environ.get("BUBBLE_SORT_MAX_TRACE_STEPS", 10 ** 11))
+
+# Memory a session's trace may grow to as its steps are produced, in bytes
+MAX_TRACE_BYTES = int(os.environ.get("BUBBLE_SORT_MAX_TRACE_BYTES", 512 * 1024 * 1024))
+
+# Cancel event of the Start still running in each session (by session hash)
+RUNNING_STARTS = {}
+RUNNING_STARTS_LOCK = threading.Lock()
+
+
+def produced_nbytes(visualizer):
+    """
+    Quickly estimate the memory of the part of a trace produced so far.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+        
+    Returns:
+        int: Swap bits plus 8 bytes per checkpointed value
+    """
+    return len(visualizer.swap_bits) + len(visualizer.checkpoints) * len(visualizer.initial) * 8
+
+
+def budget(visualizer=None, cancel=None, seconds=None):
+    """
+    Make the should_stop check that limits one request's sorting.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): Lazy trace to produce steps of
+                                           (kept under MAX_TRACE_BYTES), or None
+        cancel (threading.Event): Stops the sort when set, or None
+        seconds (float): Time the request may spend sorting (default
+                         STEP_SECONDS for a lazy trace, otherwise
+                         REQUEST_SECONDS)
+        
+    Returns:
+        function: Returns True once the time is up, cancel is set or the
+                  trace has grown too big
+    """
+    if seconds is None:
+        seconds = REQUEST_SECONDS if visualizer is None else STEP_SECONDS
+    deadline = time.monotonic() + seconds
+    
+    def should_stop():
+        if cancel is not None and cancel.is_set():
+            return True
+        if time.monotonic() > deadline:
+            return True
+        return visualizer is not None and produced_nbytes(visualizer) > MAX_TRACE_BYTES
+    return should_stop
+
+
+def limit_note(visualizer):
+    """
+    Explain why a step could not be reached.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The session's visualizer
+        
+    Returns:
+        str: Markdown note for the status box
+    """
+    if produced_nbytes(visualizer) > MAX_TRACE_BYTES:
+        return " *(the trace reached its memory limit here, so later steps cannot be shown)*"
+    return " *(sorting paused here to keep the app responsive; try again to go further)*"
+
+
+def begin_start(request):
+    """
+    Register a new Start for a session, cancelling its Start still running.
+    
+    Args:
+        request (gr.Request): The Start request, or None
+        
+    Returns:
+        threading.Event: Set when this Start should give up
+    """
+    cancel = threading.Event()
+    session = getattr(request, "session_hash", None)
+    if session is not None:
+        with RUNNING_STARTS_LOCK:
+            running = RUNNING_STARTS.get(session)
+            if running is not None:
+                running.set()
+            RUNNING_STARTS[session] = cancel
+    return cancel
+
+
+def finish_start(request, cancel):
+    """
+    Unregister a Start that has finished.
+    
+    Args:
+        request (gr.Request): The Start request, or None
+        cancel (threading.Event): Event from begin_start
+    """
+    session = getattr(request, "session_hash", None)
+    with RUNNING_STARTS_LOCK:
+        if RUNNING_STARTS.get(session) is cancel:
+            del RUNNING_STARTS[session]
+
+
+def cancel_start(request):
+    """
+    Stop a session's Start that is still running, if any.
+    
+    Args:
+        request (gr.Request): Any request from the session, or None
+    """
+    session = getattr(request, "session_hash", None)
+    with RUNNING_STARTS_LOCK:
+        running = RUNNING_STARTS.pop(session, None)
+    if running is not None:
+        running.set()
+
+
+# WORKER PROCESSES
+# Sorting a big trace, counting a variant and formatting log pages are pure
+# Python/NumPy work that holds the GIL. Run in a handler thread they would
+# slow down every other handler, so one user sorting a huge input would make
+# Next and Prev lag for everyone. They run in worker processes instead (the
+# jobs are in bubble_sort.py); the handler thread only waits for the result,
+# which does not hold the GIL. Their events share HEAVY_CONCURRENCY_LIMIT,
+# while the quick navigation events keep their own limits.
+
+# Number of worker processes
+HEAVY_WORKERS = int(os.environ.get("BUBBLE_SORT_HEAVY_WORKERS",
+                                   max(min((os.cpu_count() or 2) - 1, 4), 1)))
+
+# Heavy events running at the same time: one more per worker can wait with
+# its job queued, so a worker never sits idle between two jobs
+HEAVY_CONCURRENCY_LIMIT = 2 * HEAVY_WORKERS
+
+# Work smaller than this (steps to sort, or values to print) is done right
+# in the handler: handing it to a worker would cost more than it saves
+HEAVY_MIN_WORK = 200_000
+
+# How often a handler waiting for a worker checks for cancellation, in seconds
+HEAVY_POLL_SECONDS = 0.05
+
+HEAVY_POOL = None
+HEAVY_POOL_LOCK = threading.Lock()
+
+
+def heavy_pool():
+    """
+    Get the worker processes, starting them on first use.
+    
+    Workers are started fresh ("spawn") rather than forked, since forking
+    a process that runs server threads can copy locks that are held.
+    
+    Returns:
+        ProcessPoolExecutor: The pool
+    """
+    global HEAVY_POOL
+    with HEAVY_POOL_LOCK:
+        if HEAVY_POOL is None:
+            HEAVY_POOL = ProcessPoolExecutor(max_workers=HEAVY_WORKERS,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return HEAVY_POOL
+
+
+def start_heavy_workers():
+    """Start every worker process now, so the first big Start does not wait for one."""
+    pool = heavy_pool()
+    for started in [pool.submit(int) for _ in range(HEAVY_WORKERS)]:
+        started.result()
+
+
+class WorkerFailed(Exception):
+    """Raised by run_heavy when the worker processes could not run a job."""
+
+
+def run_heavy(cancel, job, *args):
+    """
+    Run a job from bubble_sort.py in a worker process and wait for it.
+    
+    If the pool broke (say a worker was killed), it is replaced and the
+    job is tried once more in the new pool. If that fails too, or the job
+    raised anything but SortStopped, WorkerFailed is raised, so the caller
+    can do the work in its own process instead.
+    
+    Args:
+        cancel (threading.Event): Stops waiting when set, or None
+        job (function): Module-level function to run
+        *args: Its arguments (sent to the worker, so keep them small)
+        
+    Returns:
+        The job's result
+        
+    Raises:
+        SortStopped: If cancel was set (the worker finishes the job on its
+                     own, within the job's time limit, and the result is
+                     dropped), or if the job raised it
+        WorkerFailed: If the new pool broke as well, or the job failed
+    """
+    for attempt in range(2):
+        pool = heavy_pool()
+        try:
+            future = pool.submit(job, *args)
+            while True:
+                try:
+                    return future.result(timeout=HEAVY_POLL_SECONDS)
+                except FutureTimeoutError:
+                    if cancel is not None and cancel.is_set():
+                        future.cancel()
+                        raise SortStopped("Cancelled")
+        except BrokenProcessPool as error:
+            LOG.warning("Worker processes stopped; starting new ones")
+            replace_heavy_pool(pool)
+            if attempt:
+                raise WorkerFailed(f"{job.__name__}: worker processes keep stopping") from error
+        except SortStopped:
+            raise
+        except Exception as error:
+            raise WorkerFailed(f"{job.__name__}: {type(error).__name__}: {error}") from error
+
+
+def replace_heavy_pool(broken):
+    """
+    Shut down a broken pool, so the next heavy_pool() starts a new one.
+    
+    Args:
+        broken (ProcessPoolExecutor): The pool that broke
+    """
+    global HEAVY_POOL
+    with HEAVY_POOL_LOCK:
+        # Another handler may have replaced it already
+        if HEAVY_POOL is broken:
+            HEAVY_POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+# Every event handler records how long it took and how big its output was,
+# and every new trace records how long it took to build and how big it is.
+# The numbers are kept in memory (a few counters per metric, updated under
+# a lock) and served in the Prometheus text format at /metrics, so recording
+# them costs a handful of additions per event.
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the size buckets (bytes or steps): 100, 1000, ... 10**10
+SIZE_BUCKETS = tuple(10 ** power for power in range(2, 11))
+
+# Payload sizes are measured (by encoding the outputs as JSON) for one call
+# in this many, per handler
+PAYLOAD_SAMPLE_RATE = 8
+
+# Messages from the handlers (e.g. Next/Prev moves) go to this logger
+LOG = logging.getLogger("bubble_sort.app")
+
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets, like a Prometheus histogram.
+    
+    Attributes:
+        name (str): Metric name
+        help_text (str): One-line description for /metrics
+        buckets (tuple): Upper bound of every bucket, smallest first
+        label (str): Name of the label that splits the metric, or None
+    """
+    
+    def __init__(self, name, help_text, buckets, label=None):
+        """
+        Create a histogram with no observations.
+        
+        Args:
+            name (str): Metric name
+            help_text (str): One-line description for /metrics
+            buckets (tuple): Upper bound of every bucket, smallest first
+            label (str): Name of the label that splits the metric, or None
+        """
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._series = {}  # label value -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+    
+    def observe(self, value, label_value=""):
+        """
+        Record one observation.
+        
+        Args:
+            value (float): Observed value (seconds, bytes, ...)
+            label_value (str): Value of the label, if the metric has one
+        """
+        # Only the first bucket the value fits in is counted here; render
+        # adds up the counts to make the buckets cumulative
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+    
+    def render(self):
+        """
+        Format the histogram in the Prometheus text format.
+        
+        Returns:
+            list: Lines for /metrics
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        
+        for label_value, values in sorted(series.items()):
+            labels = f'{self.label}="{label_value}",' if self.label else ""
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                total += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {total}')
+            labels = "{" + labels.rstrip(",") + "}" if labels else ""
+            lines.append(f"{self.name}_count{labels} {values[-2]}")
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    A single value that can go up and down, like a Prometheus gauge.
+    
+    Attributes:
+        name (str): Metric name
+        help_text (str): One-line description for /metrics
+    """
+    
+    def __init__(self, name, help_text, read=None):
+        """
+        Create a gauge starting at zero.
+        
+        Args:
+            name (str): Metric name
+            help_text (str): One-line description for /metrics
+            read (function): Called for the value when /metrics is served,
+                             instead of keeping a count
+        """
+        self.name = name
+        self.help_text = help_text
+        self._read = read
+        self._value = 0
+        self._lock = threading.Lock()
+    
+    def add(self, amount):
+        """
+        Change the value.
+        
+        Args:
+            amount (float): Amount to add (negative to subtract)
+        """
+        with self._lock:
+            self._value += amount
+    
+    def render(self):
+        """
+        Format the gauge in the Prometheus text format.
+        
+        Returns:
+            list: Lines for /metrics
+        """
+        value = self._read() if self._read else self._value
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {value}"]
+
+
+HANDLER_SECONDS = Histogram(
+    "bubble_sort_handler_seconds", "Time spent in each event handler",
+    LATENCY_BUCKETS, "handler")
+PAYLOAD_BYTES = Histogram(
+    "bubble_sort_payload_bytes", "JSON size of handler outputs (sampled)",
+    SIZE_BUCKETS, "handler")
+GENERATE_SECONDS = Histogram(
+    "bubble_sort_generate_seconds", "Time spent in generate_steps",
+    LATENCY_BUCKETS, "variant")
+TRACE_STEPS = Histogram(
+    "bubble_sort_trace_steps", "Steps in each newly generated trace", SIZE_BUCKETS)
+TRACE_BYTES = Histogram(
+    "bubble_sort_trace_bytes", "Size of each newly generated finished trace (file or memory)",
+    SIZE_BUCKETS)
+ACTIVE_SESSIONS = Gauge(
+    "bubble_sort_active_sessions", "Browser sessions currently open")
+CACHE_BYTES = Gauge(
+    "bubble_sort_trace_cache_bytes", "Memory held by the shared trace cache",
+    read=lambda: TRACE_CACHE.nbytes)
+
+METRICS = [HANDLER_SECONDS, PAYLOAD_BYTES, GENERATE_SECONDS, TRACE_STEPS,
+           TRACE_BYTES, ACTIVE_SESSIONS, CACHE_BYTES]
+
+
+def metrics_text():
+    """
+    Format every metric for the /metrics endpoint.
+    
+    Returns:
+        str: All metrics in the Prometheus text format
+    """
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def payload_size(outputs):
+    """
+    Estimate how many bytes a handler's outputs add to the response.
+    
+    Args:
+        outputs: Return value of a handler (one value or a tuple)
+        
+    Returns:
+        int: Length of the JSON encoding of the text and update outputs
+    """
+    if not isinstance(outputs, tuple):
+        outputs = (outputs,)
+    # The session visualizer stays on the server, so it is not counted
+    return sum(len(json.dumps(value)) for value in outputs
+               if isinstance(value, (str, dict, list)))
+
+
+def instrumented(handler):
+    """
+    Record the latency and payload size of an event handler.
+    
+    Generator handlers (Play) spend most of their time waiting for the next
+    frame, so only their payloads are recorded, once per frame.
+    
+    Only functions registered as Gradio handlers are wrapped. The helpers
+    they share (show_step, log_page) are not, so no event counts twice.
+    
+    Args:
+        handler (function): Event handler
+        
+    Returns:
+        function: Handler that records metrics on every call
+    """
+    name = handler.__name__
+    calls = itertools.count()
+    
+    def record_payload(outputs):
+        if next(calls) % PAYLOAD_SAMPLE_RATE == 0:
+            PAYLOAD_BYTES.observe(payload_size(outputs), name)
+    
+    # Gradio checks for generators to stream their frames, so the wrapper
+    # has to be a generator too
+    if inspect.isgeneratorfunction(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            for outputs in handler(*args, **kwargs):
+                record_payload(outputs)
+                yield outputs
+        return wrapper
+    
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outputs = handler(*args, **kwargs)
+        HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+        record_payload(outputs)
+        return outputs
+    return wrapper
+
+
+def build_trace(visualizer, numbers, lazy=False, variant="classic", path=None, should_stop=None):
+    """
+    Run generate_steps and record how long it took and how big the trace is.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): Visualizer to fill in
+        numbers (list or ndarray): Parsed numbers
+        lazy (bool): Produce the steps on demand (see generate_steps)
+        variant (str): Bubble sort variant, one of VARIANTS
+        path (str): Trace file to write (see generate_steps), or None
+        should_stop (function): Check that can abandon the sort (see budget)
+    """
+    start = time.perf_counter()
+    visualizer.generate_steps(numbers, lazy=lazy, variant=variant, path=path,
+                              should_stop=should_stop)
+    GENERATE_SECONDS.observe(time.perf_counter() - start, variant)
+    observe_trace(visualizer)
+
+
+def observe_trace(visualizer):
+    """
+    Record how big a new trace is.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): Visualizer holding the trace
+    """
+    # A lazy trace's size is only known once it has been produced
+    if visualizer.trace_file is not None:
+        TRACE_STEPS.observe(visualizer.total_steps())
+        TRACE_BYTES.observe(os.path.getsize(visualizer.trace_file))
+    elif visualizer.is_complete():
+        TRACE_STEPS.observe(visualizer.total_steps())
+        TRACE_BYTES.observe(trace_nbytes(visualizer))
+
+
+def session_opened():
+    """Count a browser session that just loaded the page."""
+    ACTIVE_SESSIONS.add(1)
+
+
+def session_closed(request: "gr.Request" = None):
+    """Count a browser session whose tab was closed or refreshed."""
+    ACTIVE_SESSIONS.add(-1)
+    with NAVIGATIONS_LOCK:
+        NAVIGATIONS.pop(getattr(request, "session_hash", None), None)
+
+
+def metrics_endpoint():
+    """
+    Serve the /metrics page.
+    
+    Returns:
+        PlainTextResponse: All metrics in the Prometheus text format
+    """
+    return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+def start_logging(level=None):
+    """
+    Print log messages from a background thread, so handlers only put them
+    on a queue and never wait for the console.
+    
+    Args:
+        level (str): Logging level; defaults to the BUBBLE_SORT_LOG_LEVEL
+                     environment variable, or WARNING
+        
+    Returns:
+        QueueListener: The running background printer
+    """
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, logging.StreamHandler())
+    listener.start()
+    LOG.addHandler(logging.handlers.QueueHandler(records))
+    LOG.setLevel(level or os.environ.get("BUBBLE_SORT_LOG_LEVEL", "WARNING"))
+    LOG.propagate = False
+    return listener
+
+
+# ============================================================================
+# TRACE CACHE
+# ============================================================================
+# Most visitors click the same example inputs. Finished traces are kept in
+# one cache shared by every session, keyed by a hash of the parsed numbers,
+# so Start on a popular input reuses the existing trace instead of sorting
+# again and storing a second copy.
+
+# Memory the cached traces may use together (least recently used go first)
+TRACE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Traces read from trace files that the cache may keep together. Such a trace
+# only keeps a few hundred bytes in memory, but holds two file descriptors
+# (the file and its memory map) and a lock that stops prune_trace_dir from
+# deleting the file, so the memory budget alone would never evict them
+TRACE_CACHE_FILES = 64
+
+# Inputs offered as examples in the UI; their traces are cached at startup
+EXAMPLE_INPUTS = ["1, 2, 3, 4", "5, 2, 8, 1"]
+
+# TRACE FILES
+# Finished traces are also written to trace files named by their trace_id,
+# which outlive the process. Start on a known input (or a link with
+# ?trace=<id>) opens the file instead of sorting again, and the file is
+# memory-mapped, so even huge traces take little memory.
+# Several app workers on one host can share TRACE_DIR: they map the same
+# files, so each trace is in memory once per host, not once per worker, and
+# any worker can open any trace by its ID.
+
+
+def private_temp_dir(name):
+    """
+    Create (or reuse) a folder in the temp folder that only this user can use.
+    
+    The user ID is added to the name, so every user gets a folder of their
+    own (on Windows the temp folder is per user already).
+    
+    Args:
+        name (str): Folder name
+    
+    Returns:
+        str: Path of the folder
+    
+    Raises:
+        PermissionError: If the path exists but is not a folder of this user
+    """
+    uid = os.getuid() if hasattr(os, "getuid") else None
+    path = os.path.join(tempfile.gettempdir(), name if uid is None else f"{name}-{uid}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if uid is not None:
+        # Someone else may have made it first (or put a link there)
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != uid:
+            raise PermissionError(f"{path} is not a folder owned by this user; "
+                                  f"set BUBBLE_SORT_TRACE_DIR to another folder")
+        os.chmod(path, 0o700)
+    return path
+
+
+# Folder for the trace files (kept between restarts). Trace files are
+# trusted when they are opened, so by default they go in a folder only this
+# user can write to
+TRACE_DIR = os.environ.get("BUBBLE_SORT_TRACE_DIR") or private_temp_dir("bubble_sort_traces")
+os.makedirs(TRACE_DIR, exist_ok=True)
+
+# Disk space the trace files may use together (least recently used go first)
+TRACE_DIR_BYTES = 1024 * 1024 * 1024
+
+# Sorts with at most this many steps are only kept in memory: they are quick
+# to sort again, and a file (and a folder scan) for every small Start costs
+# more than it saves
+TRACE_FILE_MIN_STEPS = EAGER_STEP_LIMIT
+
+# TRACE_DIR is scanned for old files at most this often, in seconds, unless
+# the files written since the last scan could have filled it up
+TRACE_DIR_SCAN_SECONDS = 60
+
+# Bytes in TRACE_DIR after the last scan plus the files written since, and
+# when that scan ran (other processes sharing TRACE_DIR are only seen by scans)
+TRACE_DIR_USED = 0
+TRACE_DIR_SCANNED = None
+TRACE_DIR_LOCK = threading.Lock()
+
+
+def trace_nbytes(visualizer):
+    """
+    Estimate the memory a finished trace holds on to.
+    
+    A trace read from a trace file only keeps its pass tables (and the
+    input, for a list) in memory; the rest stays in the file.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): A visualizer with a trace
+        
+    Returns:
+        int: Approximate size in bytes
+    """
+    if visualizer.trace_file is not None:
+        total = sys.getsizeof(visualizer.pass_starts) + sys.getsizeof(visualizer.pass_bounds)
+        if isinstance(visualizer.initial, list):
+            total += sys.getsizeof(visualizer.initial)
+        return total
+    
+    total = len(visualizer.swap_bits)
+    for arr in [visualizer.initial] + visualizer.checkpoints:
+        if is_array(arr):
+            total += arr.nbytes
+        else:
+            total += sys.getsizeof(arr) + sum(sys.getsizeof(value) for value in arr)
+    return total
+
+
+class TraceCache:
+    """
+    Bounded, least-recently-used cache of finished traces.
+    
+    Cached visualizers are marked shared, so release_visualizer does not
+    clear them. Every session showing a cached trace holds it (get and put
+    with hold=True, undone by release). An evicted trace is dropped from the
+    cache; sessions that still show it keep working, and it is closed once
+    the last of them lets go of it, so its trace file does not stay open.
+    
+    Attributes:
+        max_bytes (int): Memory budget for all cached traces together
+        max_files (int): Most traces read from trace files kept together
+        nbytes (int): Estimated memory used by the cached traces
+        files (int): Cached traces read from trace files
+    """
+    
+    def __init__(self, max_bytes=TRACE_CACHE_BYTES, max_files=TRACE_CACHE_FILES):
+        """
+        Create an empty cache.
+        
+        Args:
+            max_bytes (int): Memory budget for all cached traces together
+            max_files (int): Most traces read from trace files kept together
+        """
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.nbytes = 0
+        self.files = 0
+        self._entries = OrderedDict()  # key -> (visualizer, size), oldest first
+        self._cached = set()  # The visualizers in _entries
+        self._holds = {}  # visualizer -> number of sessions holding it
+        self._lock = threading.Lock()  # Handlers run in several threads
+    
+    def get(self, key, hold=False):
+        """
+        Look up a trace and mark it as recently used.
+        
+        Args:
+            key (str): Key from trace_id
+            hold (bool): Hold the trace for a session (see release)
+        
+        Returns:
+            BubbleSortVisualizer: The cached trace, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            if hold:
+                self._holds[entry[0]] = self._holds.get(entry[0], 0) + 1
+            return entry[0]
+    
+    def put(self, key, visualizer, hold=False):
+        """
+        Add a finished trace, evicting the least recently used ones if the
+        budgets would be exceeded. Traces that are still being produced, or
+        that are bigger than the whole budget, are not cached.
+        
+        Args:
+            key (str): Key from trace_id
+            visualizer (BubbleSortVisualizer): Visualizer holding the trace
+            hold (bool): Hold the trace for a session (see release), if it
+                         is cached
+        
+        Returns:
+            bool: True if the trace is now cached
+        """
+        if not visualizer.is_complete():
+            return False
+        size = trace_nbytes(visualizer)
+        if size > self.max_bytes:
+            return False
+        
+        # Fill in everything read later, so the shared trace never changes
+        visualizer.get_stats()
+        visualizer.shared = True
+        
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                evicted.append(self._forget(old))
+            self._entries[key] = (visualizer, size)
+            self._cached.add(visualizer)
+            self.nbytes += size
+            self.files += visualizer.trace_file is not None
+            if hold:
+                self._holds[visualizer] = self._holds.get(visualizer, 0) + 1
+            
+            while self.nbytes > self.max_bytes or self.files > self.max_files:
+                _, entry = self._entries.popitem(last=False)
+                evicted.append(self._forget(entry))
+        
+        # Traces no session holds are closed right away
+        for trace in evicted:
+            if trace is not None:
+                close_visualizer(trace)
+        return True
+    
+    def _forget(self, entry):
+        """
+        Account for an entry that was taken out of _entries (lock held).
+        
+        Args:
+            entry (tuple): (visualizer, size)
+        
+        Returns:
+            BubbleSortVisualizer: The visualizer if nobody holds it (so it
+                                  can be closed), otherwise None
+        """
+        visualizer, size = entry
+        self._cached.discard(visualizer)
+        self.nbytes -= size
+        self.files -= visualizer.trace_file is not None
+        return None if self._holds.get(visualizer) else visualizer
+    
+    def release(self, visualizer):
+        """
+        Let go of a trace held by a session, closing it if it was evicted
+        and this was the last hold.
+        
+        Args:
+            visualizer (BubbleSortVisualizer): A trace from get or put
+        """
+        with self._lock:
+            holds = self._holds.get(visualizer, 0) - 1
+            if holds > 0:
+                self._holds[visualizer] = holds
+                return
+            self._holds.pop(visualizer, None)
+            if visualizer in self._cached:
+                return
+        close_visualizer(visualizer)
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+TRACE_CACHE = TraceCache()
+
+
+def trace_file_path(key):
+    """
+    Get where the trace file for a trace ID is kept.
+    
+    Args:
+        key (str): Trace ID from trace_id
+        
+    Returns:
+        str: File path inside TRACE_DIR
+    """
+    return os.path.join(TRACE_DIR, f"{key}.trace")
+
+
+def open_stored_trace(key):
+    """
+    Open a trace from its trace file, if there is one.
+    
+    Args:
+        key (str): Trace ID from trace_id
+        
+    Returns:
+        BubbleSortVisualizer: Visualizer reading the file, or None
+    """
+    path = trace_file_path(key)
+    visualizer = BubbleSortVisualizer()
+    try:
+        visualizer.open_trace(path)
+        os.utime(path)  # Mark it as recently used for prune_trace_dir
+    except (OSError, ValueError):
+        return None
+    return visualizer
+
+
+def prune_trace_dir(max_bytes=TRACE_DIR_BYTES):
+    """
+    Delete the least recently used trace files until they fit in max_bytes.
+    
+    Files that are open in any process (this one or another app worker
+    sharing TRACE_DIR) are skipped; they can go once nobody uses them.
+    
+    Args:
+        max_bytes (int): Disk budget for all trace files together
+    """
+    global TRACE_DIR_USED, TRACE_DIR_SCANNED
+    files = []
+    for entry in os.scandir(TRACE_DIR):
+        if entry.name.endswith(".trace"):
+            info = entry.stat()
+            files.append((info.st_mtime, info.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if remove_trace_file(path):
+            total -= size
+
+    with TRACE_DIR_LOCK:
+        TRACE_DIR_USED, TRACE_DIR_SCANNED = total, time.monotonic()
+
+
+def trace_file_added(path):
+    """
+    Count a new trace file, and prune TRACE_DIR if it may be over budget
+    (or was not scanned for TRACE_DIR_SCAN_SECONDS).
+    
+    Args:
+        path (str): The new trace file
+    """
+    global TRACE_DIR_USED
+    with TRACE_DIR_LOCK:
+        TRACE_DIR_USED += os.path.getsize(path)
+        due = (TRACE_DIR_USED > TRACE_DIR_BYTES or TRACE_DIR_SCANNED is None
+               or time.monotonic() - TRACE_DIR_SCANNED > TRACE_DIR_SCAN_SECONDS)
+    if due:
+        prune_trace_dir()
+
+
+def cached_trace(numbers, variant="classic", stats=None, cancel=None, seconds=None):
     """
-    Manages the state and generation of bubble sort visualization steps.
+    Get the finished trace for an input, sorting it only on a cache miss.
     
-    This class encapsulates all the logic for:
-    - Generating sorting steps
-    - Storing the complete sorting history
-    - Tracking the current position in the sorting process
+    The memory cache is checked first, then the trace files. A new trace
+    with more than TRACE_FILE_MIN_STEPS steps is written to a trace file as
+    it is sorted; big ones are sorted by a worker process (see WORKER
+    PROCESSES) and the file is opened here. If the workers fail, the sort
+    runs here instead, within the same time limit.
     
-    Attributes:
-        steps (list): List of dictionaries, each representing one step in the sorting process
-        current_step (int): Index of the current step being displayed
+    The trace is held for the caller (see TraceCache.release), so let go
+    of it with release_visualizer.
+    
+    Args:
+        numbers (list or ndarray): Parsed numbers
+        variant (str): Bubble sort variant, one of VARIANTS
+        stats (dict): The input's bubble_sort_stats, if already known
+        cancel (threading.Event): Stops the sort when set, or None
+        seconds (float): Time the sort may take, or None for no limit
+    
+    Returns:
+        BubbleSortVisualizer: Shared visualizer if the trace could be
+                              cached, otherwise a new private one
+    
+    Raises:
+        SortStopped: If the sort was cancelled or ran out of time
+    """
+    key = trace_id(numbers, variant)
+    visualizer = TRACE_CACHE.get(key, hold=True)
+    if visualizer is not None:
+        return visualizer
+    
+    visualizer = open_stored_trace(key)
+    if visualizer is None and max_steps(len(numbers)) >= HEAVY_MIN_WORK:
+        start = time.perf_counter()
+        try:
+            run_heavy(cancel, trace_file_job, numbers, variant, trace_file_path(key), seconds)
+        except WorkerFailed:
+            # Sorted here instead, within the same time limit
+            LOG.warning("Sorting in the handler instead", exc_info=True)
+        else:
+            GENERATE_SECONDS.observe(time.perf_counter() - start, variant)
+            visualizer = open_stored_trace(key)
+            if visualizer is None:
+                raise SortStopped("The new trace file was removed before it was opened")
+            observe_trace(visualizer)
+            trace_file_added(visualizer.trace_file)
+    if visualizer is None:
+        visualizer = BubbleSortVisualizer()
+        should_stop = None if seconds is None else budget(cancel=cancel, seconds=seconds)
+        path = trace_file_path(key) if max_steps(len(numbers)) > TRACE_FILE_MIN_STEPS else None
+        build_trace(visualizer, numbers, variant=variant, path=path, should_stop=should_stop)
+        visualizer.stats = visualizer.stats or stats
+        if path is not None:
+            trace_file_added(path)
+    TRACE_CACHE.put(key, visualizer, hold=True)
+    return visualizer
+
+
+def warm_trace_cache(inputs=EXAMPLE_INPUTS):
+    """
+    Sort the example inputs ahead of time so their first Start is instant.
+    
+    Args:
+        inputs (list): Input strings, as typed in the textbox
+    """
+    for text in inputs:
+        nums, error = parse_input(text)
+        if not error:
+            release_visualizer(cached_trace(nums))
+
+
+# ============================================================================
+# STEP CACHE
+# ============================================================================
+# Rebuilding a step from its checkpoint replays up to checkpoint_passes
+# passes, which takes milliseconds for long arrays. Each trace keeps a small
+# least-recently-used cache of rebuilt steps, and after every step shown the
+# steps around it are rebuilt in the background (in one cheap replay with
+# iter_steps), so Next, Prev and short slider moves are usually cache hits.
+
+# Memory the cached steps of one trace may use
+STEP_CACHE_BYTES = 8 * 1024 * 1024
+
+# How many steps before and after the shown step are prepared in advance
+PREFETCH_STEPS = 16
+
+# Background threads that prepare the steps (shared by all sessions),
+# created on first use (see prefetch_pool)
+PREFETCH_POOL = None
+PREFETCH_POOL_LOCK = threading.Lock()
+
+
+def prefetch_pool():
+    """
+    Get the prefetch threads, creating them on first use.
+    
+    Returns:
+        ThreadPoolExecutor: The pool
+    """
+    global PREFETCH_POOL
+    with PREFETCH_POOL_LOCK:
+        if PREFETCH_POOL is None:
+            PREFETCH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+        return PREFETCH_POOL
+
+
+class StepCache:
     """
+    Bounded, least-recently-used cache of the steps of one trace.
     
-    def __init__(self):
-        """Initialize the visualizer with empty state."""
-        self.steps = []  # Will store all sorting steps
-        self.current_step = 0  # Tracks which step we're currently viewing
+    Attributes:
+        max_bytes (int): Memory budget for the cached steps
+        center (int): Step the latest prefetch was asked for, or None
+    """
     
-    def generate_steps(self, numbers):
+    def __init__(self, max_bytes=STEP_CACHE_BYTES):
         """
-        Generate all sorting steps for the bubble sort algorithm.
-        
-        This is the core bubble sort implementation that records every action:
-        - Every comparison between adjacent elements
-        - Every swap operation performed
-        - The array state after each operation
+        Create an empty cache.
         
         Args:
-            numbers (list): List of numbers to be sorted
-            
-        Process:
-            1. Start with unsorted array
-            2. Compare adjacent pairs
-            3. Swap if left > right
-            4. Repeat until no swaps needed (array is sorted)
+            max_bytes (int): Memory budget for the cached steps
         """
-        # Reset state for new sorting session
-        self.steps = []
-        self.current_step = 0
-        arr = numbers.copy()  # Create copy to avoid modifying original input
-        n = len(arr)
-        
-        # STEP 0: Record the initial unsorted state
-        # This allows users to see the starting point before any sorting begins
-        self.steps.append({
-            'num': 0,  # Step number
-            'arr': arr.copy(),  # Current state of array
-            'cmp': [],  # Indices being compared (empty for initial state)
-            'swap': False,  # Whether a swap occurred
-            'msg': f"Initial array: {arr}"  # Human-readable description
-        })
-        
-        step_num = 1  # Counter for tracking step numbers
-        
-        # OUTER LOOP: Controls the number of passes through the array
-        # We need at most (n-1) passes because:
-        # - Each pass moves at least one element to its correct position
-        # - After (n-1) passes, all elements except the first must be sorted
-        # - If all others are sorted, the first element must also be in place
-        for i in range(n - 1):
-            had_swap = False  # Flag to detect if any swaps occurred in this pass
-            
-            # INNER LOOP: Compare and potentially swap adjacent elements
-            # Range decreases by i each time because:
-            # - After pass 1: largest element is at the end (position n-1)
-            # - After pass 2: two largest elements are at the end (n-2, n-1)
-            # - After pass i: i largest elements are in their final positions
-            # So we don't need to compare them again
-            for j in range(n - i - 1):
-                # COMPARISON STEP
-                # Record the comparison before we decide whether to swap
-                # This shows users which two elements are being evaluated
-                self.steps.append({
-                    'num': step_num,
-                    'arr': arr.copy(),
-                    'cmp': [j, j + 1],  # Indices of elements being compared
-                    'swap': False,  # Not swapping yet, just comparing
-                    'msg': f"Pass {i+1}: Compare arr[{j}]={arr[j]} with arr[{j+1}]={arr[j+1]}"
-                })
-                step_num += 1
-                
-                # DECISION: Should we swap these elements?
-                # Swap if left element is greater than right element
-                # This moves larger values toward the end of the array
-                if arr[j] > arr[j + 1]:
-                    # PERFORM THE SWAP
-                    # Python allows elegant tuple unpacking for swapping
-                    # This is equivalent to: temp = arr[j]; arr[j] = arr[j+1]; arr[j+1] = temp
-                    arr[j], arr[j + 1] = arr[j + 1], arr[j]
-                    had_swap = True  # Mark that we made at least one swap this pass
-                    
-                    # SWAP STEP
-                    # Record the state after the swap so users can see the change
-                    self.steps.append({
-                        'num': step_num,
-                        'arr': arr.copy(),
-                        'cmp': [j, j + 1],  # Same indices, but now swapped
-                        'swap': True,  # Indicate this was a swap operation
-                        'msg': f"Pass {i+1}: SWAPPED! Now: {arr}"
-                    })
-                    step_num += 1
-                else:
-                    # NO SWAP NEEDED
-                    # Elements are already in correct order (left <= right)
-                    # Still record this step to show the decision-making process
-                    self.steps.append({
-                        'num': step_num,
-                        'arr': arr.copy(),
-                        'cmp': [j, j + 1],
-                        'swap': False,
-                        'msg': f"Pass {i+1}: No swap"
-                    })
-                    step_num += 1
-            
-            # END OF PASS CHECK
-            # If we made no swaps during this entire pass, the array is sorted!
-            # This is an optimization that allows early termination
-            if not had_swap:
-                self.steps.append({
-                    'num': step_num,
-                    'arr': arr.copy(),
-                    'cmp': [],
-                    'swap': False,
-                    'msg': f"Pass {i+1}: Sorted!"
-                })
-                step_num += 1
-                break  # Exit early, no need for more passes
-        
-        # FINAL STEP
-        # Record the completion state with the fully sorted array
-        self.steps.append({
-            'num': step_num,
-            'arr': arr.copy(),
-            'cmp': [],
-            'swap': False,
-            'msg': f"COMPLETE: {arr}"
-        })
-    
-    def get_step(self, step_index):
+        self.max_bytes = max_bytes
+        self.center = None
+        self._steps = OrderedDict()  # step index -> Step, oldest first
+        self._lock = threading.Lock()  # Handlers and prefetching run in several threads
+    
+    def get(self, step_index):
         """
-        Retrieve a specific step from the sorting history.
+        Look up a step and mark it as recently used.
         
         Args:
-            step_index (int): Index of the step to retrieve
+            step_index (int): Index of the step
             
         Returns:
-            dict: Step information, or None if index is invalid
+            Step: The cached step, or None
         """
-        # Validate that the index is within bounds
-        if not self.steps or step_index < 0 or step_index >= len(self.steps):
-            return None
-        return self.steps[step_index]
+        with self._lock:
+            step = self._steps.get(step_index)
+            if step is not None:
+                self._steps.move_to_end(step_index)
+            return step
     
-    def total_steps(self):
+    def capacity(self, n):
         """
-        Get the total number of steps in the current sorting process.
+        Count how many steps of an array fit in the memory budget.
+        
+        Args:
+            n (int): Length of the array
         
         Returns:
-            int: Total number of steps recorded
+            int: Number of steps (at least 1)
         """
-        return len(self.steps)
+        # Every step holds a copy of the whole array (8 bytes per value)
+        return max(self.max_bytes // (n * 8 + 1), 1)
+    
+    def put(self, step):
+        """
+        Add a step, evicting the least recently used ones if the cache is full.
+        
+        Args:
+            step (Step): Step from get_step or iter_steps
+        """
+        capacity = self.capacity(len(step.arr))
+        with self._lock:
+            self._steps[step.num] = step
+            self._steps.move_to_end(step.num)
+            while len(self._steps) > capacity:
+                self._steps.popitem(last=False)
+    
+    def __contains__(self, step_index):
+        return step_index in self._steps
+    
+    def __len__(self):
+        return len(self._steps)
+
+
+# Step caches by visualizer; a cache goes away with its visualizer
+STEP_CACHES = weakref.WeakKeyDictionary()
+STEP_CACHES_LOCK = threading.Lock()
+
+
+def step_cache(visualizer):
+    """
+    Get (or create) the step cache of a trace.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+        
+    Returns:
+        StepCache: Its cache
+    """
+    with STEP_CACHES_LOCK:
+        cache = STEP_CACHES.get(visualizer)
+        if cache is None:
+            cache = STEP_CACHES[visualizer] = StepCache()
+        return cache
+
+
+def cached_step(visualizer, step_index):
+    """
+    Get an already produced step, from the step cache if possible.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+        step_index (int): Index of a produced step
+        
+    Returns:
+        Step: Step information
+    """
+    cache = step_cache(visualizer)
+    step = cache.get(step_index)
+    if step is None:
+        step = visualizer.get_step(step_index)
+        cache.put(step)
+    return step
+
+
+def prefetch_steps(visualizer, step_index):
+    """
+    Prepare the steps around a step in the background.
+    
+    Only steps that are already produced are prepared, so prefetching
+    never runs a lazy sort.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+        step_index (int): The step just shown
+    """
+    cache = step_cache(visualizer)
+    cache.center = step_index
+    prefetch_pool().submit(prefetch_job, visualizer, cache, step_index)
 
 
-# GLOBAL INSTANCE
-# Create a single instance that persists across function calls
-# This maintains state between user interactions in the Gradio interface
-visualizer = BubbleSortVisualizer()
+def prefetch_job(visualizer, cache, step_index):
+    """
+    Rebuild the steps within PREFETCH_STEPS of a step into its cache.
+    
+    The window shrinks to what the cache holds (the step itself included),
+    so prefetching never evicts the steps it just prepared, and the steps
+    nearest to the step are put in first.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+        cache (StepCache): Its step cache
+        step_index (int): The step the prefetch was asked for
+    """
+    # A newer prefetch for this trace replaces this one
+    if cache.center != step_index:
+        return
+    reach = min(PREFETCH_STEPS, (cache.capacity(len(visualizer.initial)) - 1) // 2)
+    start = max(step_index - reach, 0)
+    stop = min(step_index + reach + 1, visualizer.total_steps())
+    missing = [k for k in range(start, stop) if k not in cache]
+    if not missing:
+        return
+    try:
+        # Steps are only rebuilt in order, so they are collected first
+        # (the window fits in the cache budget) and then put in nearest first
+        steps = [step for step in visualizer.iter_steps(missing[0], missing[-1] + 1)
+                 if step.num not in cache]
+        for step in sorted(steps, key=lambda step: abs(step.num - step_index)):
+            if cache.center != step_index:
+                return
+            cache.put(step)
+    except Exception:
+        # The session may have let go of the trace meanwhile
+        LOG.debug("Prefetch around step %s failed", step_index, exc_info=True)
+
+
+# CELL STYLES
+# Shared by make_visual (full render) and the browser script that applies
+# small per-step updates, so both draw exactly the same boxes
+CELL_STYLE_SWAPPED = "background: #22c55e; color: white; border: 4px solid #15803d; transform: scale(1.2); box-shadow: 0 10px 25px rgba(34,197,94,0.5);"
+CELL_STYLE_COMPARING = "background: #3b82f6; color: white; border: 4px solid #1d4ed8; transform: scale(1.15); box-shadow: 0 8px 20px rgba(59,130,246,0.5);"
+CELL_STYLE_DEFAULT = "background: #f1f5f9; color: #334155; border: 3px solid #cbd5e1; transform: scale(1); box-shadow: 0 4px 6px rgba(0,0,0,0.1);"
+CELL_BOX_STYLE = " width: 70px; height: 70px; display: flex; align-items: center; justify-content: center; border-radius: 15px; font-size: 24px; font-weight: bold; transition: all 0.5s;"
+CELL_ROW_STYLE = "display: flex; justify-content: center; gap: 10px; padding: 30px; flex-wrap: wrap;"
+
+# BAR COLORS
+# Longer arrays are drawn as a bar chart instead of boxes. The bars use the
+# same colors as the boxes, so make_legend explains both
+BAR_COLOR_SWAPPED = "#22c55e"
+BAR_COLOR_COMPARING = "#3b82f6"
+BAR_COLOR_DEFAULT = "#cbd5e1"
+
+# Arrays longer than this are drawn as bars on a canvas
+BOX_RENDER_MAX_LENGTH = 50
+
+# Height of the bar chart, in pixels
+BAR_CHART_HEIGHT = 320
 
 
 def make_visual(arr, cmp, swap):
@@ -211,100 +1434,733 @@ def make_visual(arr, cmp, swap):
         - Light gray: Regular unsorted elements
     """
     # Container div with flexbox for horizontal layout
-    html = '<div style="display: flex; justify-content: center; gap: 10px; padding: 30px; flex-wrap: wrap;">'
+    # The id lets the browser script find the boxes for incremental updates
+    parts = [f'<div id="bubble-array" style="{CELL_ROW_STYLE}">']
     
     # Create a box for each element in the array
     for i, val in enumerate(arr):
         # DETERMINE STYLING based on element's current role
+        # Highlighted boxes are marked data-active so the script can reset them
+        active = ""
         if i in cmp and swap:
             # GREEN: This element was just swapped
             # Scale up slightly to draw attention to the swap
-            style = "background: #22c55e; color: white; border: 4px solid #15803d; transform: scale(1.2); box-shadow: 0 10px 25px rgba(34,197,94,0.5);"
+            style = CELL_STYLE_SWAPPED
+            active = " data-active"
         elif i in cmp:
             # BLUE: This element is being compared (but not swapped)
-            style = "background: #3b82f6; color: white; border: 4px solid #1d4ed8; transform: scale(1.15); box-shadow: 0 8px 20px rgba(59,130,246,0.5);"
+            style = CELL_STYLE_COMPARING
+            active = " data-active"
         else:
             # GRAY: Regular element, not currently involved in any operation
-            style = "background: #f1f5f9; color: #334155; border: 3px solid #cbd5e1; transform: scale(1); box-shadow: 0 4px 6px rgba(0,0,0,0.1);"
+            style = CELL_STYLE_DEFAULT
         
         # Create individual box for this array element
         # CSS transition provides smooth animation when styles change
-        html += f'<div style="{style} width: 70px; height: 70px; display: flex; align-items: center; justify-content: center; border-radius: 15px; font-size: 24px; font-weight: bold; transition: all 0.5s;">{val}</div>'
+        parts.append(f'<div{active} style="{style}{CELL_BOX_STYLE}">{val}</div>')
+    
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+# ============================================================================
+# INCREMENTAL RENDERING
+# ============================================================================
+# The visual box holds an empty placeholder div. Handlers send a small JSON
+# "frame" instead of HTML:
+# - A full frame ({"html": ...}) replaces the whole array display
+# - A bar frame ({"bars": [values], "cmp": [...], "swap": ...}) replaces it
+#   with a bar chart drawn on one <canvas>, for arrays too long for boxes
+# - A diff frame ({"cells": [[index, value], ...], "cmp": [...], "swap": ...,
+#   "base": step}) only rewrites a few boxes, so Next/Prev cost the same for
+#   any array size (or the bars they hold). It only fits on top of step base
+# Full, bar and diff frames also say which step they show ("step").
+# - A trace frame ({"trace": ...}) holds the whole compact trace and starts
+#   a player in the browser, which steps, seeks and plays without calling
+#   the server again
+# APPLY_FRAME_JS runs in the browser and applies each frame to the page.
+
+VISUAL_PLACEHOLDER = '<div id="bubble-frame"></div>'
+
+# Moves of up to this many steps send only the boxes that changed
+DIFF_MAX_STEPS = 64
+
+# Most array values written out in the status line; longer arrays are cut
+# short there (the log and the boxes or bars still show all of them)
+STATUS_ARRAY_MAX_LENGTH = 20
+
+# Page id of the hidden Redraw button, which APPLY_FRAME_JS clicks to get
+# the whole step when a diff frame does not fit the step on screen
+REDRAW_ELEM_ID = "bubble-redraw"
+
+# Play speed choices, in steps per second
+PLAY_SPEED_MIN = 1
+PLAY_SPEED_MAX = 500
+PLAY_SPEED_DEFAULT = 4
+
+APPLY_FRAME_JS = Template("""
+(frame) => {
+    const host = document.getElementById('bubble-frame');
+    if (!host || !frame) return;
+    
+    // Draw the bar chart kept in stage.bars
+    const drawBars = (stage) => {
+        const bars = stage.bars;
+        const canvas = stage.querySelector('canvas');
+        const width = canvas.clientWidth;
+        const height = canvas.clientHeight;
+        const ratio = window.devicePixelRatio || 1;
+        canvas.width = Math.round(width * ratio);
+        canvas.height = Math.round(height * ratio);
+        const ctx = canvas.getContext('2d');
+        ctx.scale(ratio, ratio);
+        
+        // Bars grow up from zero (or down, for negative values)
+        const values = bars.values;
+        const step = width / values.length;
+        const gap = step > 3 ? 1 : 0;
+        const top = Math.max(bars.high, 0);
+        const scale = height / ((top - Math.min(bars.low, 0)) || 1);
+        const bar = (x, w, high, low) => {
+            const y = (top - Math.max(high, 0)) * scale;
+            const h = Math.max((Math.max(high, 0) - Math.min(low, 0)) * scale, 1);
+            ctx.fillRect(x, y, w, h);
+        };
+        
+        ctx.fillStyle = $bar_default;
+        if (step >= 1) {
+            for (let i = 0; i < values.length; i++) {
+                bar(i * step, step - gap, values[i], values[i]);
+            }
+        } else {
+            // More bars than pixels: draw one bar per pixel column, as tall
+            // as the biggest (and as deep as the smallest) value in it
+            const high = new Float64Array(width).fill(-Infinity);
+            const low = new Float64Array(width).fill(Infinity);
+            for (let i = 0; i < values.length; i++) {
+                const x = Math.floor(i * step);
+                if (values[i] > high[x]) high[x] = values[i];
+                if (values[i] < low[x]) low[x] = values[i];
+            }
+            for (let x = 0; x < width; x++) {
+                if (high[x] !== -Infinity) bar(x, 1, high[x], low[x]);
+            }
+        }
+        
+        // Highlighted bars are drawn last, at least 2px wide so they show
+        ctx.fillStyle = bars.swap ? $bar_swapped : $bar_comparing;
+        for (const i of bars.cmp) {
+            bar(i * step, Math.max(step - gap, 2), values[i], values[i]);
+        }
+    };
+    
+    // Build the numbered boxes, exactly like make_visual
+    const boxesHtml = (labels, cmp, swap) => {
+        const parts = ['<div id="bubble-array" style="' + $row_style + '">'];
+        labels.forEach((label, i) => {
+            const active = cmp.includes(i);
+            const style = !active ? $default_style : swap ? $swapped_style : $comparing_style;
+            parts.push('<div' + (active ? ' data-active' : '') + ' style="' + style + $box_style + '">' + label + '</div>');
+        });
+        parts.push('</div>');
+        return parts.join('');
+    };
+    
+    // Show a frame in stage (the element that holds the array display)
+    const apply = (stage, frame) => {
+        // Full frame: replace everything
+        if (frame.html !== undefined) {
+            stage.bars = null;
+            stage.innerHTML = frame.html;
+            return;
+        }
+        
+        // Bar frame: replace everything with a new bar chart
+        if (frame.bars !== undefined) {
+            let low = Infinity, high = -Infinity;
+            for (const value of frame.bars) {
+                if (value < low) low = value;
+                if (value > high) high = value;
+            }
+            stage.innerHTML = '<canvas style="width: 100%; height: ${bar_height}px;"></canvas>';
+            stage.bars = {values: frame.bars, low: low, high: high, cmp: frame.cmp, swap: frame.swap};
+            drawBars(stage);
+            return;
+        }
+        
+        // Diff frame for a bar chart: the values only move around, so the
+        // scale stays the same
+        if (stage.bars) {
+            for (const [i, value] of frame.cells) {
+                stage.bars.values[i] = value;
+            }
+            stage.bars.cmp = frame.cmp;
+            stage.bars.swap = frame.swap;
+            drawBars(stage);
+            return;
+        }
+        
+        const cells = stage.querySelector('#bubble-array').children;
+        
+        // Un-highlight the boxes from the previous step
+        for (const cell of stage.querySelectorAll('[data-active]')) {
+            cell.style.cssText = $default_style + $box_style;
+            cell.removeAttribute('data-active');
+        }
+        
+        // Write the values that may have changed
+        for (const [i, value] of frame.cells) {
+            cells[i].textContent = value;
+        }
+        
+        // Highlight the boxes for this step
+        const style = frame.swap ? $swapped_style : $comparing_style;
+        for (const i of frame.cmp) {
+            cells[i].style.cssText = style + $box_style;
+            cells[i].setAttribute('data-active', '');
+        }
+    };
+    
+    // Trace frame: a player that steps through the whole sort in the
+    // browser. Steps are decoded like decode_step in bubble_sort.py, and
+    // the array is moved from step to step by re-applying the swaps in
+    // between (a swap undoes itself, so this works in both directions).
+    const startPlayer = (trace) => {
+        const labels = trace.labels;
+        const values = labels.map(Number);
+        const n = labels.length;
+        const last = trace.steps - 1;
+        const useBars = n > $box_max;
+        const bits = Uint8Array.from(atob(trace.bits), (ch) => ch.charCodeAt(0));
+        
+        // order[k] is the index (in the initial array) of the value at k
+        const order = Array.from({length: n}, (_, k) => k);
+        let done = 0;    // Comparisons applied to order
+        let shown = -1;  // Step on screen
+        let playing = null;  // Animation frame request while playing
+        
+        const button = 'padding: 6px 14px; border-radius: 8px; border: 1px solid #cbd5e1; background: #f8fafc; cursor: pointer;';
+        host.bars = null;
+        host.innerHTML =
+            '<div data-role="status" style="margin: 8px 0;"></div>' +
+            '<div data-role="stage"></div>' +
+            '<div style="display: flex; gap: 8px; align-items: center; flex-wrap: wrap; margin-top: 8px;">' +
+            '<button data-role="prev" style="' + button + '">⬅ Prev</button>' +
+            '<button data-role="play" style="' + button + '">▶ Play</button>' +
+            '<button data-role="next" style="' + button + '">Next ➡</button>' +
+            '<input data-role="slider" type="range" min="0" max="' + last + '" value="0" style="flex: 1;">' +
+            '<label>Speed <input data-role="speed" type="number" min="$speed_min" max="$speed_max" value="$speed_default" style="width: 5em;"> steps/s</label>' +
+            '</div>';
+        const part = (role) => host.querySelector('[data-role="' + role + '"]');
+        const status = part('status'), stage = part('stage'), slider = part('slider');
+        const prev = part('prev'), play = part('play'), next = part('next'), speed = part('speed');
+        
+        // Pass number and left index of comparison c
+        const locate = (c) => {
+            let lo = 0, hi = trace.passes.length - 1;
+            while (lo < hi) {
+                const mid = (lo + hi + 1) >> 1;
+                if (trace.passes[mid][0] <= c) lo = mid; else hi = mid - 1;
+            }
+            const [first, start, end, forward] = trace.passes[lo];
+            return [lo, forward ? start + c - first : end - 1 - (c - first)];
+        };
+        const swapped = (c) => (bits[c >> 3] >> (c & 7)) & 1;
+        
+        // Kind, pass number and left index of step s
+        const decode = (s) => {
+            if (s === 0) return ['initial', 0, 0];
+            const c = Math.floor((s - 1) / 2);
+            if (c < trace.compares) {
+                const [i, j] = locate(c);
+                if ((s - 1) % 2 === 0) return ['compare', i, j];
+                return [swapped(c) ? 'swap' : 'noswap', i, j];
+            }
+            const passes = trace.passes.length;
+            if (trace.sorted && s === 1 + 2 * trace.compares) return ['sorted', passes - 1, 0];
+            return ['complete', passes, 0];
+        };
+        
+        // Same messages as step_status (long arrays are cut short)
+        const message = (kind, i, j) => {
+            const at = (k) => labels[order[k]];
+            const array = () => order.length <= $status_max
+                ? '[' + order.map((k) => labels[k]).join(', ') + ']'
+                : '[' + order.slice(0, $status_max).map((k) => labels[k]).join(', ') + ', ...] ('
+                  + order.length.toLocaleString('en-US') + ' values)';
+            const pass = 'Pass ' + (i + 1) + ': ';
+            if (kind === 'initial') return 'Initial array: ' + array();
+            if (kind === 'compare') return pass + 'Compare arr[' + j + ']=' + at(j) + ' with arr[' + (j + 1) + ']=' + at(j + 1);
+            if (kind === 'swap') return pass + 'SWAPPED! Now: ' + array();
+            if (kind === 'noswap') return pass + 'No swap';
+            if (kind === 'sorted') return pass + 'Sorted!';
+            return 'COMPLETE: ' + array();
+        };
+        
+        // Move order to step s, collecting the positions that changed
+        const seek = (s, changed) => {
+            const target = Math.min(Math.floor(s / 2), trace.compares);
+            while (done !== target) {
+                const c = done < target ? done++ : --done;
+                if (swapped(c)) {
+                    const j = locate(c)[1];
+                    [order[j], order[j + 1]] = [order[j + 1], order[j]];
+                    if (changed) changed.add(j).add(j + 1);
+                }
+            }
+        };
+        
+        // Show step s: a few steps away only the changed values are
+        // redrawn (like diff_frame), otherwise the whole array
+        const show = (s) => {
+            s = Math.max(0, Math.min(last, s));
+            const small = shown >= 0 && Math.abs(s - shown) <= $diff_max_steps;
+            const changed = small ? new Set() : null;
+            seek(s, changed);
+            
+            const [kind, i, j] = decode(s);
+            const cmp = ['compare', 'swap', 'noswap'].includes(kind) ? [j, j + 1] : [];
+            const swap = kind === 'swap';
+            if (small) {
+                for (const k of cmp) changed.add(k);
+                const value = (k) => useBars ? values[order[k]] : labels[order[k]];
+                apply(stage, {cells: [...changed].map((k) => [k, value(k)]), cmp: cmp, swap: swap});
+            } else if (useBars) {
+                apply(stage, {bars: order.map((k) => values[k]), cmp: cmp, swap: swap});
+            } else {
+                apply(stage, {html: boxesHtml(order.map((k) => labels[k]), cmp, swap)});
+            }
+            
+            shown = s;
+            status.innerHTML = '<b>Step ' + s + ' of ' + last + ':</b> ';
+            status.append(message(kind, i, j));
+            slider.value = s;
+            prev.disabled = s === 0;
+            next.disabled = s === last;
+        };
+        
+        // Autoplay follows the clock, like play in app.py, but runs here
+        const stop = () => {
+            if (playing !== null) cancelAnimationFrame(playing);
+            playing = null;
+            play.textContent = '▶ Play';
+        };
+        const start = () => {
+            if (shown >= last) show(0);
+            const rate = Math.min(Math.max(Number(speed.value) || $speed_default, $speed_min), $speed_max);
+            const from = shown, began = performance.now();
+            const tick = (now) => {
+                show(from + Math.floor((now - began) * rate / 1000));
+                if (shown >= last) stop(); else playing = requestAnimationFrame(tick);
+            };
+            play.textContent = '⏸ Pause';
+            playing = requestAnimationFrame(tick);
+        };
+        
+        prev.onclick = () => { stop(); show(shown - 1); };
+        next.onclick = () => { stop(); show(shown + 1); };
+        slider.oninput = () => { stop(); show(Number(slider.value)); };
+        play.onclick = () => { if (playing === null) start(); else stop(); };
+        speed.onchange = () => { if (playing !== null) { stop(); start(); } };
+        
+        host.player = {stop: stop};
+        show(0);
+    };
+    
+    // A frame older than the one on screen is out of date, so it is dropped
+    // (the server already drops navigations overtaken by a newer one, see
+    // NAVIGATION ORDER, so this only catches responses that cross)
+    if (frame.seq < host.seq) return;
+    host.seq = frame.seq;
+    
+    // A diff only fits on top of the step it was made from. If the page
+    // shows another step, the server is asked for the whole step instead
+    if (frame.cells !== undefined && frame.base !== host.step) {
+        const redraw = document.getElementById('$redraw_id');
+        if (redraw) (redraw.tagName === 'BUTTON' ? redraw : redraw.querySelector('button')).click();
+        return;
+    }
+    host.step = frame.step;
     
-    html += '</div>'
-    return html
+    // A new frame replaces the player, if one is running
+    if (host.player) {
+        host.player.stop();
+        host.player = null;
+    }
+    if (frame.trace !== undefined) {
+        startPlayer(frame.trace);
+    } else {
+        apply(host, frame);
+    }
+}
+""").substitute(
+    default_style=json.dumps(CELL_STYLE_DEFAULT),
+    swapped_style=json.dumps(CELL_STYLE_SWAPPED),
+    comparing_style=json.dumps(CELL_STYLE_COMPARING),
+    box_style=json.dumps(CELL_BOX_STYLE),
+    row_style=json.dumps(CELL_ROW_STYLE),
+    bar_default=json.dumps(BAR_COLOR_DEFAULT),
+    bar_swapped=json.dumps(BAR_COLOR_SWAPPED),
+    bar_comparing=json.dumps(BAR_COLOR_COMPARING),
+    bar_height=BAR_CHART_HEIGHT,
+    box_max=BOX_RENDER_MAX_LENGTH,
+    diff_max_steps=DIFF_MAX_STEPS,
+    speed_min=PLAY_SPEED_MIN,
+    speed_max=PLAY_SPEED_MAX,
+    speed_default=PLAY_SPEED_DEFAULT,
+    redraw_id=REDRAW_ELEM_ID,
+    status_max=STATUS_ARRAY_MAX_LENGTH
+)
+
+# Every frame gets a new sequence number so the browser always sees a change
+# (and can tell which of two frames is newer). Counting starts from the clock,
+# so frames after a restart still count as newer than the ones before it
+_frame_counter = itertools.count(time.time_ns() // 1_000_000)
+
+
+def full_frame(html):
+    """
+    Build a frame that replaces the whole array display.
+    
+    Args:
+        html (str): HTML from make_visual, or "" to clear the display
+        
+    Returns:
+        dict: Frame for the frame_box component
+    """
+    return {'seq': next(_frame_counter), 'html': html}
+
+
+def bars_frame(step):
+    """
+    Build a frame that replaces the array display with a bar chart.
+    
+    The browser draws the bars on a single canvas, so only the numbers
+    themselves are sent, not one styled HTML box per number.
+    
+    Args:
+        step (Step): Step information from get_step
+        
+    Returns:
+        dict: Frame for the frame_box component
+    """
+    return {
+        'seq': next(_frame_counter),
+        'step': step['num'],
+        'bars': step['arr'],
+        'cmp': step['cmp'],
+        'swap': step['swap']
+    }
+
+
+def step_frame(step):
+    """
+    Build a frame that shows a whole step, picking the renderer by size.
+    
+    Short arrays get the numbered boxes from make_visual. Longer ones get
+    a bar chart, which stays fast for 10^4 - 10^5 numbers.
+    
+    Args:
+        step (Step): Step information from get_step
+        
+    Returns:
+        dict: Frame for the frame_box component
+    """
+    if len(step['arr']) > BOX_RENDER_MAX_LENGTH:
+        return bars_frame(step)
+    frame = full_frame(make_visual(step['arr'], step['cmp'], step['swap']))
+    frame['step'] = step['num']
+    return frame
+
+
+def diff_frame(step, cells, base):
+    """
+    Build a frame that only updates a few boxes.
+    
+    Args:
+        step (Step): Step information from get_step
+        cells (iterable): Indices whose values may have changed
+        base (int): Step the page must show for the frame to fit on top
+        
+    Returns:
+        dict: Frame for the frame_box component
+    """
+    return {
+        'seq': next(_frame_counter),
+        'step': step['num'],
+        'base': base,
+        'cells': [[i, step['arr'][i]] for i in sorted(set(cells))],
+        'cmp': step['cmp'],
+        'swap': step['swap']
+    }
+
+
+def trace_frame(visualizer):
+    """
+    Build a frame that hands the whole trace to the browser player.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): Visualizer with a finished trace
+        
+    Returns:
+        dict: Frame for the frame_box component
+    """
+    return {'seq': next(_frame_counter), 'trace': visualizer.compact_trace()}
+
+
+# NAVIGATION ORDER
+# Next, Prev, the slider, Play and Redraw are separate events, so two of them
+# can overlap and finish out of order (say a slow slider seek that finishes
+# after a later Next). Every navigation takes a ticket when it starts, and a
+# result with an older ticket than the one last sent to the session is
+# dropped whole: it moves neither the page nor step_index. Diff frames are
+# made against the step the session was last sent, and name it as their
+# base, so the browser can check that a diff fits before applying it.
+
+# Per session hash: (ticket, weak reference to the visualizer shown or None,
+# step shown or None) of the last frame sent
+NAVIGATIONS = {}
+NAVIGATIONS_LOCK = threading.Lock()
+_navigation_tickets = itertools.count(1)
+
+
+def navigation_ticket():
+    """
+    Take the ticket that orders a navigation (or a Start or Reset) against
+    the others.
+    
+    Returns:
+        int: A ticket higher than every one handed out before
+    """
+    return next(_navigation_tickets)
+
+
+def navigation_frame(request, ticket, visualizer, step, full=False):
+    """
+    Build the frame that moves a session's page to a step, unless a newer
+    navigation has been sent already.
+    
+    Args:
+        request (gr.Request): The navigation's request, or None
+        ticket (int): Ticket the navigation took when it started
+        visualizer (BubbleSortVisualizer): The session's visualizer
+        step (Step): Step to show
+        full (bool): Send the whole step, even if a diff would do
+    
+    Returns:
+        dict: Frame for the frame_box component, or None if out of date
+    """
+    session = getattr(request, "session_hash", None)
+    with NAVIGATIONS_LOCK:
+        shown = NAVIGATIONS.get(session)
+        if shown is not None and ticket < shown[0]:
+            return None
+        base = None
+        if shown is not None and shown[1] is not None and shown[1]() is visualizer:
+            base = shown[2]
+        
+        if full or base is None or abs(step['num'] - base) > DIFF_MAX_STEPS:
+            frame = step_frame(step)
+        else:
+            # Between two steps only the boxes compared by the steps in
+            # between (both ends included) can change, so those are the
+            # only values sent
+            changed = []
+            for k in range(min(step['num'], base), max(step['num'], base) + 1):
+                changed += visualizer.compared_pair(k)
+            frame = diff_frame(step, changed, base)
+        NAVIGATIONS[session] = (ticket, weakref.ref(visualizer), step['num'])
+    return frame
+
+
+def page_replaced(request, visualizer, frame):
+    """
+    Record a frame from Start, Reset or a shared trace link, so that
+    navigations started before it are dropped.
+    
+    Args:
+        request (gr.Request): The request, or None
+        visualizer (BubbleSortVisualizer): The session's new visualizer, or None
+        frame (dict): The frame sent with it
+    """
+    session = getattr(request, "session_hash", None)
+    with NAVIGATIONS_LOCK:
+        # Numbered again, so the page also treats it as newer than any
+        # navigation sent while it was being built
+        frame['seq'] = next(_frame_counter)
+        NAVIGATIONS[session] = (navigation_ticket(),
+                                None if visualizer is None else weakref.ref(visualizer),
+                                frame.get('step'))
 
 
 def make_legend():
     """
-    Create a color legend to explain the visualization.
+    Create a color legend to explain the visualization.
+    
+    Returns:
+        str: HTML string showing what each color means
+    """
+    return '''<div style="display: flex; justify-content: center; gap: 30px; margin: 20px;">
+        <div style="display: flex; align-items: center; gap: 10px;">
+            <div style="width: 40px; height: 40px; background: #3b82f6; border: 3px solid #1d4ed8; border-radius: 10px;"></div>
+            <span style="font-weight: bold;">Comparing</span>
+        </div>
+        <div style="display: flex; align-items: center; gap: 10px;">
+            <div style="width: 40px; height: 40px; background: #22c55e; border: 3px solid #15803d; border-radius: 10px;"></div>
+            <span style="font-weight: bold;">Swapped</span>
+        </div>
+        <div style="display: flex; align-items: center; gap: 10px;">
+            <div style="width: 40px; height: 40px; background: #f1f5f9; border: 3px solid #cbd5e1; border-radius: 10px;"></div>
+            <span style="font-weight: bold;">Unsorted</span>
+        </div>
+    </div>'''
+
+
+# Pasted text at least this long is parsed by parse_bulk instead
+BULK_TEXT_MIN_CHARS = 10_000
+
+# Files that can be uploaded instead of typing the numbers
+UPLOAD_FILE_TYPES = [".csv", ".txt", ".npy"]
+
+
+def read_numbers(input_text, upload=None):
+    """
+    Get the numbers from an uploaded file or the textbox.
+    
+    An uploaded file wins over the textbox. Long pasted text goes through
+    parse_bulk, short text through parse_input as before (both split the
+    numbers at commas and whitespace).
+    
+    Args:
+        input_text (str): User's input from the textbox
+        upload (str): Path of the uploaded file, or None
+        
+    Returns:
+        tuple: (numbers, error message)
+    """
+    if upload:
+        return load_numbers_file(upload)
+    if input_text and len(input_text) >= BULK_TEXT_MIN_CHARS:
+        return parse_bulk(input_text)
+    return parse_input(input_text)
+
+
+def step_status(step, visualizer):
+    """
+    Format the status line for a step.
+    
+    The total comes from the closed-form statistics, so it is exact even
+    while a lazy sort is still running.
+    
+    Args:
+        step (Step): Step information from get_step
+        visualizer (BubbleSortVisualizer): The session's visualizer
+        
+    Returns:
+        str: Markdown status message
+    """
+    total = visualizer.get_stats()['steps'] - 1
+    return f"**Step {step['num']} of {total}:** {step.describe(STATUS_ARRAY_MAX_LENGTH)}"
+
+
+def slider_maximum(visualizer):
+    """
+    Get the largest value for the step slider.
+    
+    Returns:
+        int: Index of the last step
+    """
+    return visualizer.get_stats()['steps'] - 1
+
+
+def format_stats(stats):
+    """
+    Format bubble sort statistics for display.
+    
+    Args:
+        stats (dict): Result of bubble_sort_stats
+        
+    Returns:
+        str: Markdown summary line
+    """
+    text = (f"**{stats['n']} numbers:** {stats['passes']} passes, "
+            f"{stats['comparisons']} comparisons, {stats['swaps']} swaps, "
+            f"{stats['steps']} steps")
+    
+    # Variants also report what they saved over classic bubble sort
+    if 'saved' in stats:
+        text += f" ({stats['saved']} comparisons fewer than classic)"
+    return text
+
+
+@instrumented
+def show_stats(input_text, upload=None, variant="classic"):
+    """
+    Handle the Stats Only button click.
+    
+    Shows how much work bubble sort would do for the input without
+    generating any steps, so it works instantly even for huge inputs.
     
+    Args:
+        input_text (str): User's input from the textbox
+        upload (str): Path of an uploaded numbers file, or None
+        variant (str): Bubble sort variant, one of VARIANTS
+        
     Returns:
-        str: HTML string showing what each color means
+        str: Markdown summary, or the input error message
     """
-    return '''<div style="display: flex; justify-content: center; gap: 30px; margin: 20px;">
-        <div style="display: flex; align-items: center; gap: 10px;">
-            <div style="width: 40px; height: 40px; background: #3b82f6; border: 3px solid #1d4ed8; border-radius: 10px;"></div>
-            <span style="font-weight: bold;">Comparing</span>
-        </div>
-        <div style="display: flex; align-items: center; gap: 10px;">
-            <div style="width: 40px; height: 40px; background: #22c55e; border: 3px solid #15803d; border-radius: 10px;"></div>
-            <span style="font-weight: bold;">Swapped</span>
-        </div>
-        <div style="display: flex; align-items: center; gap: 10px;">
-            <div style="width: 40px; height: 40px; background: #f1f5f9; border: 3px solid #cbd5e1; border-radius: 10px;"></div>
-            <span style="font-weight: bold;">Unsorted</span>
-        </div>
-    </div>'''
+    nums, error = read_numbers(input_text, upload)
+    if error:
+        return error
+    try:
+        return format_stats(count_stats(nums, variant))
+    except SortStopped:
+        return too_slow_message(variant)
 
 
-def parse_input(text):
+def count_stats(nums, variant="classic", cancel=None):
     """
-    Parse and validate user input from the text box.
+    Count the statistics of a sort within REQUEST_SECONDS.
     
-    This function handles the INPUT phase of the algorithm:
-    - Accepts comma-separated numbers
-    - Validates each entry is a valid number
-    - Handles errors gracefully with clear messages
+    The classic variant is counted instantly; the others run their passes,
+    so on big inputs they are counted by a worker process.
     
     Args:
-        text (str): Raw input string from user
+        nums (list or ndarray): Parsed numbers
+        variant (str): Bubble sort variant, one of VARIANTS
+        cancel (threading.Event): Stops counting when set, or None
         
     Returns:
-        tuple: (list of numbers, error message)
-               Returns (list, None) if successful
-               Returns (None, error_string) if validation fails
-    """
-    # Check for empty input
-    if not text or not text.strip():
-        return None, "Error: Enter numbers"
-    
-    nums = []
-    # Split by comma and process each part
-    for part in text.split(','):
-        part = part.strip()  # Remove leading/trailing whitespace
-        if not part:
-            continue  # Skip empty entries (e.g., from trailing commas)
+        dict: The statistics (see bubble_sort_stats)
         
+    Raises:
+        SortStopped: If counting was cancelled or ran out of time
+    """
+    if variant != "classic" and max_steps(len(nums)) >= HEAVY_MIN_WORK:
         try:
-            # Try to convert to number (float first to handle decimals)
-            n = float(part)
-            # Convert to int if it's a whole number for cleaner display
-            if n.is_integer():
-                n = int(n)
-            nums.append(n)
-        except:
-            # Catch any conversion errors and return descriptive message
-            return None, f"Error: '{part}' not a number"
-    
-    # Ensure we got at least one valid number
-    if not nums:
-        return None, "Error: No numbers found"
+            return run_heavy(cancel, stats_job, nums, variant, REQUEST_SECONDS)
+        except WorkerFailed:
+            # Counted here instead, within the same time limit
+            LOG.warning("Counting in the handler instead", exc_info=True)
+    return bubble_sort_stats(nums, variant, budget(cancel=cancel))
+
+
+def too_slow_message(variant):
+    """
+    Explain that a variant's statistics could not be counted in time.
     
-    return nums, None
+    Args:
+        variant (str): Bubble sort variant, one of VARIANTS
+        
+    Returns:
+        str: Error message
+    """
+    return f"Error: Counting the {VARIANT_LABELS[variant]} passes takes too long for this input (Classic is counted instantly)"
 
 
-def start_sorting(input_text):
+@instrumented
+def start_sorting(input_text, visualizer, upload=None, variant="classic", in_browser=False,
+                  request: "gr.Request" = None):
     """
     Handle the Start button click event.
     
@@ -314,90 +2170,327 @@ def start_sorting(input_text):
     3. Display the initial state
     4. Enable navigation controls
     
+    In browser mode the whole trace is sent once, and the player in the
+    page does all stepping and playing, so the server is only called again
+    for Start and Reset. Inputs over BROWSER_STEP_LIMIT steps stay on the
+    server.
+    
+    Sorting is limited by the COMPUTE BUDGETS: a sort that cannot finish in
+    time is produced step by step instead, one with more than
+    MAX_TRACE_STEPS steps only gets its statistics, and Reset or another
+    Start in the same session stop this one.
+    
     Args:
         input_text (str): User's input from the textbox
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        upload (str): Path of an uploaded numbers file, or None
+        variant (str): Bubble sort variant, one of VARIANTS
+        in_browser (bool): Step through the sort in the browser
+        request (gr.Request): The Start request (filled in by Gradio)
         
     Returns:
-        tuple: Updates for all UI components (10 values)
+        tuple: Session visualizer followed by updates for all UI components
     """
-    # STEP 1: Validate input
-    nums, error = parse_input(input_text)
+    # STEP 1: Validate input (an uploaded file is used instead of the text)
+    nums, error = read_numbers(input_text, upload)
     
     if error:
         # If validation failed, show error and hide controls
-        return (
-            0,  # step_index
-            error,  # status message
-            "",  # visual (empty)
-            "",  # legend (empty)
-            gr.update(visible=False),  # slider (hidden)
-            gr.update(visible=False),  # prev button (hidden)
-            gr.update(visible=False),  # next button (hidden)
-            gr.update(visible=False),  # show all button (hidden)
-            gr.update(visible=False)   # reset button (hidden)
-        )
+        outputs = error_outputs(visualizer, error)
+    else:
+        # This Start replaces (and stops) the session's Start still running
+        cancel = begin_start(request)
+        try:
+            outputs = sort_and_show(nums, visualizer, variant, in_browser, cancel)
+        except SortStopped:
+            # Reset or a newer Start took over; leave the page to them
+            return (visualizer,) + (gr.update(),) * 11
+        finally:
+            finish_start(request, cancel)
+    
+    # Navigations started before this Start are out of date now
+    page_replaced(request, outputs[0], outputs[4])
+    return outputs
+
+
+def sort_and_show(nums, visualizer, variant, in_browser, cancel):
+    """
+    Generate the steps for Start (within the compute budgets) and show them.
+    
+    Args:
+        nums (list or ndarray): Parsed numbers
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        variant (str): Bubble sort variant, one of VARIANTS
+        in_browser (bool): Step through the sort in the browser
+        cancel (threading.Event): Set when this Start should give up
+        
+    Returns:
+        tuple: Session visualizer followed by updates for all UI components
+        
+    Raises:
+        SortStopped: If cancel was set
+    """
+    # STEP 2: Count the work first (instant, except for the variants)
+    try:
+        stats = count_stats(nums, variant, cancel)
+    except SortStopped:
+        if cancel.is_set():
+            raise
+        return error_outputs(visualizer, too_slow_message(variant))
+    
+    # STEP 3: Generate the sorting steps
+    # Small inputs are sorted right away. Large inputs are sorted lazily,
+    # so the first step shows instantly and later steps are produced on demand
+    # Finished traces are shared through TRACE_CACHE, so Start on an input
+    # that was sorted before (like the examples) reuses that trace
+    # Big sorts are tried in a worker process first (see cached_trace): a
+    # lazy sort runs in this process, so only what the worker cannot finish
+    # within REQUEST_SECONDS is left to be produced as the steps are viewed
+    note = ""
+    can_step = stats['steps'] <= MAX_TRACE_STEPS
+    in_browser = in_browser and can_step and max_steps(len(nums)) <= BROWSER_STEP_LIMIT
+    big = max_steps(len(nums)) >= HEAVY_MIN_WORK
+    lazy = (max_steps(len(nums)) > EAGER_STEP_LIMIT and not in_browser and not big) or not can_step
+    if not lazy:
+        try:
+            new_visualizer = cached_trace(nums, variant, stats, cancel, REQUEST_SECONDS)
+        except SortStopped:
+            if cancel.is_set():
+                raise
+            # Too slow to sort in one go: produce the steps as they are viewed
+            lazy, in_browser = True, False
+            note = " *(this sort takes a while, so its steps are worked out as you go)*"
+    if lazy:
+        # Over MAX_TRACE_STEPS only the first step is ever produced
+        new_visualizer = BubbleSortVisualizer()
+        build_trace(new_visualizer, nums, lazy=True, variant=variant)
+        new_visualizer.stats = stats
+    if not can_step:
+        note = f" *(more than {MAX_TRACE_STEPS:,} steps, so only the statistics are shown)*"
     
-    # STEP 2: Generate all sorting steps
-    # This runs the complete bubble sort algorithm and stores every step
-    visualizer.generate_steps(nums)
+    # The session's old trace is not needed (if Start picked the same cached
+    # trace again, cached_trace held it once more, so one hold is let go)
+    if new_visualizer is not visualizer or visualizer.shared:
+        release_visualizer(visualizer)
     
+    # STEP 4 and 5: Display the first step and show the controls
+    return first_step_outputs(new_visualizer, in_browser, can_step, note)
+
+
+def error_outputs(visualizer, error):
+    """
+    Build the Start outputs for an input (or trace) that cannot be shown.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        error (str): Message for the status box
+        
+    Returns:
+        tuple: Session visualizer followed by updates for all UI components
+    """
+    return (
+        visualizer,  # Keep the session state unchanged
+        0,  # step_index
+        error,  # status message
+        "",  # stats (empty)
+        full_frame(""),  # visual (empty)
+        "",  # legend (empty)
+        gr.update(visible=False),  # slider (hidden)
+        gr.update(visible=False),  # prev button (hidden)
+        gr.update(visible=False),  # next button (hidden)
+        gr.update(visible=False),  # show all button (hidden)
+        gr.update(visible=False),  # reset button (hidden)
+        gr.update(visible=False)   # play controls (hidden)
+    )
+
+
+def first_step_outputs(visualizer, in_browser, can_step=True, note=""):
+    """
+    Build the Start outputs that show a new trace from its first step.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The session's new visualizer
+        in_browser (bool): Hand the whole trace to the browser player
+        can_step (bool): False to show only the first step and the
+                         statistics, without any step controls
+        note (str): Markdown added to the status message
+        
+    Returns:
+        tuple: Session visualizer followed by updates for all UI components
+    """
     # STEP 3: Display the first step (initial unsorted array)
+    # In browser mode the player shows it, with its own controls
     step = visualizer.get_step(0)
-    visual = make_visual(step['arr'], step['cmp'], step['swap'])
     legend = make_legend()
-    status = f"**Step {step['num']} of {visualizer.total_steps()-1}:** {step['msg']}"
+    if in_browser:
+        visual = trace_frame(visualizer)
+        status = "Use the controls under the array to step through the sort"
+    else:
+        visual = step_frame(step)
+        status = step_status(step, visualizer) + note
+    server_steps = can_step and not in_browser
     
     # STEP 4: Return updates for all UI components
     return (
+        visualizer,  # Store the trace in this session's state
         0,  # Set step_index to 0 (start at beginning)
         status,  # Update status message
+        format_stats(visualizer.get_stats()) + share_note(visualizer),  # Show pass/comparison/swap totals
         visual,  # Update visual display
         legend,  # Show color legend
-        gr.update(visible=True, minimum=0, maximum=visualizer.total_steps()-1, value=0),  # Show slider
-        gr.update(visible=True, interactive=False),  # Show prev button (disabled at start)
-        gr.update(visible=True, interactive=True),   # Show next button (enabled)
-        gr.update(visible=True),  # Show "all steps" button
-        gr.update(visible=True)   # Show reset button
+        # The server's step controls are only needed without the player
+        gr.update(visible=server_steps, minimum=0, maximum=slider_maximum(visualizer), value=0),  # Show slider
+        gr.update(visible=server_steps, interactive=False),  # Show prev button (disabled at start)
+        gr.update(visible=server_steps, interactive=True),   # Show next button (enabled)
+        gr.update(visible=can_step),  # Show "all steps" button
+        gr.update(visible=True),  # Show reset button
+        gr.update(visible=server_steps)   # Show play controls
     )
 
 
-def show_step(step_idx):
+def share_note(visualizer):
+    """
+    Explain how to open a trace again, if it is kept in a trace file.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The session's visualizer
+        
+    Returns:
+        str: Markdown to add under the statistics, or ""
+    """
+    if visualizer.trace_file is None:
+        return ""
+    key = os.path.splitext(os.path.basename(visualizer.trace_file))[0]
+    return f"\n\n🔗 Open this sort again by adding `?trace={key}` to the page address"
+
+
+@instrumented
+def open_shared_trace(visualizer, in_browser, request: "gr.Request"):
+    """
+    Open the trace named in the page address (?trace=<id>) when the page loads.
+    
+    The trace is read from its trace file, so nothing is sorted again.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        in_browser (bool): Hand the whole trace to the browser player
+        request (gr.Request): The page request, with the address parameters
+        
+    Returns:
+        tuple: Session visualizer followed by updates for all UI components
+    """
+    key = request.query_params.get("trace") if request is not None else None
+    if not key:
+        return (visualizer,) + (gr.update(),) * 11  # A normal visit: no changes
+    
+    # Trace IDs are SHA-256 hex digests; anything else is never a file name
+    trace = None
+    if len(key) == 64 and all(ch in "0123456789abcdef" for ch in key):
+        trace = TRACE_CACHE.get(key, hold=True) or open_stored_trace(key)
+    if trace is None:
+        outputs = error_outputs(visualizer, f"Error: Trace {key} not found (old traces are deleted to save space)")
+    else:
+        if not trace.shared:
+            TRACE_CACHE.put(key, trace, hold=True)
+        release_visualizer(visualizer)
+        outputs = first_step_outputs(trace, in_browser and trace.total_steps() <= BROWSER_STEP_LIMIT)
+    page_replaced(request, outputs[0], outputs[4])
+    return outputs
+
+
+def show_step(step_idx, visualizer, request=None, ticket=None, full=False):
     """
     Display a specific step in the sorting process.
     
     This function is called when:
     - The slider is moved
     - The next/previous buttons are clicked
+    - Play moves on to the next frame
+    - The page asks for the whole step again (Redraw)
+    
+    Moving a few steps (up to DIFF_MAX_STEPS) from the step last sent only
+    sends the boxes that changed. Any bigger move sends the whole array.
     
     Args:
         step_idx (int): Index of the step to display
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        request (gr.Request): The navigation's request, or None
+        ticket (int): Ticket the navigation took when it started (see
+                      NAVIGATION ORDER), or None to take one now
+        full (bool): Send the whole step, even if a diff would do
         
     Returns:
-        tuple: (status message, visual HTML, prev button state, next button state)
+        tuple: (status message, visual frame, prev button state, next button state),
+               or None if a newer navigation was sent already
     """
+    if ticket is None:
+        ticket = navigation_ticket()
     step_idx = int(step_idx)  # Ensure it's an integer
     
     # Validate step index
-    if step_idx < 0 or step_idx >= visualizer.total_steps():
-        return "Invalid step", "", gr.update(interactive=False), gr.update(interactive=False)
+    if visualizer is None or step_idx < 0 or not visualizer.total_steps():
+        return "Invalid step", full_frame(""), gr.update(interactive=False), gr.update(interactive=False)
+    
+    # A step past the end (e.g. a stale slider value) shows the final step,
+    # and a step the budget could not reach shows the furthest one so far
+    note = ""
+    if not visualizer.produce_until(step_idx, budget(visualizer)):
+        step_idx = visualizer.total_steps() - 1
+        if not visualizer.is_complete():
+            note = limit_note(visualizer)
     
-    # Get the step data
-    step = visualizer.get_step(step_idx)
+    # Get the step data (usually prepared by the previous call's prefetch)
+    step = cached_step(visualizer, step_idx)
     
-    # Generate visual representation
-    visual = make_visual(step['arr'], step['cmp'], step['swap'])
+    # Generate visual representation (nothing, if it is out of date)
+    visual = navigation_frame(request, ticket, visualizer, step, full)
+    if visual is None:
+        return None
     
     # Create status message showing current position
-    status = f"**Step {step['num']} of {visualizer.total_steps()-1}:** {step['msg']}"
+    status = step_status(step, visualizer) + note
     
     # Enable/disable navigation buttons based on position
     prev_enabled = step_idx > 0  # Can go back if not at start
-    next_enabled = step_idx < visualizer.total_steps() - 1  # Can go forward if not at end
+    # Can go forward if not at end (a lazy sort may still have more steps)
+    next_enabled = step_idx + 1 < visualizer.total_steps() or not visualizer.is_complete()
+    
+    # Get the neighbouring steps ready for the next move
+    prefetch_steps(visualizer, step_idx)
     
     return status, visual, gr.update(interactive=prev_enabled), gr.update(interactive=next_enabled)
 
 
-def next_clicked(current_idx):
+@instrumented
+def slider_moved(step_idx, visualizer, request: "gr.Request" = None):
+    """
+    Handle the slider being moved.
+    
+    Besides showing the step, this keeps the step_index State in sync,
+    so Next/Prev continue from the step the slider chose.
+    
+    Args:
+        step_idx (int): Slider value
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        request (gr.Request): The slider request (filled in by Gradio)
+        
+    Returns:
+        tuple: (shown index, status, visual, prev button state, next button state)
+    """
+    shown = show_step(step_idx, visualizer, request)
+    if shown is None:
+        return (gr.update(),) * 5  # A newer navigation is on screen already
+    
+    # show_step falls back to the last step if the slider went past the end
+    shown_idx = int(step_idx)
+    if visualizer is not None and visualizer.total_steps():
+        shown_idx = max(min(shown_idx, visualizer.total_steps() - 1), 0)
+    
+    return (shown_idx,) + shown
+
+
+@instrumented
+def next_clicked(current_idx, visualizer, request: "gr.Request" = None):
     """
     Handle the Next button click.
     
@@ -406,29 +2499,37 @@ def next_clicked(current_idx):
     
     Args:
         current_idx (int): Current step index
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        request (gr.Request): The click request (filled in by Gradio)
         
     Returns:
         tuple: (new index, status, visual, prev button state, next button state)
     """
+    ticket = navigation_ticket()
+    
     # Calculate the next step index
     new_idx = int(current_idx) + 1
     
-    # Don't go past the last step
-    if new_idx >= visualizer.total_steps():
-        new_idx = visualizer.total_steps() - 1
+    # Don't go past the last step (a lazy sort produces it first if needed)
+    if visualizer is None or not visualizer.produce_until(new_idx, budget(visualizer)):
+        total = visualizer.total_steps() if visualizer is not None else 0
+        new_idx = max(total - 1, 0)
     
-    # Debug output to console (helpful for troubleshooting)
-    print(f"Next: {current_idx} -> {new_idx}")
+    # Debug output (set BUBBLE_SORT_LOG_LEVEL=DEBUG to see it)
+    LOG.debug("Next: %s -> %s", current_idx, new_idx)
     
     # Get display updates for the new step
-    status, visual, prev_btn, next_btn = show_step(new_idx)
+    shown = show_step(new_idx, visualizer, request, ticket)
+    if shown is None:
+        return (gr.update(),) * 5  # A newer navigation is on screen already
     
     # Return new index along with display updates
     # The new_idx updates the step_index State, triggering proper synchronization
-    return new_idx, status, visual, prev_btn, next_btn
+    return (new_idx,) + shown
 
 
-def prev_clicked(current_idx):
+@instrumented
+def prev_clicked(current_idx, visualizer, request: "gr.Request" = None):
     """
     Handle the Previous button click.
     
@@ -436,10 +2537,14 @@ def prev_clicked(current_idx):
     
     Args:
         current_idx (int): Current step index
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        request (gr.Request): The click request (filled in by Gradio)
         
     Returns:
         tuple: (new index, status, visual, prev button state, next button state)
     """
+    ticket = navigation_ticket()
+    
     # Calculate the previous step index
     new_idx = int(current_idx) - 1
     
@@ -448,73 +2553,358 @@ def prev_clicked(current_idx):
         new_idx = 0
     
     # Debug output
-    print(f"Prev: {current_idx} -> {new_idx}")
+    LOG.debug("Prev: %s -> %s", current_idx, new_idx)
     
     # Get display updates for the new step
-    status, visual, prev_btn, next_btn = show_step(new_idx)
+    shown = show_step(new_idx, visualizer, request, ticket)
+    if shown is None:
+        return (gr.update(),) * 5  # A newer navigation is on screen already
+    
+    return (new_idx,) + shown
+
+
+@instrumented
+def redraw(current_idx, visualizer, request: "gr.Request" = None):
+    """
+    Handle the page asking for the whole step on screen again.
+    
+    APPLY_FRAME_JS clicks the hidden Redraw button when a diff frame does
+    not fit the step the page shows, so the page and step_index agree again.
+    
+    Args:
+        current_idx (int): Current step index
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        request (gr.Request): The Redraw request (filled in by Gradio)
+    
+    Returns:
+        tuple: (status, visual, prev button state, next button state)
+    """
+    shown = show_step(current_idx, visualizer, request, full=True)
+    return shown if shown is not None else (gr.update(),) * 4
+
+
+# Most frames Play sends per second; faster speeds skip steps instead
+PLAY_MAX_FPS = 20
+
+# Plays running at the same time (more wait in the queue). Play sleeps
+# between frames on one of Gradio's worker threads (40 by default, shared
+# by every event), so it gets a lane of its own: at most this many threads
+# are ever asleep in Play, and the rest stay free for Next, the slider and
+# Start
+PLAY_CONCURRENCY_LIMIT = int(os.environ.get("BUBBLE_SORT_PLAY_CONCURRENCY_LIMIT", 8))
+
+
+@instrumented
+def play(current_idx, visualizer, speed, request: "gr.Request" = None):
+    """
+    Handle the Play button: step through the sort on the server.
+    
+    This is a generator, so Gradio streams every yielded frame to the
+    browser over the one Play request instead of one request per step.
+    
+    The step on screen follows the clock (speed steps per second after
+    Play was pressed). If sending frames falls behind the clock, or the
+    speed is more than PLAY_MAX_FPS frames per second, the frames in
+    between are skipped and the next frame jumps straight to the step that
+    is due, so playback never lags behind. Pause, Reset and Start cancel
+    the generator, and so does any other navigation (Next, Prev, the
+    slider): once it is on screen, Play stops.
+    
+    Args:
+        current_idx (int): Current step index
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        speed (float): Steps per second
+        request (gr.Request): The Play request (filled in by Gradio)
+        
+    Yields:
+        tuple: (new index, status, visual, prev button state, next button state)
+    """
+    if visualizer is None or not visualizer.total_steps():
+        return
+    
+    speed = min(max(float(speed or PLAY_SPEED_DEFAULT), PLAY_SPEED_MIN), PLAY_SPEED_MAX)
+    frame_interval = max(1 / speed, 1 / PLAY_MAX_FPS)
+    
+    shown_idx = int(current_idx)
+    
+    # All frames of one Play share its ticket, so any later navigation
+    # overtakes them
+    ticket = navigation_ticket()
     
-    return new_idx, status, visual, prev_btn, next_btn
+    # Playing from the last step starts over from the beginning
+    if visualizer.is_complete() and shown_idx >= visualizer.total_steps() - 1:
+        shown_idx = 0
+        shown = show_step(0, visualizer, request, ticket)
+        if shown is None:
+            return
+        yield (0,) + shown
+    
+    start_idx = shown_idx
+    start_time = time.monotonic()
+    next_frame = start_time
+    while True:
+        # Wait for the next frame slot (slots missed while busy are dropped)
+        next_frame = max(next_frame + frame_interval, time.monotonic())
+        time.sleep(max(next_frame - time.monotonic(), 0))
+        
+        # The step due now (a lazy sort produces it first if needed)
+        due_idx = start_idx + int((time.monotonic() - start_time) * speed)
+        stuck = False
+        if not visualizer.produce_until(due_idx, budget(visualizer)):
+            due_idx = visualizer.total_steps() - 1
+            stuck = not visualizer.is_complete()  # Over a compute budget
+        
+        if due_idx != shown_idx or stuck:
+            shown = show_step(due_idx, visualizer, request, ticket)
+            if shown is None:
+                return  # Another navigation took over
+            yield (due_idx,) + shown
+            shown_idx = due_idx
+        
+        # Stop after the final step, or where the budget stopped the sort
+        if stuck or visualizer.is_complete() and shown_idx >= visualizer.total_steps() - 1:
+            return
+
+
+@instrumented
+def show_all(visualizer, first_step=0):
+    """
+    Handle the All Steps button: show the log page at first_step.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        first_step (int): First step shown on the page
+    
+    Returns:
+        str: Formatted text with one page of steps
+    """
+    return log_page(visualizer, first_step)
 
 
-def show_all():
+def log_page(visualizer, first_step=0):
     """
-    Display all sorting steps in text format.
+    Display one page of sorting steps in text format.
     
-    This provides a complete log of the entire sorting process,
-    useful for:
+    This provides a log of the sorting process, useful for:
     - Understanding the full algorithm flow
     - Verifying correctness
     - Documenting the sorting process
     
+    Only one page of steps is formatted at a time (see log_page_steps), so
+    the page costs the same no matter how long the whole trace is, and
+    holds about LOG_PAGE_VALUES numbers at most however long the array is.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        first_step (int): First step shown on the page
+    
     Returns:
-        str: Formatted text with all steps
+        str: Formatted text with one page of steps
     """
     # Check if sorting has been performed
-    if not visualizer.steps:
+    if visualizer is None or not visualizer.total_steps():
         return "No sorting in progress"
     
-    # Build formatted output
-    output = "=" * 80 + "\n"
-    output += "COMPLETE BUBBLE SORT PROCESS\n"
-    output += "=" * 80 + "\n\n"
+    first_step = max(int(first_step or 0), 0)
+    page = log_page_steps(visualizer)
+    text = None
+    if (visualizer.trace_file is not None
+            and len(visualizer.initial) * page >= HEAVY_MIN_WORK):
+        # A page of long arrays: a worker process formats it from the trace file
+        stop = min(first_step + page, visualizer.total_steps())
+        count = max(stop - first_step, 0)
+        try:
+            text = run_heavy(None, log_page_job, visualizer.trace_file, first_step, stop) if count else ""
+        except WorkerFailed:
+            # Formatted here instead (below)
+            LOG.warning("Formatting the log page in the handler instead", exc_info=True)
+    if text is None:
+        entries = [format_log_entry(step) for step in
+                   visualizer.iter_steps(first_step, first_step + page, budget(visualizer))]
+        count, text = len(entries), "".join(entries)
+    if not count:
+        return "No steps on this page"
+    
+    # Header says which part of the trace this page covers
+    total = visualizer.get_stats()['steps'] - 1
+    last_step = first_step + count - 1
+    header = ("=" * 80 + "\n"
+              + "COMPLETE BUBBLE SORT PROCESS\n"
+              + f"Steps {first_step} to {last_step} of {total}\n"
+              + "=" * 80 + "\n\n")
+    
+    return header + text
+
+
+@instrumented
+def log_earlier(first_step, visualizer):
+    """
+    Show the previous page of the log.
     
-    # Iterate through all steps and format each one
-    for step in visualizer.steps:
-        output += f"STEP {step['num']}: {step['msg']}\n"
-        output += f"Array: {step['arr']}\n"
+    Args:
+        first_step (int): First step of the page shown now
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
         
-        # Show comparison details if applicable
-        if step['cmp']:
-            output += f"Comparing: {step['cmp']}\n"
+    Returns:
+        tuple: (new first step, log text)
+    """
+    first_step = max(int(first_step or 0) - log_page_steps(visualizer), 0)
+    return first_step, log_page(visualizer, first_step)
+
+
+@instrumented
+def log_later(first_step, visualizer):
+    """
+    Show the next page of the log.
+    
+    Args:
+        first_step (int): First step of the page shown now
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
         
-        # Highlight swap operations
-        if step['swap']:
-            output += ">>> SWAP <<<\n"
+    Returns:
+        tuple: (new first step, log text)
+    """
+    first_step = max(int(first_step or 0), 0)
+    page = log_page_steps(visualizer)
+    
+    # Stay on the last page instead of moving past the end
+    if visualizer is not None and visualizer.produce_until(first_step + page, budget(visualizer)):
+        first_step += page
+    return first_step, log_page(visualizer, first_step)
+
+
+@instrumented
+def download_log(visualizer):
+    """
+    Write the complete log to a text file for download.
+    
+    The file is written one step at a time, so memory use stays small
+    even for traces with millions of steps. Writing stops after
+    DOWNLOAD_SECONDS, at DOWNLOAD_MAX_BYTES (or where the trace budget
+    stops a lazy sort), and that shorter log is saved under a different
+    name. A complete log is written once and reused by later clicks.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
         
-        output += "-" * 80 + "\n"
+    Returns:
+        str: Path of the log file, or None if nothing has been sorted
+    """
+    if visualizer is None or not visualizer.total_steps():
+        return None
+    
+    # Sorting may use half of the time, so there is time left to write
+    # out the steps it reached. The rest of a big lazy sort is sorted by a
+    # worker process into a trace file, and the log is written from that
+    sort_seconds = DOWNLOAD_SECONDS / 2
+    trace = visualizer
+    if (not visualizer.is_complete() and visualizer.get_stats()['steps'] <= MAX_TRACE_STEPS
+            and max_steps(len(visualizer.initial)) >= HEAVY_MIN_WORK):
+        try:
+            trace = cached_trace(visualizer.initial, visualizer.variant, visualizer.stats,
+                                 seconds=sort_seconds)
+        except SortStopped:
+            sort_seconds = 0  # Too slow even there: log the steps produced so far
+    
+    # A cached trace's log is kept with it; any other log belongs to the
+    # session, since the trace sorted for it here is let go of right away
+    try:
+        return write_log(trace, log_file_path(trace if trace.shared else visualizer), sort_seconds)
+    finally:
+        if trace is not visualizer:
+            release_visualizer(trace)
+
+
+def write_log(visualizer, path, sort_seconds):
+    """
+    Write the log of a trace to a file (see download_log).
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The trace
+        path (str): Where to write the complete log
+        sort_seconds (float): Time a lazy sort may spend producing steps
     
-    return output
+    Returns:
+        str: Path of the log file (a different one if the log stops early)
+    """
+    # A finished trace never changes, so its log only has to be written once
+    if visualizer.is_complete() and os.path.exists(path):
+        return path
+    
+    # Write to a private file first, then move it into place in one go, so
+    # sessions sharing a cached trace never see a half-written log
+    partial = f"{path}.{threading.get_ident()}.part"
+    should_stop = budget(visualizer, seconds=DOWNLOAD_SECONDS)
+    sort_should_stop = budget(visualizer, seconds=sort_seconds)
+    page = log_page_steps(visualizer)
+    reason = "the rest would take too long to write"
+    complete = True
+    written = last_step = 0
+    try:
+        with open(partial, "w", encoding="utf-8") as log:
+            log.write("=" * 80 + "\n")
+            log.write("COMPLETE BUBBLE SORT PROCESS\n")
+            log.write("=" * 80 + "\n\n")
+            for step in visualizer.iter_steps(should_stop=sort_should_stop):
+                entry = format_log_entry(step)
+                written += len(entry)
+                if written > DOWNLOAD_MAX_BYTES:
+                    complete = False
+                    reason = "the rest would make the file too big"
+                    break
+                log.write(entry)
+                last_step = step['num']
+                # Formatting takes time too, so check the budget every page
+                if last_step % page == 0 and should_stop():
+                    complete = False
+                    break
+            complete = complete and visualizer.is_complete() and last_step == visualizer.total_steps() - 1
+            if not complete:
+                log.write(f"(The log stops at step {last_step}: {reason})\n")
+        
+        # Only a complete log may be reused for a shared trace
+        if not complete:
+            path = path.replace(".txt", "_partial.txt")
+        os.replace(partial, path)
+    finally:
+        # A failed write (a full disk, a trace file deleted under it, ...)
+        # must not leave its half-written file behind
+        if os.path.exists(partial):
+            os.remove(partial)
+    return path
 
 
-def reset():
+@instrumented
+def reset(visualizer, request: "gr.Request" = None):
     """
     Reset the visualizer to initial state.
     
     This clears all sorting data and hides controls,
     allowing the user to start over with new input.
+    A Start that is still sorting in this session is stopped.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): This session's visualizer, or None
+        request (gr.Request): The Reset request (filled in by Gradio)
     
     Returns:
-        tuple: Updates to reset all UI components
+        tuple: Empty session state followed by updates to reset all UI components
     """
-    # Clear the visualizer's internal state
-    visualizer.steps = []
-    visualizer.current_step = 0
+    # Stop a running Start, then clear the visualizer's internal state
+    cancel_start(request)
+    release_visualizer(visualizer)
+    
+    # Navigations started before Reset are out of date now
+    visual = full_frame("")
+    page_replaced(request, None, visual)
     
     # Return updates to reset all UI components
     return (
+        None,  # Drop the session's trace
         0,  # Reset step_index to 0
         "Enter numbers and click Start",  # Reset status message
-        "",  # Clear visual display
+        "",  # Clear statistics
+        visual,  # Clear visual display
         "",  # Clear legend
         gr.update(visible=False, value=0),  # Hide and reset slider
         gr.update(visible=False),  # Hide prev button
@@ -522,7 +2912,11 @@ def reset():
         gr.update(visible=False),  # Hide show all button
         gr.update(visible=False),  # Hide reset button
         "",  # Clear input box
-        ""   # Clear all steps log
+        "",  # Clear all steps log
+        0,  # Reset log page to the first step
+        None,  # Clear downloaded log file
+        None,  # Clear uploaded numbers file
+        gr.update(visible=False)  # Hide play controls
     )
 
 
@@ -530,117 +2924,249 @@ def reset():
 # BUILD THE GRADIO USER INTERFACE
 # ============================================================================
 
-with gr.Blocks(title="Bubble Sort") as app:
+def build_app():
     """
-    Main Gradio application interface.
+    Build the main Gradio application interface.
     
     Layout:
     - Left column: Input and controls
     - Right column: Visualization and output
     
     Components are organized hierarchically and connected through event handlers.
-    """
     
-    # STATE MANAGEMENT
-    # This State component persists the current step index across interactions
-    step_index = gr.State(0)
+    Building the interface takes a while, so importing this module does not
+    do it; the launch code below calls this function. (The sorting itself
+    lives in bubble_sort.py, which imports in milliseconds.)
     
-    # HEADER
-    gr.Markdown("# 🔄 Bubble Sort Visualizer\n### Click Next to see each step")
-    
-    # MAIN LAYOUT: Two columns
-    with gr.Row():
-        # ==================== LEFT COLUMN ====================
-        with gr.Column(scale=1):
-            gr.Markdown("### Input")
-            
-            # Input textbox for comma-separated numbers
-            input_box = gr.Textbox(
-                label="Numbers (comma-separated)", 
-                placeholder="1, 2, 3, 4", 
-                lines=2
-            )
-            
-            # Start button to begin sorting
-            start_btn = gr.Button("▶ Start", variant="primary", size="lg")
-            
-            gr.Markdown("### Controls")
-            
-            # Slider for manual navigation through steps
-            # Initially hidden, shown after sorting starts
-            slider = gr.Slider(0, 10, 0, step=1, label="Step", visible=False)
-            
-            # Navigation buttons
-            with gr.Row():
-                prev_btn = gr.Button("⬅ Prev", visible=False)
-                next_btn = gr.Button("Next ➡", visible=False, variant="primary")
-            
-            # Additional controls
-            with gr.Row():
-                all_btn = gr.Button("📜 All Steps", visible=False)
-                reset_btn = gr.Button("🔄 Reset", visible=False)
-            
-            # Example inputs for quick testing
-            gr.Examples([["1, 2, 3, 4"], ["5, 2, 8, 1"]], input_box)
+    Returns:
+        gr.Blocks: The application, ready to be queued and launched
+    """
+    with gr.Blocks(title="Bubble Sort") as app:
+        # STATE MANAGEMENT
+        # This State component persists the current step index across interactions
+        step_index = gr.State(0)
         
-        # ==================== RIGHT COLUMN ====================
-        with gr.Column(scale=2):
-            gr.Markdown("### Visualization")
-            
-            # Status display showing current step information
-            status_box = gr.Markdown("Enter numbers and click Start")
-            
-            # Visual array representation (HTML boxes)
-            visual_box = gr.HTML("")
-            
-            # Color legend
-            legend_box = gr.HTML("")
+        # This State component holds the session's own BubbleSortVisualizer
+        # Gradio calls release_visualizer when the session ends or expires
+        session_visualizer = gr.State(
+            None,
+            time_to_live=SESSION_TTL_SECONDS,
+            delete_callback=release_visualizer
+        )
+        
+        # HEADER
+        gr.Markdown("# 🔄 Bubble Sort Visualizer\n### Click Next to see each step")
+        
+        # MAIN LAYOUT: Two columns
+        with gr.Row():
+            # ==================== LEFT COLUMN ====================
+            with gr.Column(scale=1):
+                gr.Markdown("### Input")
+                
+                # Input textbox for comma-separated numbers
+                input_box = gr.Textbox(
+                    label="Numbers (comma-separated)", 
+                    placeholder="1, 2, 3, 4", 
+                    lines=2
+                )
+                
+                # ...or a CSV / text file with one number per line, or a .npy array
+                upload_box = gr.File(
+                    label="Or upload numbers (.csv, .txt, .npy)",
+                    file_types=UPLOAD_FILE_TYPES,
+                    type="filepath"
+                )
+                
+                # Which bubble sort to run; the variants skip pairs that are
+                # already known to be in place
+                variant_radio = gr.Radio(
+                    [(VARIANT_LABELS[variant], variant) for variant in VARIANTS],
+                    value="classic",
+                    label="Variant"
+                )
+                
+                # Step through in the page itself: the whole trace is sent once
+                # and Next/Prev/Play no longer call the server
+                browser_box = gr.Checkbox(value=True, label="Step through in the browser")
+                
+                # Start button to begin sorting
+                start_btn = gr.Button("▶ Start", variant="primary", size="lg")
+                
+                # Counts passes, comparisons and swaps without building any steps
+                stats_btn = gr.Button("📊 Stats Only")
+                
+                gr.Markdown("### Controls")
+                
+                # Slider for manual navigation through steps
+                # Initially hidden, shown after sorting starts
+                slider = gr.Slider(0, 10, 0, step=1, label="Step", visible=False)
+                
+                # Navigation buttons
+                with gr.Row():
+                    prev_btn = gr.Button("⬅ Prev", visible=False)
+                    next_btn = gr.Button("Next ➡", visible=False, variant="primary")
+                
+                # Additional controls
+                with gr.Row():
+                    all_btn = gr.Button("📜 All Steps", visible=False)
+                    reset_btn = gr.Button("🔄 Reset", visible=False)
+                
+                # Autoplay: steps through the sort by itself at the chosen speed
+                with gr.Row(visible=False) as play_row:
+                    play_btn = gr.Button("▶ Play")
+                    pause_btn = gr.Button("⏸ Pause")
+                    speed_slider = gr.Slider(
+                        PLAY_SPEED_MIN, PLAY_SPEED_MAX, PLAY_SPEED_DEFAULT,
+                        step=1, label="Speed (steps per second)"
+                    )
+                
+                # Example inputs for quick testing
+                gr.Examples([[text] for text in EXAMPLE_INPUTS], input_box)
             
-            # Expandable section for complete step log
-            with gr.Accordion("All Steps", open=False):
-                all_box = gr.Textbox(label="Log", lines=20)
-    
-    # ============================================================================
-    # EVENT HANDLERS - Connect UI components to functions
-    # ============================================================================
-    
-    # START BUTTON: Initialize sorting process
-    start_btn.click(
-        start_sorting,
-        inputs=[input_box],
-        outputs=[step_index, status_box, visual_box, legend_box, slider, prev_btn, next_btn, all_btn, reset_btn]
-    )
-    
-    # SLIDER: Manual step navigation
-    slider.change(
-        show_step,
-        inputs=[slider],
-        outputs=[status_box, visual_box, prev_btn, next_btn]
-    )
-    
-    # NEXT BUTTON: Advance to next step
-    # This is the primary navigation method for step-by-step viewing
-    next_btn.click(
-        next_clicked,
-        inputs=[step_index],
-        outputs=[step_index, status_box, visual_box, prev_btn, next_btn]
-    )
-    
-    # PREVIOUS BUTTON: Go back to previous step
-    prev_btn.click(
-        prev_clicked,
-        inputs=[step_index],
-        outputs=[step_index, status_box, visual_box, prev_btn, next_btn]
-    )
-    
-    # SHOW ALL BUTTON: Display complete text log
-    all_btn.click(show_all, outputs=[all_box])
+            # ==================== RIGHT COLUMN ====================
+            with gr.Column(scale=2):
+                gr.Markdown("### Visualization")
+                
+                # Status display showing current step information
+                status_box = gr.Markdown("Enter numbers and click Start")
+                
+                # Totals for the whole sort (passes, comparisons, swaps, steps)
+                stats_box = gr.Markdown("")
+                
+                # Visual array representation (HTML boxes)
+                # The boxes are drawn in the browser from the frames in frame_box
+                visual_box = gr.HTML(VISUAL_PLACEHOLDER)
+                frame_box = gr.JSON(visible=False)
+                
+                # Clicked by APPLY_FRAME_JS only, so it stays in the page unseen
+                # (newer Gradio versions leave components with visible=False
+                # out of the page and take "hidden" instead)
+                visible = inspect.signature(gr.Button).parameters["visible"].annotation
+                hidden = "hidden" if "hidden" in str(visible) else False
+                redraw_btn = gr.Button("Redraw", elem_id=REDRAW_ELEM_ID, visible=hidden)
+                
+                # Color legend
+                legend_box = gr.HTML("")
+                
+                # Expandable section for the step log, one page at a time
+                with gr.Accordion("All Steps", open=False):
+                    with gr.Row():
+                        log_start = gr.Number(value=0, precision=0, label="First step", minimum=0)
+                        log_earlier_btn = gr.Button("⬅ Earlier")
+                        log_later_btn = gr.Button("Later ➡")
+                    all_box = gr.Textbox(label="Log", lines=20)
+                    
+                    # Full log as a downloadable text file
+                    download_btn = gr.Button("💾 Download full log")
+                    log_file = gr.File(label="Log file")
+        
+        # ============================================================================
+        # EVENT HANDLERS - Connect UI components to functions
+        # ============================================================================
+        
+        # PLAY BUTTON: Stream frames from the server until the last step
+        # Pause stops it; so do Start, Reset and manual navigation (cancels=...)
+        # Play runs in a lane of its own (PLAY_CONCURRENCY_LIMIT), so long
+        # animations never take the slots or threads the clicks need
+        play_event = play_btn.click(
+            play,
+            inputs=[step_index, session_visualizer, speed_slider],
+            outputs=[step_index, status_box, frame_box, prev_btn, next_btn],
+            concurrency_limit=PLAY_CONCURRENCY_LIMIT,
+            concurrency_id="play"
+        )
+        pause_btn.click(None, cancels=[play_event])
+        
+        # HEAVY EVENTS: Start, Stats Only and the log buttons can sort or
+        # format a lot of data, so they share one "heavy" lane of
+        # HEAVY_CONCURRENCY_LIMIT (see WORKER PROCESSES). Navigation events
+        # keep the default limit, so a big Start never queues up a Next
+        heavy = dict(concurrency_limit=HEAVY_CONCURRENCY_LIMIT, concurrency_id="heavy")
+        
+        # START BUTTON: Initialize sorting process
+        start_event = start_btn.click(
+            start_sorting,
+            inputs=[input_box, session_visualizer, upload_box, variant_radio, browser_box],
+            outputs=[session_visualizer, step_index, status_box, stats_box, frame_box, legend_box, slider, prev_btn, next_btn, all_btn, reset_btn, play_row],
+            cancels=[play_event],
+            **heavy
+        )
+        
+        # STATS ONLY BUTTON: Totals without generating the trace
+        stats_btn.click(show_stats, inputs=[input_box, upload_box, variant_radio], outputs=[stats_box], **heavy)
+        
+        # SLIDER: Manual step navigation
+        # While a step is being rendered, the ticks a drag passes are not queued:
+        # only the latest one is sent once the render is done ("always_last")
+        slider.change(
+            slider_moved,
+            inputs=[slider, session_visualizer],
+            outputs=[step_index, status_box, frame_box, prev_btn, next_btn],
+            cancels=[play_event],
+            trigger_mode="always_last",
+            show_progress="hidden"
+        )
+        
+        # NEXT BUTTON: Advance to next step
+        # This is the primary navigation method for step-by-step viewing
+        next_btn.click(
+            next_clicked,
+            inputs=[step_index, session_visualizer],
+            outputs=[step_index, status_box, frame_box, prev_btn, next_btn],
+            cancels=[play_event]
+        )
+        
+        # PREVIOUS BUTTON: Go back to previous step
+        prev_btn.click(
+            prev_clicked,
+            inputs=[step_index, session_visualizer],
+            outputs=[step_index, status_box, frame_box, prev_btn, next_btn],
+            cancels=[play_event]
+        )
+        
+        # FRAMES: Draw every new frame in the browser (no server round trip)
+        frame_box.change(None, inputs=[frame_box], js=APPLY_FRAME_JS)
+        
+        # REDRAW: The page asks for the whole step when a diff does not fit
+        redraw_btn.click(
+            redraw,
+            inputs=[step_index, session_visualizer],
+            outputs=[status_box, frame_box, prev_btn, next_btn],
+            show_progress="hidden"
+        )
+        
+        # SHOW ALL BUTTON: Display complete text log
+        all_btn.click(show_all, inputs=[session_visualizer, log_start], outputs=[all_box], **heavy)
+        
+        # LOG PAGES: Move through the log one page at a time
+        log_earlier_btn.click(log_earlier, inputs=[log_start, session_visualizer], outputs=[log_start, all_box], **heavy)
+        log_later_btn.click(log_later, inputs=[log_start, session_visualizer], outputs=[log_start, all_box], **heavy)
+        
+        # DOWNLOAD BUTTON: Write the full log to a file
+        download_btn.click(download_log, inputs=[session_visualizer], outputs=[log_file], **heavy)
+        
+        # RESET BUTTON: Clear everything and start over
+        # (also stops a Start that is still sorting)
+        reset_btn.click(
+            reset,
+            inputs=[session_visualizer],
+            outputs=[session_visualizer, step_index, status_box, stats_box, frame_box, legend_box, slider, prev_btn, next_btn, all_btn, reset_btn, input_box, all_box, log_start, log_file, upload_box, play_row],
+            cancels=[play_event, start_event]
+        )
+        
+        # SHARED TRACES: A link with ?trace=<id> opens that trace right away
+        app.load(
+            open_shared_trace,
+            inputs=[session_visualizer, browser_box],
+            outputs=[session_visualizer, step_index, status_box, stats_box, frame_box, legend_box, slider, prev_btn, next_btn, all_btn, reset_btn, play_row],
+            api_name=False
+        )
+        
+        # SESSIONS: Count open tabs for the active sessions metric
+        app.load(session_opened, api_name=False, show_progress="hidden")
+        app.unload(session_closed)
     
-    # RESET BUTTON: Clear everything and start over
-    reset_btn.click(
-        reset,
-        outputs=[step_index, status_box, visual_box, legend_box, slider, prev_btn, next_btn, all_btn, reset_btn, input_box, all_box]
-    )
+    return app
 
 
 # ============================================================================
@@ -653,5 +3179,21 @@ if __name__ == "__main__":
     
     The app will start a local web server and open in the default browser.
     For Hugging Face deployment, the server configuration is automatic.
+    
+    Each session keeps its own trace, so events from different users can
+    run side by side instead of one at a time.
+    
+    Metrics for Prometheus are served at /metrics on the same server.
     """
-    app.launch()
+    start_logging()
+    app = build_app()
+    
+    # Sort the example inputs now, so clicking one and then Start is instant
+    warm_trace_cache()
+    start_heavy_workers()
+    app.queue(default_concurrency_limit=CONCURRENCY_LIMIT)
+    
+    # Gradio creates its web server in launch, so the route is added after
+    app.launch(prevent_thread_lock=True)
+    app.app.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+    app.block_thread()
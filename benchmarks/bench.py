@@ -0,0 +1,359 @@
+"""
+Benchmark Suite for the Bubble Sort Visualizer
+===============================================
+Measures the hot paths of app.py so performance changes can be caught
+before deploying:
+- parse_input      (reading the text box)
+- generate_steps   (building the whole trace)
+- start_sorting    (Start button, lazy for large inputs)
+- show_step        (slider seeks to random steps)
+- next_clicked     (Next button, small diff frames)
+- make_visual      (full HTML render of one step)
+- step_frame       (full frame as sent: boxes or bar chart, by size)
+- show_all         (one page of the step log)
+- stats            (closed-form pass/comparison/swap counts)
+
+Every input shape (sorted, reversed, random, many duplicates) is run for
+every size. For each handler the suite records the time per call, the
+peak memory (tracemalloc) and the size of what is sent to the browser.
+Every call gets a new input or emptied caches, so repeats measure the work
+and not cache hits, and trace files go to a temporary folder that is
+deleted afterwards (not the server's BUBBLE_SORT_TRACE_DIR).
+
+Usage:
+    python benchmarks/bench.py                       # run, write bench_results.json
+    python benchmarks/bench.py --sizes 10 100 1000   # pick sizes
+    python benchmarks/bench.py --compare old.json    # report regressions
+
+The JSON output can be kept per commit and compared with --compare.
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Make "import app" work when run from any folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Trace files written while benchmarking go to a folder of their own (app
+# reads BUBBLE_SORT_TRACE_DIR on import, and its worker processes inherit it)
+if __name__ == "__main__":
+    os.environ["BUBBLE_SORT_TRACE_DIR"] = tempfile.mkdtemp(prefix="bubble_sort_bench_")
+    atexit.register(shutil.rmtree, os.environ["BUBBLE_SORT_TRACE_DIR"], ignore_errors=True)
+
+import app  # noqa: E402
+
+
+# Sizes from 10 to 10^5
+DEFAULT_SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+# Full traces larger than this are not generated eagerly (they would take
+# minutes); only the lazy paths are measured for those inputs
+MAX_EAGER_STEPS = 20_000_000
+
+# Log pages print the whole array for every step, so a page holds about
+# n * app.log_page_steps values; bigger pages than this are skipped
+MAX_LOG_VALUES = 20_000_000
+
+# Number of different random slider seeks / Next clicks per input
+SEEKS = 20
+
+# A handler is reported as a regression if it got this much slower
+REGRESSION_RATIO = 1.25
+
+# Fast calls are repeated until they add up to this many seconds
+MIN_TIMING_SECONDS = 0.2
+
+
+def make_input(shape, n, seed=0):
+    """
+    Build a benchmark input.
+    
+    Args:
+        shape (str): "sorted" (best case), "reversed" (worst case),
+                     "random" or "duplicates" (only 5 distinct values)
+        n (int): Number of values
+        seed (int): Random seed, so every run uses the same data
+        
+    Returns:
+        list: The numbers
+    """
+    rng = random.Random(seed)
+    if shape == "sorted":
+        return list(range(n))
+    if shape == "reversed":
+        return list(range(n, 0, -1))
+    if shape == "random":
+        return [rng.randint(-10 * n, 10 * n) for _ in range(n)]
+    return [rng.randint(1, 5) for _ in range(n)]
+
+
+def payload_bytes(output):
+    """
+    Estimate how many bytes a handler's output sends to the browser.
+    
+    Args:
+        output: Value (or tuple of values) returned by a handler
+        
+    Returns:
+        int: Size of the output encoded as JSON
+    """
+    # Session state stays on the server, so it is not counted
+    if isinstance(output, tuple):
+        output = [item for item in output if not isinstance(item, app.BubbleSortVisualizer)]
+    return len(json.dumps(output, default=str).encode("utf-8"))
+
+
+def release_outputs(output):
+    """
+    Let go of the visualizers in a handler's output, like the session would.
+    
+    Args:
+        output: Value (or tuple of values) returned by a handler
+    """
+    if isinstance(output, tuple):
+        for item in output:
+            if isinstance(item, app.BubbleSortVisualizer):
+                app.release_visualizer(item)
+
+
+def measure(fn, fresh=None):
+    """
+    Time a call and record its peak memory and payload.
+    
+    Fast calls are repeated until they add up to at least MIN_TIMING_SECONDS,
+    so tiny timings are not just noise. The repeats would otherwise only hit
+    the caches filled by the first call, so fresh (if given) is called
+    before every call, outside the timing, and its result is passed to fn.
+    
+    Args:
+        fn (callable): Function taking no arguments, or fresh's result
+        fresh (callable): Makes a new input or empties caches, or None
+        
+    Returns:
+        dict: 'seconds' (per call), 'peak_bytes' and 'payload_bytes'
+    """
+    def run():
+        arg = () if fresh is None else (fresh(),)
+        begin = time.perf_counter()
+        output = fn(*arg)
+        return time.perf_counter() - begin, output
+    
+    # Timing run (tracemalloc slows code down, so it is measured separately)
+    # Handlers print debug lines, which would only add noise here
+    with contextlib.redirect_stdout(io.StringIO()):
+        number, total = 0, 0.0
+        while total < MIN_TIMING_SECONDS:
+            seconds, output = run()
+            release_outputs(output)
+            number, total = number + 1, total + seconds
+        seconds = total / number
+        
+        # Memory run
+        arg = () if fresh is None else (fresh(),)
+        tracemalloc.start()
+        output = fn(*arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    
+    payload = payload_bytes(output)
+    release_outputs(output)
+    return {
+        'seconds': seconds,
+        'peak_bytes': peak,
+        'payload_bytes': payload
+    }
+
+
+def shifted_texts(nums):
+    """
+    Make the same input again and again, each time as a new trace.
+    
+    Adding 1 to every value keeps the shape (and all the counts) but
+    changes the trace ID, so no Start is answered from the trace cache or
+    a trace file.
+    
+    Args:
+        nums (list): The numbers
+    
+    Yields:
+        str: Text box contents, shifted by 1, 2, 3, ...
+    """
+    for shift in itertools.count(1):
+        yield ", ".join(str(x + shift) for x in nums)
+
+
+def forget_steps(visualizer):
+    """
+    Empty a visualizer's step cache, so the next call rebuilds its steps.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): The visualizer
+    """
+    with app.STEP_CACHES_LOCK:
+        app.STEP_CACHES.pop(visualizer, None)
+
+
+def bench_input(shape, n):
+    """
+    Run every benchmark for one input.
+    
+    Args:
+        shape (str): Input shape (see make_input)
+        n (int): Number of values
+        
+    Returns:
+        dict: Results keyed by handler name
+    """
+    nums = make_input(shape, n)
+    text = ", ".join(str(x) for x in nums)
+    stats = app.bubble_sort_stats(nums)
+    results = {}
+    
+    results['parse_input'] = measure(lambda: app.parse_input(text))
+    results['stats'] = measure(lambda: app.bubble_sort_stats(nums))
+    
+    # Whole trace, only where it finishes in reasonable time
+    if stats['steps'] <= MAX_EAGER_STEPS:
+        def generate():
+            visualizer = app.BubbleSortVisualizer()
+            visualizer.generate_steps(nums)
+            return None
+        results['generate_steps'] = measure(generate)
+    
+    texts = shifted_texts(nums)
+    results['start_sorting'] = measure(lambda text: app.start_sorting(text, None), lambda: next(texts))
+    
+    # The rest run on one session's visualizer, like the UI does
+    with contextlib.redirect_stdout(io.StringIO()):
+        visualizer = app.start_sorting(text, None)[0]
+    rng = random.Random(1)
+    
+    # Seeks stay within steps a lazy sort can reach quickly
+    reachable = min(stats['steps'], MAX_EAGER_STEPS // 10)
+    seek_targets = [rng.randrange(reachable) for _ in range(SEEKS)]
+    seek_iter = itertools.cycle(seek_targets)
+    
+    def seek():
+        forget_steps(visualizer)
+        return next(seek_iter)
+    results['show_step'] = measure(lambda idx: app.show_step(idx, visualizer), seek)
+    
+    next_iter = itertools.cycle(range(SEEKS))
+    
+    def click():
+        forget_steps(visualizer)
+        return next(next_iter)
+    results['next_clicked'] = measure(lambda idx: app.next_clicked(idx, visualizer), click)
+    
+    step = visualizer.get_step(0)
+    results['make_visual'] = measure(lambda: app.make_visual(step['arr'], step['cmp'], step['swap']))
+    results['step_frame'] = measure(lambda: app.step_frame(step))
+    
+    if n * app.log_page_steps(visualizer) <= MAX_LOG_VALUES:
+        results['show_all'] = measure(lambda: app.show_all(visualizer))
+    
+    app.release_visualizer(visualizer)
+    return results
+
+
+def git_commit():
+    """
+    Get the current git commit, to label the results.
+    
+    Returns:
+        str: Short commit hash, or "unknown" outside a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old, new, threshold=REGRESSION_RATIO):
+    """
+    Print handlers that got slower between two result files.
+    
+    Args:
+        old (dict): Earlier results (loaded JSON)
+        new (dict): Current results
+        threshold (float): Slowdown ratio that counts as a regression
+        
+    Returns:
+        int: Number of regressions found
+    """
+    regressions = 0
+    for key, handlers in new['results'].items():
+        for name, metrics in handlers.items():
+            before = old['results'].get(key, {}).get(name)
+            if not before or not before['seconds']:
+                continue
+            ratio = metrics['seconds'] / before['seconds']
+            if ratio > threshold:
+                regressions += 1
+                print(f"REGRESSION {key} {name}: {before['seconds']*1e3:.3f} ms -> "
+                      f"{metrics['seconds']*1e3:.3f} ms ({ratio:.2f}x)")
+    print(f"{regressions} regression(s) compared with {old.get('commit', '?')}")
+    return regressions
+
+
+def main():
+    """Parse arguments, run the benchmarks and write the JSON report."""
+    parser = argparse.ArgumentParser(description="Benchmark the bubble sort visualizer")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="input sizes to run")
+    parser.add_argument("--shapes", nargs="+", default=["sorted", "reversed", "random", "duplicates"],
+                        help="input shapes to run")
+    parser.add_argument("--output", default="bench_results.json",
+                        help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="OLD_JSON",
+                        help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_RATIO,
+                        help="slowdown ratio reported as a regression (default %(default)s)")
+    args = parser.parse_args()
+    
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'results': {}
+    }
+    
+    for n in args.sizes:
+        for shape in args.shapes:
+            key = f"{shape}-{n}"
+            print(f"Running {key} ...", flush=True)
+            report['results'][key] = bench_input(shape, n)
+            for name, metrics in report['results'][key].items():
+                print(f"  {name:15s} {metrics['seconds']*1e3:10.3f} ms  "
+                      f"peak {metrics['peak_bytes']/1e6:8.2f} MB  "
+                      f"payload {metrics['payload_bytes']:>10d} B")
+    
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(report, out, indent=2)
+    print(f"Results written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as old_file:
+            if compare(json.load(old_file), report, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
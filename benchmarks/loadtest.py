@@ -0,0 +1,418 @@
+"""
+Load Test for the Bubble Sort Visualizer
+========================================
+Starts the app locally and drives many browser sessions at once through
+gradio_client, to see how it behaves when a whole class uses it together.
+
+Every simulated session follows the same script, like a student would:
+- Start       (sort a new list)
+- Next        (a burst of clicks)
+- slider      (a drag across the whole sort, one value after another)
+- Show All    (first page of the step log)
+- Reset
+
+The script is run by 1, 5, 10, ... sessions at the same time. For every
+level the report gives the throughput (events per second), the p50, p95
+and p99 latency of every event and the server's memory (RSS). Where the
+throughput stops growing but the latency keeps climbing, the queue is
+saturated: that is the point to size workers and concurrency limits by.
+The sessions run in this process, so on a small machine the load test
+competes with the app for the CPU; use --url to test an app elsewhere.
+
+Usage:
+    python benchmarks/loadtest.py                            # 1 to 50 sessions
+    python benchmarks/loadtest.py --sessions 10 20 40 --rounds 5
+    python benchmarks/loadtest.py --concurrency-limit 4      # try another limit
+    python benchmarks/loadtest.py --url http://host:7860/    # server already running
+
+The JSON output can be kept per commit, like bench.py's.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from gradio_client import Client
+
+# Make "import bench" and "import bubble_sort" work when run from any folder
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from bench import git_commit, make_input  # noqa: E402
+from bubble_sort import bubble_sort_stats  # noqa: E402
+
+
+# Numbers of sessions running the script at the same time
+DEFAULT_SESSIONS = [1, 5, 10, 25, 50]
+
+# Times every session runs the script per level
+DEFAULT_ROUNDS = 3
+
+# Length of the lists the sessions sort (a typical classroom example)
+DEFAULT_SIZE = 20
+
+# Next clicks in a burst, and slider values sent during one drag
+NEXT_CLICKS = 10
+DRAG_TICKS = 20
+
+# Port for the app started by the load test
+DEFAULT_PORT = 7861
+
+# Longest wait for the started app to answer, in seconds
+STARTUP_SECONDS = 120
+
+# Memory samples per second while a level runs
+RSS_SAMPLES_PER_SECOND = 5
+
+# A level whose throughput is at least this share of the best one counts
+# as saturated (more sessions no longer get more work done)
+SATURATION_SHARE = 0.9
+
+# Parameters the script sends to every event, by name (checked against the
+# app's API once before the first level), in the order the report lists them
+EVENT_PARAMETERS = {
+    "start_sorting": ["input_text", "upload", "variant", "in_browser"],
+    "next_clicked": [],
+    "slider_moved": ["step_idx"],
+    "show_all": ["first_step"],
+    "reset": [],
+}
+EVENTS = list(EVENT_PARAMETERS)
+
+
+def start_server(port, concurrency_limit=None):
+    """
+    Start app.py in its own process and wait until it answers.
+    
+    Args:
+        port (int): Port for the app
+        concurrency_limit (int): Events the app may run at the same time,
+                                 or None for its default
+    
+    Returns:
+        subprocess.Popen: The running app
+    
+    Raises:
+        RuntimeError: If the app did not start in time
+    """
+    env = dict(os.environ,
+               GRADIO_SERVER_PORT=str(port),
+               GRADIO_ANALYTICS_ENABLED="False",
+               BUBBLE_SORT_TRACE_DIR=tempfile.mkdtemp(prefix="loadtest_traces_"))
+    if concurrency_limit:
+        env["BUBBLE_SORT_CONCURRENCY_LIMIT"] = str(concurrency_limit)
+    # The app's output goes to a file, so a failed start can be looked into
+    log_fd, log_path = tempfile.mkstemp(prefix="loadtest_app_", suffix=".log")
+    with os.fdopen(log_fd, "wb") as log:
+        server = subprocess.Popen([sys.executable, os.path.join(HERE, "..", "app.py")],
+                                  env=env, stdout=log, stderr=subprocess.STDOUT)
+    
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The app exited with code {server.returncode} "
+                               f"(its output is in {log_path})")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"The app did not answer within {STARTUP_SECONDS} seconds "
+                       f"(its output is in {log_path})")
+
+
+def check_api(url):
+    """
+    Make sure the app has every event the script sends, with the parameters
+    it sends them by. A renamed or removed input fails here once, instead of
+    turning every call of a level into an error.
+    
+    Args:
+        url (str): Address of the app
+    
+    Raises:
+        RuntimeError: If an event or one of its parameters is missing
+    """
+    api = Client(url, verbose=False).view_api(print_info=False, return_format="dict")
+    for event, names in EVENT_PARAMETERS.items():
+        endpoint = api['named_endpoints'].get(f"/{event}")
+        if endpoint is None:
+            raise RuntimeError(f"The app has no /{event} endpoint")
+        missing = set(names) - {parameter['parameter_name'] for parameter in endpoint['parameters']}
+        if missing:
+            raise RuntimeError(f"/{event} takes no {', '.join(sorted(missing))} parameter")
+
+
+def read_rss(pid):
+    """
+    Get a process's resident memory.
+    
+    Args:
+        pid (int): Process ID
+    
+    Returns:
+        int: Resident set size in bytes, or None where /proc is missing
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """
+    Sample a process's memory in the background while a level runs.
+    
+    Attributes:
+        peak (int): Largest RSS seen, in bytes (None if unknown)
+    """
+    
+    def __init__(self, pid):
+        """
+        Args:
+            pid (int): Process to watch, or None to record nothing
+        """
+        self.pid = pid
+        self.peak = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while True:
+            rss = read_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self._done.wait(1 / RSS_SAMPLES_PER_SECOND):
+                return
+    
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._done.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def run_session(url, seed, rounds, size):
+    """
+    Run the session script as one browser tab would.
+    
+    Args:
+        url (str): Address of the app
+        seed (int): Random seed for this session's lists
+        rounds (int): Times to run the script
+        size (int): Length of the lists to sort
+    
+    Returns:
+        list: (event name, seconds, error) for every event sent, where error
+              is None or "ExceptionType: message"
+    """
+    client = Client(url, verbose=False)  # One client is one session
+    rng = random.Random(seed)
+    timings = []
+    
+    def send(event, **kwargs):
+        start = time.perf_counter()
+        try:
+            client.predict(api_name=f"/{event}", **kwargs)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        timings.append((event, time.perf_counter() - start, error))
+    
+    for _ in range(rounds):
+        nums = make_input("random", size, seed=rng.randrange(10 ** 9))
+        last_step = bubble_sort_stats(nums)['steps'] - 1
+        
+        send("start_sorting", input_text=", ".join(map(str, nums)), upload=None,
+             variant="classic", in_browser=False)
+        for _ in range(NEXT_CLICKS):
+            send("next_clicked")
+        # A drag sends the values it passes, one at a time
+        for tick in range(1, DRAG_TICKS + 1):
+            send("slider_moved", step_idx=last_step * tick // DRAG_TICKS)
+        send("show_all", first_step=0)
+        send("reset")
+    return timings
+
+
+def percentile(values, share):
+    """
+    Get a percentile by the nearest-rank method.
+    
+    Args:
+        values (list): Measurements
+        share (float): 0.5 for the median, 0.95 for p95, ...
+    
+    Returns:
+        float: The percentile, or None for no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * share) - 1, 0)]
+
+
+def run_level(url, sessions, rounds, size, server_pid=None):
+    """
+    Run the script in many sessions at once and summarize the latencies.
+    
+    Args:
+        url (str): Address of the app
+        sessions (int): Sessions running at the same time
+        rounds (int): Times each session runs the script
+        size (int): Length of the lists to sort
+        server_pid (int): App process to measure the memory of, or None
+    
+    Returns:
+        dict: 'sessions', 'seconds', 'events', 'errors', 'throughput'
+              (events per second), 'rss_bytes' and 'events_by_name' with
+              the count and p50/p95/p99 (seconds) of every event, and its
+              errors ("ExceptionType: message" to times seen)
+    """
+    timings = []
+    with RssSampler(server_pid) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            for session_timings in pool.map(run_session, [url] * sessions, range(sessions),
+                                            [rounds] * sessions, [size] * sessions):
+                timings.extend(session_timings)
+        seconds = time.perf_counter() - start
+    
+    by_name = {}
+    for event in EVENTS:
+        latencies = [latency for name, latency, error in timings
+                     if name == event and error is None]
+        errors = Counter(error for name, _, error in timings
+                         if name == event and error is not None)
+        by_name[event] = {
+            'count': len(latencies),
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'errors': dict(errors.most_common())
+        }
+    return {
+        'sessions': sessions,
+        'seconds': seconds,
+        'events': len(timings),
+        'errors': sum(1 for _, _, error in timings if error is not None),
+        'throughput': len(timings) / seconds,
+        'rss_bytes': sampler.peak,
+        'events_by_name': by_name
+    }
+
+
+def saturation_point(levels, share=SATURATION_SHARE):
+    """
+    Find the smallest number of sessions that already gets (nearly) the
+    best throughput. More sessions than this only wait longer in the queue.
+    
+    Args:
+        levels (list): Results of run_level, by increasing sessions
+        share (float): Share of the best throughput that counts as saturated
+    
+    Returns:
+        int: Sessions at the saturation point, or None for no levels
+    """
+    if not levels:
+        return None
+    best = max(level['throughput'] for level in levels)
+    for level in levels:
+        if level['throughput'] >= share * best:
+            return level['sessions']
+
+
+def print_level(level):
+    """Print one level of the report."""
+    rss = level['rss_bytes']
+    print(f"{level['sessions']} session(s): {level['throughput']:.1f} events/s, "
+          f"{level['errors']} error(s), "
+          f"server RSS {'unknown' if rss is None else f'{rss / 1e6:.0f} MB'}")
+    for event, metrics in level['events_by_name'].items():
+        if metrics['count']:
+            print(f"  {event:15s} p50 {metrics['p50']*1e3:8.1f} ms  "
+                  f"p95 {metrics['p95']*1e3:8.1f} ms  p99 {metrics['p99']*1e3:8.1f} ms  "
+                  f"({metrics['count']} calls)")
+        for error, times in metrics['errors'].items():
+            print(f"  {event:15s} failed {times} time(s): {error}")
+
+
+def main():
+    """Parse arguments, run every level and write the JSON report."""
+    parser = argparse.ArgumentParser(description="Load test the bubble sort visualizer")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS,
+                        help="numbers of sessions running at the same time")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="times every session runs the script (default %(default)s)")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help="length of the lists to sort (default %(default)s)")
+    parser.add_argument("--url", help="test an app that is already running here instead")
+    parser.add_argument("--pid", type=int, help="process ID of that app, to measure its memory")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port for the app the test starts (default %(default)s)")
+    parser.add_argument("--concurrency-limit", type=int,
+                        help="events the started app may run at the same time")
+    parser.add_argument("--output", default="loadtest_results.json",
+                        help="where to write the JSON results")
+    args = parser.parse_args()
+    
+    server = None
+    url, server_pid = args.url, args.pid
+    if url is None:
+        print("Starting the app ...", flush=True)
+        server = start_server(args.port, args.concurrency_limit)
+        url, server_pid = f"http://127.0.0.1:{args.port}/", server.pid
+    
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': {'rounds': args.rounds, 'size': args.size,
+                     'concurrency_limit': args.concurrency_limit},
+        'idle_rss_bytes': read_rss(server_pid) if server_pid else None,
+        'levels': []
+    }
+    
+    try:
+        check_api(url)
+        for sessions in sorted(args.sessions):
+            print(f"Running {sessions} session(s) ...", flush=True)
+            level = run_level(url, sessions, args.rounds, args.size, server_pid)
+            report['levels'].append(level)
+            print_level(level)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    
+    report['saturation_sessions'] = saturation_point(report['levels'])
+    print(f"Throughput stops growing at about {report['saturation_sessions']} session(s); "
+          f"more sessions only wait longer in the queue")
+    
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(report, out, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
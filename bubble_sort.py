@@ -0,0 +1,2153 @@
+"""
+Bubble Sort Engine
+==================
+The sorting logic of the Bubble Sort Visualizer, without any user interface.
+
+app.py builds the Gradio interface on top of this module. Importing it does
+not import Gradio or build any UI, so traces and statistics can also be
+computed offline, for many inputs at once, with the batch mode below.
+Importing it takes milliseconds: NumPy is only imported once an input is big
+enough to need it.
+
+Batch mode reads one list of numbers per line (commas and/or spaces between
+the numbers) and writes one result per line, in input order:
+
+Usage:
+    python bubble_sort.py inputs.txt                        # stats as JSONL on stdout
+    python bubble_sort.py inputs.txt -o out.jsonl --trace   # include swap bits
+    python bubble_sort.py inputs.txt -o out.bin --format binary --workers 8
+    python bubble_sort.py inputs.txt --store traces/            # also write trace files
+
+From Python:
+    from bubble_sort import run_batch
+    for record in run_batch(lines, with_trace=True):
+        ...
+"""
+
+import array
+import base64
+import bisect
+import contextlib
+import functools
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+try:
+    import fcntl  # File locks (Unix only)
+except ImportError:
+    fcntl = None  # Windows cannot delete open files anyway
+
+# NumPy is imported inside the functions that use it (see is_array), so
+# importing this module stays fast for code that only needs small lists
+
+
+# ============================================================================
+# COMPACT TRACE FORMAT
+# ============================================================================
+# Instead of copying the whole array for every step, the trace only stores
+# one bit per comparison: whether that comparison swapped.
+# Bubble sort always visits the same pairs in the same order (pass i compares
+# j = 0 .. n-i-2), so the pass and index of any step follow from its step
+# number alone:
+#   step 0          -> initial array
+#   step 1 + 2c     -> comparison number c
+#   step 2 + 2c     -> result of comparison c (swap or no swap)
+#   then "Sorted!" (if the sort stopped early) and the final step.
+# The array for any step is rebuilt from the nearest checkpoint (a snapshot
+# taken at the start of every few passes) by re-running those passes, so
+# any step can be reached quickly.
+
+# Step kinds
+STEP_INITIAL = 0   # Starting array, before any comparison
+STEP_COMPARE = 1   # arr[j] and arr[j+1] are being compared
+STEP_SWAP = 2      # arr[j] and arr[j+1] were swapped
+STEP_NO_SWAP = 3   # arr[j] and arr[j+1] were already in order
+STEP_SORTED = 4    # A whole pass finished without any swaps
+STEP_COMPLETE = 5  # Final, fully sorted array
+
+# Fewest passes between two checkpoints (full array snapshots), K
+# Seeking re-runs at most K passes, so it costs O(K * n) no matter how many
+# steps the trace has
+CHECKPOINT_PASSES = 8
+
+# Memory all checkpoints of one trace may take, in bytes. A sort of n values
+# takes up to n passes and every checkpoint holds n values (8 bytes each),
+# so long inputs get a larger K (see checkpoint_interval): without this the
+# checkpoints would take O(n^2 / 8) bytes, over 100 MB at n = 10,000
+CHECKPOINT_BYTES = 32 * 1024 * 1024
+
+# Inputs at least this long use the NumPy engine by default
+NUMPY_MIN_LENGTH = 64
+
+# Replays of at least this many passes turn a list into NumPy sort keys
+# first (making the keys costs about as much as four Python passes)
+NUMPY_MIN_REPLAY = 4
+
+
+def is_array(value):
+    """
+    Check for a NumPy array without importing NumPy.
+    
+    If NumPy was never imported, nothing can be a NumPy array, so plain
+    lists never pay for the import.
+    
+    Args:
+        value: Any value
+        
+    Returns:
+        bool: True if value is a NumPy array
+    """
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def bubble_pass(arr, compares):
+    """
+    Run the first `compares` compare-and-swap operations of one pass.
+    
+    Bubble sort is deterministic, so re-running a pass from a checkpoint
+    gives exactly the array the original run had.
+    
+    Args:
+        arr (list): Array to update in place
+        compares (int): Number of adjacent pairs to process, from the left
+    """
+    for j in range(compares):
+        if arr[j] > arr[j + 1]:
+            arr[j], arr[j + 1] = arr[j + 1], arr[j]
+
+
+def numpy_bubble_pass(keys, perm, compares):
+    """
+    Run one whole bubble sort pass with NumPy array operations.
+    
+    During a pass the largest value seen so far is carried to the right.
+    At position j it is swapped with the next value exactly when it is
+    bigger, so the swaps of the pass are
+        mask[j] = max(keys[0..j]) > keys[j+1]
+    A value that is not swapped past becomes the new carried value. Every
+    other value moves one place to the left.
+    
+    Args:
+        keys (ndarray): Sort keys (int64 ranks) in current order
+        perm (ndarray): Position of each value in the original input, or
+                        None when the keys are the values themselves
+        compares (int): Number of comparisons in this pass
+        
+    Returns:
+        tuple: (new keys, new perm, boolean swap mask of length `compares`)
+    """
+    import numpy as np
+    m = compares
+    running_max = np.maximum.accumulate(keys[:m + 1])
+    mask = running_max[:-1] > keys[1:m + 1]
+    
+    # Position of the value being carried when the pass reaches each index:
+    # the last position that was not swapped into from the left
+    positions = np.arange(m + 1)
+    leader = np.ones(m + 1, dtype=bool)
+    leader[1:] = ~mask
+    carried = np.maximum.accumulate(np.where(leader, positions, 0))
+    
+    # Where each slot's new value comes from
+    source = np.arange(len(keys))
+    source[:m] = np.where(mask, positions[1:], carried[:-1])
+    source[m] = carried[m]
+    if perm is None:
+        return keys[source], None, mask
+    return keys[source], perm[source], mask
+
+
+def max_steps(n):
+    """
+    Upper bound on the number of steps bubble sort can record for n numbers.
+    
+    Every comparison takes two steps (compare + swap/no swap), and there are
+    at most n(n-1)/2 comparisons. Add the initial, "Sorted!" and final steps.
+    
+    Args:
+        n (int): Length of the input array
+        
+    Returns:
+        int: Maximum possible number of steps
+    """
+    return n * (n - 1) + 3
+
+
+def checkpoint_interval(n, fewest=CHECKPOINT_PASSES, max_bytes=CHECKPOINT_BYTES):
+    """
+    Choose the passes between checkpoints for a sort of n values.
+    
+    Args:
+        n (int): Length of the input array
+        fewest (int): Smallest interval to use
+        max_bytes (int): Memory all checkpoints may take
+        
+    Returns:
+        int: The smallest interval (at least fewest) whose checkpoints
+             stay within max_bytes
+    """
+    # At most n / K checkpoints of 8 * n bytes each
+    return max(fewest, math.ceil(8 * n * n / max_bytes))
+
+
+# ============================================================================
+# STATISTICS WITHOUT SORTING
+# ============================================================================
+
+def bubble_sort_stats(numbers, variant="classic", should_stop=None):
+    """
+    Count what bubble sort would do, without running it.
+    
+    Each swap fixes exactly one inversion (a larger number before a smaller
+    one), so the number of swaps is the number of inversions. Each pass moves
+    every element at most one place to the left, so the number of passes
+    with swaps is the largest count of bigger numbers in front of any element.
+    Both are counted in O(n log n) with a Fenwick (binary indexed) tree,
+    or with numpy_inversion_stats when numbers is a NumPy array.
+    
+    Args:
+        numbers (list or ndarray): List or 1-D array of numbers
+        variant (str): One of VARIANTS; the optimized variants are counted
+                       by variant_stats
+        should_stop (function): See variant_stats (classic counts are
+                                always quick)
+        
+    Returns:
+        dict: 'n', 'passes', 'comparisons', 'swaps' and 'steps', matching
+              exactly what generate_steps would record
+    """
+    if variant != "classic":
+        return variant_stats(numbers, variant, should_stop)
+    
+    n = len(numbers)
+    
+    if is_array(numbers):
+        # Typed buffers are counted with whole-array operations
+        swaps, swap_passes = numpy_inversion_stats(numbers)
+    else:
+        # Replace each value by its rank (1 = smallest) so it can index the tree
+        ranks = {value: rank for rank, value in enumerate(sorted(set(numbers)), 1)}
+        tree = [0] * (len(ranks) + 1)
+        
+        swaps = 0
+        swap_passes = 0  # Passes that swap at least once
+        for i, value in enumerate(numbers):
+            rank = ranks[value]
+        
+            # How many earlier numbers are <= value (prefix sum in the tree)
+            not_greater = 0
+            k = rank
+            while k:
+                not_greater += tree[k]
+                k -= k & -k
+        
+            # Every earlier number bigger than value must be swapped past it
+            greater = i - not_greater
+            swaps += greater
+            swap_passes = max(swap_passes, greater)
+        
+            # Add value to the tree
+            k = rank
+            while k < len(tree):
+                tree[k] += 1
+                k += k & -k
+    
+    # After the last swapping pass, one more pass finds nothing to swap and
+    # stops the sort early, unless the (n-1) pass limit was reached first
+    if n < 2:
+        passes, sorted_step = 0, False
+    elif swap_passes < n - 1:
+        passes, sorted_step = swap_passes + 1, True
+    else:
+        passes, sorted_step = n - 1, False
+    
+    # Pass i makes (n - i - 1) comparisons
+    comparisons = passes * (n - 1) - passes * (passes - 1) // 2
+    
+    return {
+        'n': n,
+        'passes': passes,
+        'comparisons': comparisons,
+        'swaps': swaps,
+        # Initial + (compare, result) per comparison + "Sorted!" + final
+        'steps': 2 * comparisons + 2 + sorted_step
+    }
+
+
+def numpy_inversion_stats(values):
+    """
+    Count inversions and the most bigger numbers in front of any element,
+    with NumPy array operations instead of a Python loop.
+    
+    Inversions are counted bottom-up like merge sort: at every level, each
+    value in the right half of a block pair looks up (by binary search) how
+    many values in the sorted left half are bigger, then the pair is merged.
+    
+    The second count needs no tree at all. The element with the most bigger
+    numbers in front has no smaller number behind it (that number would have
+    even more), so for it the count is simply how far left it has to move,
+    and no element has to move further left than its own count.
+    
+    Args:
+        values (ndarray): 1-D array of numbers
+        
+    Returns:
+        tuple: (number of inversions, largest bigger-in-front count)
+    """
+    import numpy as np
+    n = len(values)
+    if n < 2:
+        return 0, 0
+    
+    # Distance each element moves left in a stable sort
+    order = np.argsort(values, kind="stable")
+    final_position = np.empty(n, dtype=np.int64)
+    final_position[order] = np.arange(n)
+    swap_passes = max(int((np.arange(n) - final_position).max()), 0)
+    
+    # Dense ranks (equal values share a rank) keep the merge keys small
+    _, ranks = np.unique(values, return_inverse=True)
+    ranks = ranks.astype(np.int64).ravel()
+    rank_count = int(ranks.max()) + 1
+    
+    positions = np.arange(n)
+    inversions = 0
+    width = 1
+    while width < n:
+        # Tag every value with its block pair, so one sorted array holds
+        # all the left halves one after another
+        pair = positions // (2 * width)
+        right = positions % (2 * width) >= width
+        tagged = pair * rank_count + ranks
+        
+        # Left-half values <= each right-half value, then the bigger ones
+        not_greater = np.searchsorted(tagged[~right], tagged[right], side="right")
+        not_greater -= pair[right] * width
+        inversions += int(width * len(not_greater) - not_greater.sum())
+        
+        # Merge each pair (both halves are already sorted runs)
+        tagged.sort(kind="stable")
+        ranks = tagged - pair * rank_count
+        width *= 2
+    
+    return inversions, swap_passes
+
+
+def compares_before(n, i):
+    """
+    Count the comparisons made by the first i passes.
+    
+    Pass p makes (n - p - 1) comparisons, so the first i passes make
+    i(n-1) - i(i-1)/2 of them.
+    
+    Args:
+        n (int): Length of the array
+        i (int): Number of passes
+        
+    Returns:
+        int: Total comparisons in passes 0 .. i-1
+    """
+    return i * (n - 1) - i * (i - 1) // 2
+
+
+def locate_compare(n, c):
+    """
+    Find which pass and pair comparison number c belongs to.
+    
+    Solves compares_before(n, i) <= c for the largest i with the quadratic
+    formula, so it takes the same time for any c.
+    
+    Args:
+        n (int): Length of the array
+        c (int): Comparison number, counted from 0 across all passes
+        
+    Returns:
+        tuple: (pass number i, left index j)
+    """
+    b = 2 * n - 1
+    i = (b - math.isqrt(b * b - 8 * c)) // 2
+    
+    # Integer square roots round down, so nudge i onto the exact pass
+    while i > 0 and compares_before(n, i) > c:
+        i -= 1
+    while compares_before(n, i + 1) <= c:
+        i += 1
+    return i, c - compares_before(n, i)
+
+
+# ============================================================================
+# SORT VARIANTS
+# ============================================================================
+# Besides classic bubble sort, two optimized variants can be chosen:
+# - "last_swap": everything after the last swap of a pass is already in
+#   place, so the next pass stops there instead of just one place earlier
+# - "cocktail": passes go left-to-right and right-to-left in turn (cocktail
+#   shaker sort), with the same last-swap bound on both ends
+# Every pass still compares neighbouring pairs, so a variant records the
+# same kind of trace (one bit per comparison). A variant pass is described
+# by its bounds: it compares the pairs j = lo .. hi-1, left to right
+# (forward) or right to left. Swaps are the same in every variant, because
+# each swap fixes exactly one inversion; only the comparisons differ.
+
+VARIANTS = ("classic", "last_swap", "cocktail")
+
+
+def bubble_pass_range(arr, lo, hi, forward, compares):
+    """
+    Run the first comparisons of one variant pass, in place.
+    
+    Args:
+        arr (list): Array to update
+        lo (int): Left index of the first pair of the pass
+        hi (int): One past the left index of the last pair
+        forward (bool): True for left to right, False for right to left
+        compares (int): Number of comparisons to run
+    """
+    if forward:
+        pairs = range(lo, lo + compares)
+    else:
+        pairs = range(hi - 1, hi - 1 - compares, -1)
+    for j in pairs:
+        if arr[j] > arr[j + 1]:
+            arr[j], arr[j + 1] = arr[j + 1], arr[j]
+
+
+def flip_order(keys):
+    """
+    Reverse the order of NumPy sort keys (bigger becomes smaller).
+    
+    Integers use ~x (which is -x - 1), because -x overflows for the
+    smallest int64.
+    
+    Args:
+        keys (ndarray): int64 or float64 keys
+        
+    Returns:
+        ndarray: New keys in reverse order
+    """
+    if keys.dtype.kind == "f":
+        return -keys
+    return ~keys
+
+
+def numpy_pass_range(keys, perm, lo, hi, forward, compares):
+    """
+    Run the first comparisons of one variant pass with NumPy.
+    
+    A forward pass is a classic pass over keys[lo .. hi]. A backward pass
+    carries the smallest value to the left instead, which is the same as
+    a classic pass over that part read backwards with flip_order keys.
+    
+    Args:
+        keys (ndarray): Sort keys in current order
+        perm (ndarray): Position of each value in the original input, or None
+        lo (int): Left index of the first pair of the pass
+        hi (int): One past the left index of the last pair
+        forward (bool): True for left to right, False for right to left
+        compares (int): Number of comparisons to run
+        
+    Returns:
+        tuple: (new keys, new perm, boolean swap mask in comparison order)
+    """
+    part = keys[lo:hi + 1]
+    part_perm = None if perm is None else perm[lo:hi + 1]
+    if not forward:
+        part = flip_order(part[::-1])
+        part_perm = None if perm is None else part_perm[::-1]
+    
+    part, part_perm, mask = numpy_bubble_pass(part, part_perm, compares)
+    
+    if not forward:
+        part = flip_order(part)[::-1]
+        part_perm = None if perm is None else part_perm[::-1]
+    keys = keys.copy()
+    keys[lo:hi + 1] = part
+    if perm is not None:
+        perm = perm.copy()
+        perm[lo:hi + 1] = part_perm
+    return keys, perm, mask
+
+
+def next_pass_bounds(variant, lo, hi, forward, first_swap, last_swap):
+    """
+    Work out the next pass of a variant from a pass that swapped something.
+    
+    Args:
+        variant (str): "last_swap" or "cocktail"
+        lo, hi, forward: Bounds and direction of the pass that just ended
+        first_swap (int): Smallest left index j that swapped in that pass
+        last_swap (int): Largest left index j that swapped in that pass
+        
+    Returns:
+        tuple: (lo, hi, forward) of the next pass, or None if no pairs
+               are left to compare
+    """
+    if variant == "last_swap":
+        # Everything right of the last swap is in place
+        hi = last_swap
+    elif forward:
+        # Cocktail: turn around at the last swap
+        hi, forward = last_swap, False
+    else:
+        # Cocktail, going left: everything up to the last swap is in place
+        lo, forward = first_swap + 1, True
+    if lo >= hi:
+        return None
+    return lo, hi, forward
+
+
+def variant_passes(keys, perm, variant):
+    """
+    Run a variant sort pass by pass with numpy_pass_range.
+    
+    The sort stops after a pass with no swaps (the "Sorted!" case) or when
+    the bounds leave no pairs to compare.
+    
+    Args:
+        keys (ndarray): Sort keys of the input
+        perm (ndarray): Position of each value in the input, or None
+        variant (str): "last_swap" or "cocktail"
+        
+    Yields:
+        tuple: (lo, hi, forward, keys, perm, mask) after each pass, with the
+               keys and perm after the pass and its swap mask
+    """
+    import numpy as np
+    bounds = (0, len(keys) - 1, True) if len(keys) > 1 else None
+    while bounds is not None:
+        lo, hi, forward = bounds
+        keys, perm, mask = numpy_pass_range(keys, perm, lo, hi, forward, hi - lo)
+        yield lo, hi, forward, keys, perm, mask
+        
+        swapped = np.flatnonzero(mask)
+        if not len(swapped):
+            return
+        
+        # Mask positions are in comparison order; turn them into indices j
+        if forward:
+            first_swap, last_swap = lo + int(swapped[0]), lo + int(swapped[-1])
+        else:
+            first_swap, last_swap = hi - 1 - int(swapped[-1]), hi - 1 - int(swapped[0])
+        bounds = next_pass_bounds(variant, lo, hi, forward, first_swap, last_swap)
+
+
+def sort_keys(arr):
+    """
+    Prepare the NumPy sort keys for an input.
+    
+    A list is sorted through the ranks of its values (equal values share a
+    rank), with a permutation to find the original number objects again.
+    A typed NumPy array is sorted by its values directly.
+    
+    Args:
+        arr (list or ndarray): Numbers to sort
+        
+    Returns:
+        tuple: (keys, perm), where perm is None for a NumPy array
+    """
+    import numpy as np
+    if is_array(arr):
+        return arr, None
+    
+    # Ranks keep comparisons exact for any mix of ints and floats
+    ranks = {value: rank for rank, value in enumerate(sorted(set(arr)))}
+    keys = np.array([ranks[value] for value in arr], dtype=np.int64)
+    return keys, np.arange(len(arr))
+
+
+def variant_stats(numbers, variant, should_stop=None):
+    """
+    Count what a bubble sort variant does, by running its passes.
+    
+    Unlike classic bubble sort there is no closed form, so the passes are
+    run with NumPy (one array operation per pass) without recording them.
+    
+    Args:
+        numbers (list or ndarray): Numbers to sort
+        variant (str): "last_swap" or "cocktail"
+        should_stop (function): Called before every pass; if it returns
+                                True the count is abandoned
+        
+    Returns:
+        dict: Same fields as bubble_sort_stats, plus 'saved': comparisons
+              saved compared with classic bubble sort
+        
+    Raises:
+        SortStopped: If should_stop returned True
+    """
+    keys, _ = sort_keys(numbers)
+    passes = comparisons = 0
+    sorted_step = False
+    for lo, hi, _, _, _, mask in variant_passes(keys, None, variant):
+        if should_stop is not None and should_stop():
+            raise SortStopped("Counting stopped early")
+        passes += 1
+        comparisons += hi - lo
+        sorted_step = not mask.any()
+    
+    classic = bubble_sort_stats(numbers)
+    return {
+        'n': classic['n'],
+        'passes': passes,
+        'comparisons': comparisons,
+        'swaps': classic['swaps'],
+        'steps': 2 * comparisons + 2 + sorted_step,
+        'saved': classic['comparisons'] - comparisons
+    }
+
+
+class SortStopped(Exception):
+    """Raised when a should_stop check ends a sort (or a count) early."""
+
+
+def format_array(arr, max_values=None):
+    """
+    Format an array like str(list), optionally cutting it short.
+    
+    Args:
+        arr (list): The array
+        max_values (int): Most values written out, or None for all
+    
+    Returns:
+        str: "[5, 2, 8]", or "[5, 2, ...] (3 values)" when cut short
+    """
+    if max_values is None or len(arr) <= max_values:
+        return str(arr)
+    head = ", ".join(str(value) for value in arr[:max_values])
+    return f"[{head}, ...] ({len(arr):,} values)"
+
+
+class Step:
+    """
+    One step of the sorting process, as returned by get_step.
+    
+    Uses __slots__ and builds its message only when it is read, so creating
+    a step costs little more than its array. Fields can be read as
+    attributes or like a dictionary (step['msg']).
+    
+    Attributes:
+        num (int): Step number
+        arr (list): State of the array at this step
+        kind (int): One of the STEP_* constants
+        pass_index (int): Pass number (0-based)
+        j (int): Left index of the compared pair
+    """
+    
+    __slots__ = ('num', 'arr', 'kind', 'pass_index', 'j')
+    
+    def __init__(self, num, arr, kind, pass_index, j):
+        self.num = num
+        self.arr = arr
+        self.kind = kind
+        self.pass_index = pass_index
+        self.j = j
+    
+    @property
+    def cmp(self):
+        """list: Indices being compared, [] if none"""
+        if self.kind in (STEP_COMPARE, STEP_SWAP, STEP_NO_SWAP):
+            return [self.j, self.j + 1]
+        return []
+    
+    @property
+    def swap(self):
+        """bool: Whether this step swapped two elements"""
+        return self.kind == STEP_SWAP
+    
+    @property
+    def msg(self):
+        """str: Human-readable description of the step"""
+        return self.describe()
+    
+    def describe(self, max_values=None):
+        """
+        Describe the step, optionally cutting a long array short.
+        
+        Args:
+            max_values (int): Most array values written out, or None for all
+        
+        Returns:
+            str: Human-readable description of the step
+        """
+        i, j = self.pass_index, self.j
+        if self.kind == STEP_INITIAL:
+            return f"Initial array: {format_array(self.arr, max_values)}"
+        if self.kind == STEP_COMPARE:
+            return f"Pass {i+1}: Compare arr[{j}]={self.arr[j]} with arr[{j+1}]={self.arr[j+1]}"
+        if self.kind == STEP_SWAP:
+            return f"Pass {i+1}: SWAPPED! Now: {format_array(self.arr, max_values)}"
+        if self.kind == STEP_NO_SWAP:
+            return f"Pass {i+1}: No swap"
+        if self.kind == STEP_SORTED:
+            return f"Pass {i+1}: Sorted!"
+        return f"COMPLETE: {format_array(self.arr, max_values)}"
+    
+    def __getitem__(self, key):
+        """Allow step['num'], step['arr'], step['cmp'], step['swap'], step['msg']."""
+        return getattr(self, key)
+    
+    def to_dict(self):
+        """
+        Convert to a plain dictionary.
+        
+        Returns:
+            dict: 'num', 'arr', 'cmp', 'swap' and 'msg'
+        """
+        return {
+            'num': self.num,
+            'arr': self.arr,
+            'cmp': self.cmp,
+            'swap': self.swap,
+            'msg': self.msg
+        }
+
+
+def format_log_entry(step):
+    """
+    Format one step for the text log.
+    
+    Args:
+        step (Step): Step information from get_step or iter_steps
+        
+    Returns:
+        str: Log lines for this step
+    """
+    lines = [f"STEP {step['num']}: {step['msg']}", f"Array: {step['arr']}"]
+    
+    # Show comparison details if applicable
+    if step['cmp']:
+        lines.append(f"Comparing: {step['cmp']}")
+    
+    # Highlight swap operations
+    if step['swap']:
+        lines.append(">>> SWAP <<<")
+    
+    lines.append("-" * 80)
+    return "\n".join(lines) + "\n"
+
+
+class BubbleSortVisualizer:
+    """
+    Manages the state and generation of bubble sort visualization steps.
+    
+    This class encapsulates all the logic for:
+    - Generating sorting steps
+    - Storing the complete sorting history in a compact form
+    - Tracking the current position in the sorting process
+    
+    Attributes:
+        initial (list or ndarray): The unsorted input array (stored once)
+        swap_bits (bytearray): One bit per comparison, set if it swapped
+        compare_count (int): Number of comparisons recorded so far
+        step_count (int): Number of steps recorded so far
+        sorted_step (bool): Whether the sort stopped early with "Sorted!"
+        passes (int): Number of passes finished so far
+        checkpoints (list): Array snapshots taken at the start of every
+                            checkpoint_passes-th pass
+        checkpoint_passes (int): Number of passes between two checkpoints
+                                 (see checkpoint_interval)
+        variant (str): Which of VARIANTS recorded the trace
+        pass_starts (list): For variants, the comparison number each pass
+                            starts at (classic passes follow compares_before)
+        pass_bounds (list): For variants, (lo, hi, forward) of each pass
+        current_step (int): Index of the current step being displayed
+        shared (bool): True once the trace is in app.py's TRACE_CACHE and
+                       may be used by several sessions, so it must not change
+        trace_file (str): Path of the trace file the trace is read from
+                          (see open_trace), or None if it is in memory
+    
+    In lazy mode the sort runs inside a paused generator and only produces
+    steps as far as they are requested, so total_steps() grows over time
+    until is_complete() returns True. Several threads (say a Next click and
+    a Show All of the same session) may ask for steps at once, so the
+    generator is only ever resumed while holding the visualizer's lock.
+    """
+    
+    def __init__(self, checkpoint_passes=CHECKPOINT_PASSES):
+        """
+        Initialize the visualizer with empty state.
+        
+        Args:
+            checkpoint_passes (int): Fewest passes between array snapshots.
+                                     Smaller values seek faster but use
+                                     more memory; long inputs get more
+                                     (see checkpoint_interval).
+        """
+        self.min_checkpoint_passes = checkpoint_passes
+        self.checkpoint_passes = checkpoint_passes
+        self.shared = False
+        self._trace_handle = None
+        self._lock = threading.RLock()  # Guards the lazy sort (see produce_until)
+        self.clear()
+    
+    def clear(self):
+        """Forget the current trace."""
+        # Let go of the trace file, so other processes may delete it
+        if self._trace_handle is not None:
+            self._trace_handle.close()
+        self._trace_handle = None  # Open trace file (see hold_trace_file)
+        self.initial = []  # Unsorted input
+        self.swap_bits = bytearray()  # Will store all sorting steps (1 bit each)
+        self.compare_count = 0
+        self.step_count = 0
+        self.sorted_step = False
+        self.passes = 0
+        self.checkpoints = []  # Array snapshots for fast rebuilding
+        self.variant = "classic"
+        self.pass_starts = []  # Variants only: first comparison of each pass
+        self.pass_bounds = []  # Variants only: (lo, hi, forward) of each pass
+        self.current_step = 0  # Tracks which step we're currently viewing
+        self._producer = None  # Paused sort (lazy mode), None once finished
+        self.stats = None  # Cached bubble_sort_stats for the input
+        self.trace_file = None  # Set by open_trace
+        self._writer = None  # Trace file being written by generate_steps
+        self._rows = 0  # Checkpoints written to it so far
+    
+    def _record(self, kind):
+        """
+        Record one step.
+        
+        Only comparisons and swaps need storing: everything else about a
+        step follows from its position in the trace.
+        
+        Args:
+            kind (int): One of the STEP_* constants
+        """
+        if kind == STEP_COMPARE:
+            # Make room for this comparison's bit
+            if self.compare_count & 7 == 0:
+                self.swap_bits.append(0)
+            self.compare_count += 1
+        elif kind == STEP_SWAP:
+            c = self.compare_count - 1
+            self.swap_bits[c >> 3] |= 1 << (c & 7)
+        elif kind == STEP_SORTED:
+            self.sorted_step = True
+        self.step_count += 1
+    
+    def _record_pass(self, mask):
+        """
+        Record all comparisons and results of one pass at once.
+        
+        Args:
+            mask (ndarray): Boolean swap flag for each comparison of the pass
+        """
+        import numpy as np
+        offset = self.compare_count & 7
+        bits = mask
+        
+        # Fill the free bits of the last byte one at a time
+        if offset:
+            head = min(8 - offset, len(mask))
+            for b in np.flatnonzero(mask[:head]).tolist():
+                self.swap_bits[-1] |= 1 << (offset + b)
+            bits = mask[head:]
+        
+        # The rest starts on a byte boundary and is packed in one go
+        self.swap_bits.extend(np.packbits(bits, bitorder='little').tobytes())
+        self.compare_count += len(mask)
+        self.step_count += 2 * len(mask)
+    
+    def _checkpoint(self, arr, keys, perm):
+        """
+        Snapshot the array at the start of a pass (NumPy engines).
+        
+        A trace file gets one fixed-width row: the values themselves for a
+        typed NumPy array, or the permutation for a list (the numbers are
+        looked up in the initial list again when the file is read).
+        
+        Args:
+            arr (list or ndarray): The input, as given to generate_steps
+            keys (ndarray): Current sort keys
+            perm (ndarray): Current position of each input value, or None
+                            for a typed NumPy array
+        """
+        if self._writer is not None:
+            row = keys if perm is None else perm.astype("<i8", copy=False)
+            self._writer.write(row.tobytes())
+            self._rows += 1
+        elif perm is None:
+            self.checkpoints.append(keys.copy())
+        else:
+            self.checkpoints.append([arr[p] for p in perm.tolist()])
+    
+    def generate_steps(self, numbers, lazy=False, engine=None, variant="classic", path=None,
+                       should_stop=None):
+        """
+        Generate all sorting steps for the bubble sort algorithm.
+        
+        The array state itself is not copied for each step. It is rebuilt
+        on demand by get_step from the checkpoints.
+        
+        With a path, the checkpoints are written to a trace file while the
+        sort runs (so they never have to fit in memory), and the finished
+        trace is then read back from the file with open_trace.
+        
+        Args:
+            numbers (list or ndarray): Numbers to be sorted. A NumPy array
+                                       (from parse_bulk) is sorted by the
+                                       NumPy engine as it is, without turning
+                                       each value into a Python object.
+            lazy (bool): If True, do not run the sort yet. Steps are produced
+                         later, only as far as get_step asks for them.
+            engine (str): "python" (one step at a time), "numpy" (one whole
+                          pass at a time) or None to pick by input length.
+                          Both record exactly the same steps.
+            variant (str): One of VARIANTS. The optimized variants always
+                           run on the NumPy engine.
+            path (str): Trace file to write, or None to keep the trace in
+                        memory. Cannot be combined with lazy.
+            should_stop (function): Called between steps (or passes) of a
+                                    sort that is not lazy; if it returns
+                                    True the sort is abandoned
+        
+        Raises:
+            SortStopped: If should_stop returned True. The visualizer is
+                         left empty and no trace file is written.
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant: {variant!r}")
+        if path is not None and lazy:
+            raise ValueError("A trace written to a file cannot be lazy")
+        
+        # Reset state for new sorting session
+        self.clear()
+        arr = numbers.copy()  # Create copy to avoid modifying original input
+        self.initial = arr.copy()
+        self.variant = variant
+        self.checkpoint_passes = checkpoint_interval(len(arr), self.min_checkpoint_passes)
+        
+        if variant != "classic":
+            engine = "variant"
+        elif path is not None:
+            engine = "numpy"  # Trace files need its fixed-width checkpoints
+        elif engine is None:
+            engine = "numpy" if len(arr) >= NUMPY_MIN_LENGTH else "python"
+        if engine == "python" and is_array(arr):
+            arr = arr.tolist()  # The Python engine swaps list items
+        
+        # The sort itself is a generator that pauses as it goes
+        if engine == "variant":
+            self._producer = self._produce_steps_variant(arr)
+        elif engine == "numpy":
+            self._producer = self._produce_steps_numpy(arr)
+        else:
+            self._producer = self._produce_steps(arr)
+        
+        if path is None:
+            if not lazy:
+                self._produce_all(should_stop)
+            return
+        
+        # Write to a private file first, then move it into place in one go,
+        # so nobody ever opens a half-written trace
+        partial = f"{path}.{os.getpid()}-{id(self)}.part"
+        writer = self._writer = open(partial, "wb")
+        try:
+            writer.write(bytes(TRACE_FILE_HEADER.size))  # Filled in at the end
+            self._produce_all(should_stop)
+            self._finish_trace_file()
+        except BaseException:
+            writer.close()
+            os.remove(partial)
+            raise
+        finally:
+            self._writer = None
+        os.replace(partial, path)
+        self.open_trace(path)
+    
+    def _produce_steps(self, arr):
+        """
+        Run bubble sort on arr, recording one step at a time.
+        
+        This is the core bubble sort implementation that records every action:
+        - Every comparison between adjacent elements
+        - Every swap operation performed
+        
+        It is a generator: it pauses (yields) after each recorded step, so
+        the caller decides how far the sort runs.
+        
+        Args:
+            arr (list): Working copy of the numbers (sorted in place)
+            
+        Process:
+            1. Start with unsorted array
+            2. Compare adjacent pairs
+            3. Swap if left > right
+            4. Repeat until no swaps needed (array is sorted)
+        """
+        n = len(arr)
+        
+        # STEP 0: Record the initial unsorted state
+        # This allows users to see the starting point before any sorting begins
+        # It is also the checkpoint for pass 0
+        self.checkpoints.append(arr.copy())
+        self._record(STEP_INITIAL)
+        yield
+        
+        # OUTER LOOP: Controls the number of passes through the array
+        # We need at most (n-1) passes because:
+        # - Each pass moves at least one element to its correct position
+        # - After (n-1) passes, all elements except the first must be sorted
+        # - If all others are sorted, the first element must also be in place
+        for i in range(n - 1):
+            had_swap = False  # Flag to detect if any swaps occurred in this pass
+            
+            # CHECKPOINT: Snapshot the array at the start of every few passes
+            if i > 0 and i % self.checkpoint_passes == 0:
+                self.checkpoints.append(arr.copy())
+            
+            # INNER LOOP: Compare and potentially swap adjacent elements
+            # Range decreases by i each time because:
+            # - After pass 1: largest element is at the end (position n-1)
+            # - After pass 2: two largest elements are at the end (n-2, n-1)
+            # - After pass i: i largest elements are in their final positions
+            # So we don't need to compare them again
+            for j in range(n - i - 1):
+                # COMPARISON STEP
+                # Record the comparison before we decide whether to swap
+                self._record(STEP_COMPARE)
+                yield
+                
+                # DECISION: Should we swap these elements?
+                # Swap if left element is greater than right element
+                # This moves larger values toward the end of the array
+                if arr[j] > arr[j + 1]:
+                    # PERFORM THE SWAP
+                    arr[j], arr[j + 1] = arr[j + 1], arr[j]
+                    had_swap = True  # Mark that we made at least one swap this pass
+                    
+                    # SWAP STEP
+                    self._record(STEP_SWAP)
+                    yield
+                else:
+                    # NO SWAP NEEDED
+                    # Still record this step to show the decision-making process
+                    self._record(STEP_NO_SWAP)
+                    yield
+            
+            # END OF PASS CHECK
+            # If we made no swaps during this entire pass, the array is sorted!
+            # This is an optimization that allows early termination
+            self.passes = i + 1
+            if not had_swap:
+                self._record(STEP_SORTED)
+                yield
+                break  # Exit early, no need for more passes
+        
+        # FINAL STEP
+        # Record the completion state with the fully sorted array
+        self._record(STEP_COMPLETE)
+    
+    def _produce_steps_numpy(self, arr):
+        """
+        Run bubble sort on arr one whole pass at a time with NumPy.
+        
+        Each pass is computed by numpy_bubble_pass, which also returns the
+        pass's swap mask. The mask gives exactly the bits _produce_steps
+        would record, so both engines build the same trace.
+        
+        A list is sorted through the ranks of its values (equal values
+        share a rank), and a permutation keeps track of where each original
+        value went, so checkpoints hold exactly the original number objects.
+        A typed NumPy array is already homogeneous, so its values are sorted
+        directly and its checkpoints are array copies.
+        
+        Args:
+            arr (list or ndarray): Working copy of the numbers
+        """
+        n = len(arr)
+        keys, perm = sort_keys(arr)
+        
+        # STEP 0: Initial state, also the checkpoint for pass 0
+        self._checkpoint(arr, keys, perm)
+        self._record(STEP_INITIAL)
+        yield
+        
+        for i in range(n - 1):
+            # CHECKPOINT: Snapshot the array at the start of every few passes
+            if i > 0 and i % self.checkpoint_passes == 0:
+                self._checkpoint(arr, keys, perm)
+            
+            # WHOLE PASS: compute every comparison of the pass in one go
+            # and store its swap mask as bits
+            keys, perm, mask = numpy_bubble_pass(keys, perm, n - i - 1)
+            self._record_pass(mask)
+            yield
+            
+            # END OF PASS CHECK (same early exit as _produce_steps)
+            self.passes = i + 1
+            if not mask.any():
+                self._record(STEP_SORTED)
+                yield
+                break
+        
+        # FINAL STEP
+        self._record(STEP_COMPLETE)
+    
+    def _produce_steps_variant(self, arr):
+        """
+        Run an optimized variant on arr one whole pass at a time.
+        
+        The passes come from variant_passes. Each pass's bounds are stored
+        so its steps can be decoded later, and its swap mask is recorded
+        like in _produce_steps_numpy.
+        
+        Args:
+            arr (list or ndarray): Working copy of the numbers
+        """
+        keys, perm = sort_keys(arr)
+        
+        # STEP 0: Initial state, also the checkpoint for pass 0
+        self._checkpoint(arr, keys, perm)
+        self._record(STEP_INITIAL)
+        yield
+        
+        for lo, hi, forward, after_keys, after_perm, mask in variant_passes(keys, perm, self.variant):
+            # CHECKPOINT: Snapshot the array at the start of every few passes
+            i = self.passes
+            if i > 0 and i % self.checkpoint_passes == 0:
+                self._checkpoint(arr, keys, perm)
+            
+            # WHOLE PASS: store where it starts, its bounds and its swaps
+            self.pass_starts.append(self.compare_count)
+            self.pass_bounds.append((lo, hi, forward))
+            self._record_pass(mask)
+            yield
+            
+            # END OF PASS CHECK: no swaps means the array is sorted
+            self.passes = i + 1
+            keys, perm = after_keys, after_perm
+            if not mask.any():
+                self._record(STEP_SORTED)
+                yield
+        
+        # FINAL STEP
+        self._record(STEP_COMPLETE)
+    
+    def produce_until(self, step_index, should_stop=None):
+        """
+        Resume the paused sort until a given step has been recorded.
+        
+        Steps that were already produced are kept, so moving back and forth
+        never repeats any work.
+        
+        Args:
+            step_index (int): Step that must exist, or None for every step
+            should_stop (function): Called between steps (or passes); if it
+                                    returns True the sort pauses again
+                                    before reaching step_index
+            
+        Returns:
+            bool: True if the step exists (the trace may be shorter, or
+                  should_stop may have paused the sort first)
+        """
+        # Only one thread may resume the generator at a time (a second
+        # next() on a running generator raises ValueError)
+        with self._lock:
+            while self._producer is not None and (
+                    step_index is None or self.step_count <= step_index):
+                if should_stop is not None and should_stop():
+                    break
+                try:
+                    next(self._producer)
+                except StopIteration:
+                    self._producer = None  # Sort finished, total is now known
+            
+            return step_index is not None and 0 <= step_index < self.step_count
+    
+    def _reading(self):
+        """
+        Get the lock to hold while reading steps.
+        
+        While a lazy sort is still running another thread may be adding to
+        the trace, so readers take the lock; a finished trace never changes
+        and is read without it.
+        
+        Returns:
+            The lock, or a context manager that does nothing
+        """
+        if self._producer is None:
+            return contextlib.nullcontext()
+        return self._lock
+    
+    def _produce_all(self, should_stop):
+        """
+        Run the sort to the end, unless should_stop ends it first.
+        
+        Args:
+            should_stop (function): See produce_until, or None
+            
+        Raises:
+            SortStopped: If should_stop returned True (the trace is cleared)
+        """
+        self.produce_until(None, should_stop)
+        if not self.is_complete():
+            self.clear()
+            raise SortStopped("Sort stopped early")
+    
+    def get_stats(self):
+        """
+        Get the pass, comparison, swap and step counts for the current input.
+        
+        These come from bubble_sort_stats, so they are known right away,
+        even while a lazy sort has produced only a few steps.
+        
+        Returns:
+            dict: Statistics from bubble_sort_stats
+        """
+        if self.stats is None:
+            self.stats = bubble_sort_stats(self.initial, self.variant)
+        return self.stats
+    
+    def is_complete(self):
+        """
+        Check whether the whole sort has been recorded.
+        
+        Returns:
+            bool: True once total_steps() is the final number of steps
+        """
+        return self._producer is None
+    
+    def decode_step(self, step_index):
+        """
+        Work out what an already produced step did, from its number alone.
+        
+        Args:
+            step_index (int): Index of the step
+            
+        Returns:
+            tuple: (kind, pass number i, left index j)
+        """
+        if step_index == 0:
+            return STEP_INITIAL, 0, 0
+        
+        # Steps 1, 2, 3, 4, ... are (compare, result) pairs
+        c, is_result = divmod(step_index - 1, 2)
+        if c < self.compare_count:
+            i, j = self.locate_compare(c)
+            if not is_result:
+                return STEP_COMPARE, i, j
+            if self.swap_bits[c >> 3] >> (c & 7) & 1:
+                return STEP_SWAP, i, j
+            return STEP_NO_SWAP, i, j
+        
+        # After the last comparison: "Sorted!" (if the sort stopped early),
+        # then the final step
+        if self.sorted_step and step_index == 1 + 2 * self.compare_count:
+            return STEP_SORTED, self.passes - 1, 0
+        return STEP_COMPLETE, self.passes, 0
+    
+    def pass_start(self, i):
+        """
+        Get the comparison number that pass i starts at.
+        
+        Args:
+            i (int): Pass number
+            
+        Returns:
+            int: Comparisons made before pass i
+        """
+        if self.variant == "classic":
+            return compares_before(len(self.initial), i)
+        return self.pass_starts[i]
+    
+    def locate_compare(self, c):
+        """
+        Find which pass and pair comparison number c belongs to.
+        
+        Classic passes use the closed form; variant passes are looked up in
+        pass_starts with a binary search.
+        
+        Args:
+            c (int): Comparison number, counted from 0 across all passes
+            
+        Returns:
+            tuple: (pass number i, left index j)
+        """
+        if self.variant == "classic":
+            return locate_compare(len(self.initial), c)
+        
+        i = bisect.bisect_right(self.pass_starts, c) - 1
+        lo, hi, forward = self.pass_bounds[i]
+        offset = c - self.pass_starts[i]
+        return i, (lo + offset if forward else hi - 1 - offset)
+    
+    def get_step(self, step_index):
+        """
+        Retrieve a specific step from the sorting history.
+        
+        The step number says which pass it belongs to and how many
+        comparisons of that pass are done. The array is rebuilt from the
+        checkpoint of that pass group by re-running at most
+        checkpoint_passes passes, so the cost does not depend on how far
+        into the trace the step is.
+        
+        Args:
+            step_index (int): Index of the step to retrieve
+            
+        Returns:
+            Step: Step information, or None if index is invalid
+        """
+        with self._reading():
+            # Produce the step if needed, then validate the index
+            if not self.produce_until(step_index):
+                return None
+            
+            kind, i, j = self.decode_step(step_index)
+            
+            # Work out how far the sort had got at this step
+            if kind in (STEP_COMPARE, STEP_SWAP, STEP_NO_SWAP):
+                # Comparisons of pass i done so far; a result step has handled
+                # its own pair, a compare step is about to
+                c, is_result = divmod(step_index - 1, 2)
+                compares = c - self.pass_start(i) + is_result
+            else:
+                compares = 0  # Start (or end) of a pass
+            
+            arr = self.array_at(i, compares)
+        return Step(step_index, arr, kind, i, j)
+    
+    def compared_pair(self, step_index):
+        """
+        Get the indices compared at a step without rebuilding the array.
+        
+        Args:
+            step_index (int): Index of an already produced step
+            
+        Returns:
+            list: [j, j + 1], or [] for steps that compare nothing
+        """
+        if not 0 <= step_index < self.step_count:
+            return []
+        kind, _, j = self.decode_step(step_index)
+        if kind in (STEP_COMPARE, STEP_SWAP, STEP_NO_SWAP):
+            return [j, j + 1]
+        return []
+    
+    def array_at(self, passes, compares):
+        """
+        Rebuild the array after some full passes plus part of the next one.
+        
+        Args:
+            passes (int): Number of full passes already done
+            compares (int): Comparisons already done in the following pass
+            
+        Returns:
+            list: A new list holding the array at that point
+        """
+        # Start from the latest checkpoint at or before this pass
+        base = min(passes // self.checkpoint_passes, len(self.checkpoints) - 1)
+        arr = self.checkpoints[base].copy()
+        n = len(arr)
+        
+        # Re-run the passes between the checkpoint and the requested point
+        first = base * self.checkpoint_passes
+        if self.variant != "classic":
+            return self._replay_variant(arr, first, passes, compares)
+        if is_array(arr) or passes - first >= NUMPY_MIN_REPLAY:
+            # Typed buffers and long replays run whole passes with NumPy (a
+            # list through its sort keys, like _produce_steps_numpy)
+            keys, perm = sort_keys(arr)
+            for p in range(first, passes):
+                keys, perm, _ = numpy_bubble_pass(keys, perm, n - p - 1)
+            keys, perm, _ = numpy_bubble_pass(keys, perm, compares)
+            return keys.tolist() if perm is None else [arr[i] for i in perm.tolist()]
+        
+        for p in range(first, passes):
+            bubble_pass(arr, n - p - 1)
+        bubble_pass(arr, compares)
+        return arr
+    
+    def _replay_variant(self, arr, first, passes, compares):
+        """
+        Re-run recorded variant passes on a checkpoint copy.
+        
+        Args:
+            arr (list or ndarray): Copy of the checkpoint at pass `first`
+            first (int): Pass the checkpoint was taken at
+            passes (int): Number of full passes to reach
+            compares (int): Comparisons already done in the following pass
+            
+        Returns:
+            list: A new list holding the array at that point
+        """
+        # Full passes, then the first comparisons of the next one
+        runs = [bounds + (bounds[1] - bounds[0],) for bounds in self.pass_bounds[first:passes]]
+        if compares:
+            runs.append(self.pass_bounds[passes] + (compares,))
+        
+        if not is_array(arr) and len(runs) < NUMPY_MIN_REPLAY:
+            for lo, hi, forward, count in runs:
+                bubble_pass_range(arr, lo, hi, forward, count)
+            return arr
+        
+        # Typed buffers and long replays run with NumPy (see array_at)
+        keys, perm = sort_keys(arr)
+        for lo, hi, forward, count in runs:
+            keys, perm, _ = numpy_pass_range(keys, perm, lo, hi, forward, count)
+        return keys.tolist() if perm is None else [arr[i] for i in perm.tolist()]
+    
+    def iter_steps(self, start=0, stop=None, should_stop=None):
+        """
+        Walk through a range of steps in order.
+        
+        The first step is rebuilt with get_step, then the following steps
+        are replayed from it, which is much cheaper than calling get_step
+        for each index.
+        
+        Args:
+            start (int): First step to yield
+            stop (int): Step to stop before, or None for the end of the sort
+            should_stop (function): See produce_until; the steps end early
+                                    where it paused the sort
+            
+        Yields:
+            Step: Step information for each step, in order
+        """
+        # Make sure the needed part of the sort has run
+        self.produce_until(None if stop is None else stop - 1, should_stop)
+        with self._reading():
+            stop = self.step_count if stop is None else min(stop, self.step_count)
+        if start >= stop:
+            return
+        
+        step = self.get_step(start)
+        yield step
+        arr = step.arr
+        for step_index in range(start + 1, stop):
+            # The lock is not held across yield: the caller may stop
+            # iterating at any time, from any thread
+            with self._reading():
+                kind, i, j = self.decode_step(step_index)
+            arr = arr.copy()  # Each step keeps its own array
+            if kind == STEP_SWAP:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+            yield Step(step_index, arr, kind, i, j)
+    
+    def _finish_trace_file(self):
+        """
+        Write everything after the checkpoints to the trace file, then the
+        header at its start (see TRACE FILES for the layout).
+        """
+        import numpy as np
+        writer = self._writer
+        writer.write(self.swap_bits)
+        if self.variant != "classic":
+            table = [[start, lo, hi, forward] for start, (lo, hi, forward)
+                     in zip(self.pass_starts, self.pass_bounds)]
+            writer.write(np.array(table, dtype="<i8").reshape(-1, 4).tobytes())
+        
+        # A list keeps its exact number objects (ints and floats) as JSON
+        is_list = not is_array(self.initial)
+        meta = json.dumps({
+            'initial': self.initial if is_list else None,
+            'stats': self.get_stats()
+        }).encode("utf-8")
+        writer.write(meta)
+        
+        dtype = "list" if is_list else self.initial.dtype.str
+        writer.seek(0)
+        writer.write(TRACE_FILE_HEADER.pack(
+            TRACE_FILE_MAGIC, dtype.encode("ascii"), VARIANTS.index(self.variant),
+            self.sorted_step, self.checkpoint_passes, len(self.initial), self.passes,
+            self.compare_count, self.step_count, self._rows, len(meta)))
+        writer.close()
+    
+    def open_trace(self, path):
+        """
+        Load a trace file written by generate_steps, replacing the current
+        trace.
+        
+        The file is memory-mapped rather than read: the checkpoints and swap
+        bits are NumPy and memoryview views of the mapped file, so get_step
+        reads them straight from it and only the pages it touches are ever
+        loaded. Traces far larger than memory can be opened this way, and
+        processes that open the same file share one copy of it in memory.
+        
+        The file stays open (and held, see hold_trace_file) until the trace
+        is cleared.
+        
+        Args:
+            path (str): Trace file
+            
+        Raises:
+            ValueError: If the file is not a trace file
+            OSError: If the file does not exist (or was just deleted)
+        """
+        import numpy as np
+        file = open(path, "rb")
+        mapped = None
+        try:
+            hold_trace_file(file)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(mapped) < TRACE_FILE_HEADER.size or mapped[:len(TRACE_FILE_MAGIC)] != TRACE_FILE_MAGIC:
+                raise ValueError(f"Not a trace file: {path}")
+            (_, dtype, variant, sorted_step, checkpoint_passes, n, passes, compares,
+             steps, rows, meta_length) = TRACE_FILE_HEADER.unpack_from(mapped)
+            is_list = dtype.rstrip(b"\0") == b"list"
+            try:
+                row_type = np.dtype("<i8" if is_list else dtype.rstrip(b"\0").decode("ascii"))
+            except (TypeError, UnicodeDecodeError):
+                raise ValueError(f"Not a trace file: {path}") from None
+            
+            # Checkpoint rows, then swap bits, then the variant pass table,
+            # then the metadata: check they all fit before mapping any of them
+            table_offset = TRACE_FILE_HEADER.size
+            bits_offset = table_offset + rows * n * row_type.itemsize
+            offset = bits_offset + (compares + 7) // 8
+            if variant >= len(VARIANTS):
+                raise ValueError(f"Not a trace file: {path}")
+            if VARIANTS[variant] != "classic":
+                offset += passes * 32
+            if offset + meta_length > len(mapped):
+                raise ValueError(f"Trace file is cut short: {path}")
+            meta = json.loads(mapped[offset:offset + meta_length])
+        except BaseException:
+            # Nothing views the mapping yet, so both can be closed
+            if mapped is not None:
+                mapped.close()
+            file.close()
+            raise
+        
+        table = np.frombuffer(mapped, row_type, rows * n, table_offset).reshape(rows, n)
+        swap_bits = memoryview(mapped)[bits_offset:bits_offset + (compares + 7) // 8]
+        pass_table = []
+        if VARIANTS[variant] != "classic":
+            pass_table = np.frombuffer(mapped, "<i8", passes * 4, offset - passes * 32)
+            pass_table = pass_table.reshape(passes, 4).tolist()
+        
+        self.clear()
+        self._trace_handle = file
+        self.checkpoint_passes = checkpoint_passes
+        self.variant = VARIANTS[variant]
+        self.swap_bits = swap_bits
+        self.compare_count = compares
+        self.step_count = steps
+        self.sorted_step = bool(sorted_step)
+        self.passes = passes
+        self.pass_starts = [start for start, _, _, _ in pass_table]
+        self.pass_bounds = [(lo, hi, bool(forward)) for _, lo, hi, forward in pass_table]
+        self.stats = meta['stats']
+        self.trace_file = path
+        if is_list:
+            self.initial = meta['initial']
+            self.checkpoints = PermutedRows(self.initial, table)
+        else:
+            self.initial = table[0]
+            self.checkpoints = table
+    
+    def compact_trace(self):
+        """
+        Encode the whole trace compactly, so it can be replayed elsewhere
+        (app.py sends it to a player that runs in the browser).
+        
+        Every step follows from the initial array, one swap bit per
+        comparison and where each pass starts and which pairs it compares,
+        exactly as in decode_step. A lazy sort is finished first.
+        
+        Returns:
+            dict: 'labels' (the initial values as text), 'bits' (swap_bits
+                  in base64), 'compares', 'steps', 'sorted' (whether there
+                  is a "Sorted!" step) and 'passes', holding
+                  [first comparison, lo, hi, forward] for each pass
+        """
+        self.produce_until(None)
+        
+        initial = self.initial
+        if is_array(initial):
+            initial = initial.tolist()
+        
+        # Classic passes all run forward over 0 .. n-i-1
+        if self.variant == "classic":
+            bounds = [(0, len(initial) - i - 1, True) for i in range(self.passes)]
+        else:
+            bounds = self.pass_bounds
+        
+        return {
+            'labels': [str(value) for value in initial],
+            'bits': base64.b64encode(self.swap_bits).decode('ascii'),
+            'compares': self.compare_count,
+            'steps': self.step_count,
+            'sorted': self.sorted_step,
+            'passes': [[self.pass_start(i), lo, hi, forward]
+                       for i, (lo, hi, forward) in enumerate(bounds)]
+        }
+    
+    def total_steps(self):
+        """
+        Get the total number of steps in the current sorting process.
+        
+        In lazy mode this is only the number produced so far, until
+        is_complete() returns True.
+        
+        Returns:
+            int: Total number of steps recorded
+        """
+        return self.step_count
+
+
+# ============================================================================
+# TRACE FILES
+# ============================================================================
+# generate_steps(..., path=...) writes a trace to a file that open_trace maps
+# back into memory. All numbers are little-endian:
+#
+#   header      TRACE_FILE_HEADER (see below)
+#   checkpoints one row of n fixed-width values per checkpoint: the values
+#               of a typed NumPy input, or int64 positions into the initial
+#               list for a list input
+#   swap bits   swap_bits, one bit per comparison
+#   pass table  variants only: int64 [first comparison, lo, hi, forward]
+#               for every pass
+#   metadata    JSON: the initial list (list inputs) and the statistics
+#
+# Files are named by trace_id, so the same numbers always map to the same
+# file, whichever parser read them.
+#
+# Several processes (e.g. app workers on one host) can share one folder of
+# trace files. Every process that has a trace open holds a shared lock on its
+# file; the operating system counts these references and drops them when the
+# file is closed or the process ends, even if it crashes. remove_trace_file
+# only deletes a file nobody holds.
+
+TRACE_FILE_MAGIC = b"BUBTRACE"
+
+# magic, row dtype ("list" or a NumPy dtype string), variant index, sorted
+# step flag, checkpoint_passes, n, passes, comparisons, steps, checkpoint
+# rows, metadata length (72 bytes, so the rows after it stay aligned)
+TRACE_FILE_HEADER = struct.Struct("<8s8sBBxxIQQQQQQ")
+
+
+def typed_bytes(numbers):
+    """
+    Write parsed numbers in one canonical typed form.
+    
+    A list of only ints (that fit in int64) or only floats gives the same
+    bytes as the int64 or float64 array holding them, so parse_input's list
+    and parse_bulk's array of the same numbers match. A list mixing ints
+    and floats (or with ints beyond int64) has no such array; it is written
+    as JSON instead.
+    
+    Args:
+        numbers (list or ndarray): Parsed numbers
+    
+    Returns:
+        tuple: (type name, bytes)
+    """
+    if is_array(numbers):
+        return numbers.dtype.name, numbers.tobytes()
+    kinds = set(map(type, numbers))
+    for kind, typecode, name in ((int, "q", "int64"), (float, "d", "float64")):
+        if kinds == {kind}:
+            try:
+                return name, array.array(typecode, numbers).tobytes()
+            except OverflowError:
+                break
+    return "json", json.dumps(numbers).encode()
+
+
+def trace_id(numbers, variant="classic"):
+    """
+    Identify a trace by its content: the parsed input and the variant.
+    
+    The input is hashed in its typed_bytes form, so the same numbers get
+    the same ID from every parser. The ID includes the number types,
+    because 2 and 2.0 are displayed differently even though they compare
+    equal.
+    
+    Args:
+        numbers (list or ndarray): Parsed numbers
+        variant (str): Bubble sort variant, one of VARIANTS
+        
+    Returns:
+        str: Hex digest identifying the trace
+    """
+    name, data = typed_bytes(numbers)
+    digest = hashlib.sha256(variant.encode())
+    digest.update(name.encode() + b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def hold_trace_file(file):
+    """
+    Mark an open trace file as in use by this process.
+    
+    The mark is a shared lock, which lasts until the file is closed. If
+    the file was deleted while waiting for the lock, it counts as missing.
+    
+    Args:
+        file (file): Trace file opened for reading
+        
+    Raises:
+        FileNotFoundError: If the file has been deleted
+    """
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+    if os.fstat(file.fileno()).st_nlink == 0:
+        raise FileNotFoundError(f"Trace file was deleted: {file.name}")
+
+
+def remove_trace_file(path):
+    """
+    Delete a trace file, unless a process has it open.
+    
+    Args:
+        path (str): Trace file
+        
+    Returns:
+        bool: True if the file was deleted
+    """
+    try:
+        if fcntl is None:
+            os.remove(path)  # Fails by itself if the file is open
+            return True
+        with open(path, "rb") as file:
+            # Fails at once if any process holds the file
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(path)
+    except OSError:
+        return False  # In use, already gone, or cannot be deleted
+    return True
+
+
+class PermutedRows:
+    """
+    Checkpoints of a list input, read from a trace file.
+    
+    Each row holds where the initial numbers are at that checkpoint. Rows
+    are turned back into lists of numbers only when they are read.
+    """
+    
+    def __init__(self, values, rows):
+        """
+        Args:
+            values (list): The initial list
+            rows (ndarray): One row of positions per checkpoint
+        """
+        self.values = values
+        self.rows = rows
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def __getitem__(self, index):
+        return [self.values[p] for p in self.rows[index].tolist()]
+
+
+# ============================================================================
+# INPUT PARSING
+# ============================================================================
+
+def parse_input(text):
+    """
+    Parse and validate user input from the text box.
+    
+    This function handles the INPUT phase of the algorithm:
+    - Accepts numbers separated by commas, spaces, tabs or newlines
+      (the same rule as parse_bulk)
+    - Validates each entry is a valid number
+    - Handles errors gracefully with clear messages
+    
+    Args:
+        text (str): Raw input string from user
+        
+    Returns:
+        tuple: (list of numbers, error message)
+               Returns (list, None) if successful
+               Returns (None, error_string) if validation fails
+    """
+    # Check for empty input
+    if not text or not text.strip():
+        return None, "Error: Enter numbers"
+    
+    nums = []
+    # Split by commas and whitespace and process each part
+    # (empty entries, e.g. from trailing commas, are skipped by split)
+    for part in text.replace(',', ' ').split():
+        try:
+            # Try to convert to number (float first to handle decimals)
+            n = float(part)
+        except:
+            # Catch any conversion errors and return descriptive message
+            return None, f"Error: '{part}' not a number"
+        
+        # nan and inf cannot be sorted or counted (parse_bulk rejects them too)
+        if not math.isfinite(n):
+            return None, f"Error: '{part}' not a number"
+        
+        # Convert to int if it's a whole number for cleaner display
+        if n.is_integer():
+            n = int(n)
+        nums.append(n)
+    
+    # Ensure we got at least one valid number
+    if not nums:
+        return None, "Error: No numbers found"
+    
+    return nums, None
+
+
+def typed_buffer(values):
+    """
+    Store float64 values as int64 when they are all whole numbers.
+    
+    This is the typed-buffer version of the is_integer() check in
+    parse_input, so whole numbers still display without ".0".
+    
+    Args:
+        values (ndarray): 1-D float64 array
+        
+    Returns:
+        tuple: (int64 or float64 array, error message)
+    """
+    import numpy as np
+    if not np.isfinite(values).all():
+        bad = values[~np.isfinite(values)][0]
+        return None, f"Error: '{bad}' not a number"
+    
+    # Whole numbers up to 2**53 are exact in float64, and so is the int64 copy
+    if (np.abs(values) <= 2 ** 53).all() and (values == np.floor(values)).all():
+        return values.astype(np.int64), None
+    return values, None
+
+
+def parse_bulk(text):
+    """
+    Parse a large block of numbers straight into a NumPy array.
+    
+    Works like parse_input, but converts every number in one call instead
+    of one at a time, which matters for inputs with millions of numbers.
+    Commas, spaces, tabs and newlines all separate numbers (in both), so
+    pasted CSV columns and one-number-per-line files both work.
+    
+    Args:
+        text (str): Raw numbers text
+        
+    Returns:
+        tuple: (int64 or float64 array, error message), in the same form
+               and with the same error messages as parse_input
+    """
+    import numpy as np
+    if not text or not text.strip():
+        return None, "Error: Enter numbers"
+    
+    tokens = text.replace(',', ' ').split()
+    if not tokens:
+        return None, "Error: No numbers found"
+    
+    try:
+        values = np.array(tokens, dtype=np.float64)
+    except ValueError:
+        # Find the first bad token so the message names it, like parse_input
+        for part in tokens:
+            try:
+                float(part)
+            except ValueError:
+                return None, f"Error: '{part}' not a number"
+        return None, "Error: Enter numbers"
+    
+    # Name the first nan or inf as it was typed, like parse_input
+    finite = np.isfinite(values)
+    if not finite.all():
+        return None, f"Error: '{tokens[int(np.argmin(finite))]}' not a number"
+    return typed_buffer(values)
+
+
+def load_numbers_file(path):
+    """
+    Read the numbers from an uploaded file.
+    
+    A .npy file is loaded as it is (it must hold a 1-D array of numbers).
+    Any other file is read as text and parsed by parse_bulk.
+    
+    Args:
+        path (str): Path of the uploaded file
+        
+    Returns:
+        tuple: (int64 or float64 array, error message)
+    """
+    import numpy as np
+    if path.lower().endswith(".npy"):
+        try:
+            # allow_pickle=False: never run code from an uploaded file
+            values = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            return None, "Error: Could not read .npy file"
+        
+        if values.ndim != 1:
+            return None, "Error: .npy file must hold a 1-D array"
+        if values.dtype.kind not in "biuf":
+            return None, "Error: .npy file does not hold numbers"
+        if len(values) == 0:
+            return None, "Error: No numbers found"
+        # uint64 values of 2**63 and up do not fit in int64 (astype would
+        # wrap them around to negative numbers)
+        if values.dtype.kind == "u" and values.max() > np.iinfo(np.int64).max:
+            return None, f"Error: '{values.max()}' is too large (the largest allowed is 2**63 - 1)"
+        if values.dtype.kind in "biu":
+            return values.astype(np.int64), None
+        return typed_buffer(values.astype(np.float64))
+    
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None, "Error: Could not read file"
+    return parse_bulk(text)
+
+
+# ============================================================================
+# WORKER JOBS
+# ============================================================================
+# app.py runs its CPU-heavy work (counting a variant's passes, sorting a
+# whole trace, formatting a page of the log) in worker processes, so the
+# threads serving quick clicks like Next never wait for the GIL. These are
+# the jobs those processes run. Their arguments and results are small:
+# numbers go in, and a trace comes back as a trace file (opened with
+# open_trace) instead of being copied between the processes. A worker
+# cannot call back into app.py, so a time limit is given in seconds
+# instead of as a should_stop function.
+
+
+def time_limit(seconds):
+    """
+    Make a should_stop check that stops after some time.
+    
+    Args:
+        seconds (float): Time allowed, or None for no limit
+        
+    Returns:
+        function: Returns True once the time is up, or None for no limit
+    """
+    if seconds is None:
+        return None
+    deadline = time.monotonic() + seconds
+    return lambda: time.monotonic() > deadline
+
+
+def stats_job(numbers, variant="classic", seconds=None):
+    """
+    Count the statistics of a sort (see bubble_sort_stats).
+    
+    Args:
+        numbers (list or ndarray): Parsed numbers
+        variant (str): Bubble sort variant, one of VARIANTS
+        seconds (float): Time allowed, or None for no limit
+        
+    Returns:
+        dict: The statistics
+        
+    Raises:
+        SortStopped: If counting took longer than seconds
+    """
+    return bubble_sort_stats(numbers, variant, time_limit(seconds))
+
+
+def trace_file_job(numbers, variant, path, seconds=None):
+    """
+    Sort the numbers into a trace file.
+    
+    Args:
+        numbers (list or ndarray): Parsed numbers
+        variant (str): Bubble sort variant, one of VARIANTS
+        path (str): Trace file to write
+        seconds (float): Time allowed, or None for no limit
+        
+    Raises:
+        SortStopped: If sorting took longer than seconds (no file is written)
+    """
+    visualizer = BubbleSortVisualizer()
+    visualizer.generate_steps(numbers, variant=variant, path=path,
+                              should_stop=time_limit(seconds))
+    visualizer.clear()  # Close the file
+
+
+def log_page_job(path, start, stop):
+    """
+    Format some steps of a trace file for the text log.
+    
+    Args:
+        path (str): Trace file
+        start (int): First step
+        stop (int): Step to stop before
+        
+    Returns:
+        str: The log entries (see format_log_entry)
+    """
+    visualizer = BubbleSortVisualizer()
+    visualizer.open_trace(path)
+    text = "".join(format_log_entry(step) for step in visualizer.iter_steps(start, stop))
+    visualizer.clear()
+    return text
+
+
+# ============================================================================
+# BATCH PROCESSING
+# ============================================================================
+# Many inputs are spread over worker processes. Each worker parses its input,
+# computes the result and encodes the finished output record itself, so the
+# main process only has to write bytes out in order.
+#
+# JSONL records: {"index", "n", "passes", "comparisons", "swaps", "steps"},
+# plus "saved" for the optimized variants, plus "swap_bits" (base64 of BubbleSortVisualizer.swap_bits) with --trace,
+# or {"index", "error"} for a line that is not a list of numbers.
+#
+# Binary records: a BATCH_HEADER followed by a payload of `length` bytes.
+# The payload is the swap bits (empty without --trace). A record with
+# n == 0 is an input that could not be parsed; its payload is the UTF-8
+# error message.
+
+# index, n, passes, comparisons, swaps, steps, payload length
+BATCH_HEADER = struct.Struct("<7Q")
+
+# Inputs sent to a worker process in one message
+BATCH_CHUNK_SIZE = 16
+
+# Inputs read ahead per worker, which bounds memory for very long input files
+BATCH_READ_AHEAD = 64
+
+
+def batch_record(item, with_trace=False, binary=False, variant="classic", store=None):
+    """
+    Compute and encode the result for one input line.
+    
+    Runs inside a worker process, so it must only use module-level names.
+    
+    Args:
+        item (tuple): (index, line) - position in the input and its text
+        with_trace (bool): Also run the sort and include its swap bits
+        binary (bool): Encode as a binary record instead of a JSON line
+        variant (str): Bubble sort variant, one of VARIANTS
+        store (str): Folder to write each trace to as a trace file named
+                     by its trace_id, or None
+        
+    Returns:
+        bytes: The encoded record
+    """
+    index, line = item
+    nums, error = parse_bulk(line)
+    
+    if error:
+        if binary:
+            message = error.encode("utf-8")
+            return BATCH_HEADER.pack(index, 0, 0, 0, 0, 0, len(message)) + message
+        return (json.dumps({'index': index, 'error': error}) + "\n").encode("utf-8")
+    
+    # Without a trace the closed-form counts are all that is needed
+    key = trace_id(nums, variant)
+    if with_trace or store:
+        visualizer = BubbleSortVisualizer()
+        path = None if store is None else os.path.join(store, f"{key}.trace")
+        visualizer.generate_steps(nums, variant=variant, path=path)
+        stats = visualizer.get_stats()
+        bits = bytes(visualizer.swap_bits)
+    else:
+        stats = bubble_sort_stats(nums, variant)
+        bits = b""
+    
+    if binary:
+        header = BATCH_HEADER.pack(index, stats['n'], stats['passes'], stats['comparisons'],
+                                   stats['swaps'], stats['steps'], len(bits))
+        return header + bits
+    
+    record = {'index': index, **stats}
+    if store:
+        record['trace_id'] = key
+    if with_trace:
+        record['swap_bits'] = base64.b64encode(bits).decode("ascii")
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+def run_batch(lines, workers=None, with_trace=False, binary=False, variant="classic",
+              store=None):
+    """
+    Compute results for many inputs in parallel.
+    
+    Lines are handed to a pool of worker processes in chunks, and results
+    come back in input order while later lines are still being worked on.
+    Blank lines are skipped (but still counted in the index).
+    
+    Args:
+        lines (iterable): Input lines, one list of numbers each
+        workers (int): Number of worker processes, or None for one per CPU.
+                       1 runs everything in this process.
+        with_trace (bool): Also run each sort and include its swap bits
+        binary (bool): Binary records instead of JSON lines
+        variant (str): Bubble sort variant, one of VARIANTS
+        store (str): Folder to write the trace files to, or None
+        
+    Yields:
+        bytes: One encoded record per non-blank line, in input order
+    """
+    worker = functools.partial(batch_record, with_trace=with_trace, binary=binary,
+                               variant=variant, store=store)
+    items = ((index, line) for index, line in enumerate(lines) if line.strip())
+    
+    if workers == 1:
+        yield from map(worker, items)
+        return
+    
+    # Only batch runs need worker processes, so the pool is imported here
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Submit a bounded window of lines at a time, so a huge input file
+        # is never read into memory all at once
+        while True:
+            window = list(itertools.islice(items, workers * BATCH_READ_AHEAD))
+            if not window:
+                break
+            yield from pool.map(worker, window, chunksize=BATCH_CHUNK_SIZE)
+
+
+def main(argv=None):
+    """Parse arguments and run batch mode from the command line."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Compute bubble sort statistics (and traces) for many inputs")
+    parser.add_argument("input",
+                        help="file with one list of numbers per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="where to write the results ('-' for stdout)")
+    parser.add_argument("--format", choices=["jsonl", "binary"], default="jsonl",
+                        help="output format (default %(default)s)")
+    parser.add_argument("--trace", action="store_true",
+                        help="also run each sort and include its swap bits")
+    parser.add_argument("--variant", choices=VARIANTS, default="classic",
+                        help="bubble sort variant (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--store", metavar="DIR", default=None,
+                        help="also write each trace to a trace file in DIR "
+                             "(JSON records get its trace_id)")
+    args = parser.parse_args(argv)
+    if args.store:
+        os.makedirs(args.store, exist_ok=True)
+    
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    target = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        records = run_batch(source, args.workers, args.trace, args.format == "binary",
+                            args.variant, args.store)
+        for record in records:
+            target.write(record)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout.buffer:
+            target.close()
+
+
+if __name__ == "__main__":
+    main()
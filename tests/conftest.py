@@ -0,0 +1,15 @@
+"""
+Shared test setup: app.py reads its settings from the environment when it
+is imported, so they are set here first.
+"""
+
+import os
+import sys
+import tempfile
+
+# Make "import app" and "import bubble_sort" work when run from any folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Trace files written by the tests go to a folder of their own, not the
+# server's default trace folder
+os.environ["BUBBLE_SORT_TRACE_DIR"] = tempfile.mkdtemp(prefix="bubble_sort_test_traces_")
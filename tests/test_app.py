@@ -0,0 +1,157 @@
+"""
+App Tests
+=========
+Smoke tests for app.py: it must import the way its worker processes import
+it, start those workers and build the UI, and its handlers must keep the
+page and step_index in step when navigations overlap.
+
+Usage:
+    python -m pytest tests
+"""
+
+import os
+import runpy
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import app
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app.py")
+
+
+class FakeRequest:
+    """Stands in for gr.Request: the handlers only read its session hash."""
+    
+    def __init__(self, session_hash):
+        self.session_hash = session_hash
+
+
+@pytest.fixture
+def session():
+    """A session with "5, 2, 8, 1, 9, 3" started (not in browser mode)."""
+    request = FakeRequest("test-session")
+    outputs = app.start_sorting("5, 2, 8, 1, 9, 3", None, None, "classic", False, request)
+    yield request, outputs[0]
+    app.reset(outputs[0], request)
+    app.session_closed(request)
+
+
+def test_worker_import_and_start():
+    # Worker processes run app.py again as "__mp_main__", without Gradio
+    namespace = runpy.run_path(APP_PATH, run_name="__mp_main__")
+    assert "gr" not in namespace
+    
+    namespace["start_heavy_workers"]()
+    namespace["heavy_pool"]().shutdown()
+
+
+def test_build_app():
+    blocks = app.build_app()
+    ids = [block.elem_id for block in blocks.blocks.values()]
+    assert app.REDRAW_ELEM_ID in ids
+
+
+def test_next_sends_a_diff_from_the_shown_step(session):
+    request, visualizer = session
+    new_idx, status, frame, _, _ = app.next_clicked(0, visualizer, request)
+    
+    assert new_idx == 1
+    assert status.startswith("**Step 1 of")
+    assert frame['base'] == 0 and frame['step'] == 1
+
+
+def test_overtaken_navigation_is_dropped(session):
+    request, visualizer = session
+    ticket = app.navigation_ticket()  # Started first, finishes last
+    app.next_clicked(0, visualizer, request)
+    
+    assert app.show_step(5, visualizer, request, ticket) is None
+    assert app.slider_moved(3, visualizer, request)[0] == 3
+
+
+def test_redraw_sends_the_whole_step(session):
+    request, visualizer = session
+    status, frame, _, _ = app.redraw(4, visualizer, request)
+    
+    assert 'cells' not in frame and frame['step'] == 4
+
+
+class BrokenPool:
+    """Stands in for a process pool whose workers were killed."""
+    
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A worker was killed")
+    
+    def shutdown(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def broken_workers(monkeypatch):
+    """Make every worker job fail the way a crashed worker does."""
+    monkeypatch.setattr(app, "heavy_pool", BrokenPool)
+
+
+def test_run_heavy_reports_a_broken_pool(broken_workers):
+    with pytest.raises(app.WorkerFailed):
+        app.run_heavy(None, int)
+
+
+def test_run_heavy_reports_a_failed_job():
+    with pytest.raises(app.WorkerFailed, match="ValueError"):
+        app.run_heavy(None, int, "not a number")
+    app.heavy_pool().shutdown()
+
+
+def test_handlers_work_without_workers(broken_workers):
+    # Big enough for every worker job (see HEAVY_MIN_WORK)
+    nums = list(range(700, 0, -1))
+    text = ", ".join(map(str, nums))
+    total = app.bubble_sort_stats(nums)['steps'] - 1
+    
+    outputs = app.start_sorting(text, None, None, "classic", False)
+    visualizer = outputs[0]
+    try:
+        assert outputs[2].startswith(f"**Step 0 of {total}:**")
+        assert visualizer.is_complete()
+        assert visualizer.trace_file is not None
+        assert "Steps 0 to" in app.show_all(visualizer)
+    finally:
+        app.release_visualizer(visualizer)
+    
+    assert "699 passes" in app.show_stats(text, None, "cocktail")
+
+
+def read_log(path):
+    """Read a downloaded log file."""
+    with open(path, encoding="utf-8") as log:
+        return log.read()
+
+
+def test_log_is_not_reused_for_another_trace():
+    visualizer = app.BubbleSortVisualizer()
+    visualizer.generate_steps([3, 1, 2])
+    first = app.download_log(visualizer)
+    # Same visualizer, so the same id(), as when Python reuses a freed one's
+    visualizer.generate_steps([90, 80])
+    second = app.download_log(visualizer)
+    
+    assert second != first
+    assert "90" in read_log(second) and "90" not in read_log(first)
+    app.close_visualizer(visualizer)
+    assert not os.path.exists(first) and not os.path.exists(second)
+
+
+def test_failed_log_write_leaves_no_part_file(monkeypatch):
+    def broken_entry(step):
+        raise OSError("No space left on device")
+    
+    visualizer = app.BubbleSortVisualizer()
+    visualizer.generate_steps([3, 1, 2])
+    monkeypatch.setattr(app, "format_log_entry", broken_entry)
+    with pytest.raises(OSError):
+        app.download_log(visualizer)
+    
+    assert not [name for name in os.listdir(app.LOG_DIR) if name.endswith(".part")]
+    assert not os.path.exists(app.log_file_path(visualizer))
@@ -0,0 +1,196 @@
+"""
+Engine Equivalence Tests
+========================
+Every engine must record exactly the trace of the plain Python bubble sort:
+the same steps, in the same order, with the same array at every step.
+
+- Classic: the NumPy pass engine (list and typed array inputs, in memory and
+  in a trace file) against the Python engine
+- Variants: the NumPy variant engine against a plain Python version of
+  last_swap and cocktail written out below
+
+Inputs are random (with many duplicates and negatives), plus sorted,
+reversed, all equal and very short ones.
+
+Usage:
+    python -m pytest tests
+"""
+
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+# Make "import bubble_sort" work when run from any folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bubble_sort import (  # noqa: E402
+    STEP_COMPARE,
+    STEP_COMPLETE,
+    STEP_INITIAL,
+    STEP_NO_SWAP,
+    STEP_SORTED,
+    STEP_SWAP,
+    BubbleSortVisualizer,
+)
+
+
+# Small checkpoint interval, so seeks also replay from later checkpoints
+CHECKPOINT_PASSES = 2
+
+
+def make_inputs():
+    """
+    Build the test inputs.
+    
+    Returns:
+        list: (name, list of numbers) pairs
+    """
+    rng = random.Random(121)
+    inputs = [
+        ("single", [7]),
+        ("pair", [2, 1]),
+        ("sorted", list(range(-5, 20))),
+        ("reversed", list(range(20, -5, -1))),
+        ("equal", [3] * 12),
+        ("floats", [2.5, -1.25, 0.0, 2.5, -7.5, 1e-3, 100.0]),
+    ]
+    for index in range(12):
+        n = rng.randint(2, 80)
+        # A narrow range gives many duplicates
+        spread = rng.choice([3, n, 10 * n])
+        inputs.append((f"random{index}", [rng.randint(-spread, spread) for _ in range(n)]))
+    return inputs
+
+
+INPUTS = make_inputs()
+INPUT_IDS = [name for name, _ in INPUTS]
+
+
+def trace(visualizer):
+    """
+    Read a whole trace, step by step.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): A visualizer with a finished sort
+    
+    Returns:
+        list: (kind, pass number, left index, array as a list) per step
+    """
+    return [(step.kind, step.pass_index, step.j, to_list(step.arr))
+            for step in visualizer.iter_steps()]
+
+
+def to_list(arr):
+    """Turn a step's array (list or ndarray) into a list of Python numbers."""
+    return arr.tolist() if isinstance(arr, np.ndarray) else list(arr)
+
+
+def sort_with(numbers, engine=None, variant="classic", path=None):
+    """
+    Sort numbers with one engine.
+    
+    Args:
+        numbers (list or ndarray): Input
+        engine (str): Engine passed to generate_steps
+        variant (str): Bubble sort variant
+        path (str): Trace file to write, or None
+    
+    Returns:
+        BubbleSortVisualizer: The finished visualizer
+    """
+    visualizer = BubbleSortVisualizer(checkpoint_passes=CHECKPOINT_PASSES)
+    visualizer.generate_steps(numbers, engine=engine, variant=variant, path=path)
+    return visualizer
+
+
+def reference_variant(numbers, variant):
+    """
+    Record a variant sort one comparison at a time, in plain Python.
+    
+    last_swap ends each pass at the last swap of the pass before. cocktail
+    goes left to right up to the last swap, then right to left down to the
+    first swap, and so on. Both stop after a pass with no swaps ("Sorted!")
+    or when no pairs are left to compare.
+    
+    Args:
+        numbers (list): Input
+        variant (str): "last_swap" or "cocktail"
+    
+    Returns:
+        list: Steps in the same form as trace
+    """
+    arr = list(numbers)
+    steps = [(STEP_INITIAL, 0, 0, list(arr))]
+    lo, hi, forward = 0, len(arr) - 1, True
+    passes = 0
+    while lo < hi:
+        pairs = range(lo, hi) if forward else range(hi - 1, lo - 1, -1)
+        swapped = []
+        for j in pairs:
+            steps.append((STEP_COMPARE, passes, j, list(arr)))
+            if arr[j] > arr[j + 1]:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+                swapped.append(j)
+                steps.append((STEP_SWAP, passes, j, list(arr)))
+            else:
+                steps.append((STEP_NO_SWAP, passes, j, list(arr)))
+        passes += 1
+        if not swapped:
+            steps.append((STEP_SORTED, passes - 1, 0, list(arr)))
+            break
+        
+        if variant == "last_swap":
+            hi = max(swapped)
+        elif forward:
+            hi, forward = max(swapped), False
+        else:
+            lo, forward = min(swapped) + 1, True
+    steps.append((STEP_COMPLETE, passes, 0, list(arr)))
+    return steps
+
+
+@pytest.mark.parametrize("numbers", [numbers for _, numbers in INPUTS], ids=INPUT_IDS)
+def test_numpy_engine_matches_python(numbers):
+    expected = trace(sort_with(numbers, engine="python"))
+    
+    assert expected[-1][3] == sorted(numbers)
+    assert trace(sort_with(numbers, engine="numpy")) == expected
+    assert trace(sort_with(np.array(numbers), engine="numpy")) == expected
+
+
+@pytest.mark.parametrize("numbers", [numbers for _, numbers in INPUTS], ids=INPUT_IDS)
+def test_trace_file_matches_python(numbers, tmp_path):
+    expected = trace(sort_with(numbers, engine="python"))
+    
+    for index, given in enumerate([numbers, np.array(numbers)]):
+        visualizer = sort_with(given, path=str(tmp_path / f"{index}.trace"))
+        try:
+            assert trace(visualizer) == expected
+        finally:
+            visualizer.clear()
+
+
+@pytest.mark.parametrize("variant", ["last_swap", "cocktail"])
+@pytest.mark.parametrize("numbers", [numbers for _, numbers in INPUTS], ids=INPUT_IDS)
+def test_variant_engine_matches_reference(numbers, variant):
+    expected = reference_variant(numbers, variant)
+    
+    assert trace(sort_with(numbers, variant=variant)) == expected
+    assert trace(sort_with(np.array(numbers), variant=variant)) == expected
+
+
+@pytest.mark.parametrize("variant", ["classic", "last_swap", "cocktail"])
+@pytest.mark.parametrize("numbers", [numbers for _, numbers in INPUTS], ids=INPUT_IDS)
+def test_get_step_matches_iter_steps(numbers, variant):
+    visualizer = sort_with(numbers, variant=variant)
+    expected = trace(visualizer)
+    
+    # Seeks in random order rebuild each step from its checkpoint
+    order = list(range(len(expected)))
+    random.Random(len(numbers)).shuffle(order)
+    for index in order:
+        step = visualizer.get_step(index)
+        assert (step.kind, step.pass_index, step.j, to_list(step.arr)) == expected[index]
@@ -0,0 +1,82 @@
+"""
+Input Parsing Tests
+===================
+parse_input (short text) and parse_bulk (long text and uploaded files)
+must accept and reject the same inputs, with the same error messages, and
+give the same numbers. load_numbers_file must read .npy and text files
+without changing any value.
+
+Usage:
+    python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from bubble_sort import load_numbers_file, parse_bulk, parse_input
+
+
+def as_list(numbers):
+    """Turn parsed numbers (list or ndarray) into a list of Python numbers."""
+    return numbers.tolist() if isinstance(numbers, np.ndarray) else numbers
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("5, 2, 8, 1", [5, 2, 8, 1]),
+    ("5 2 8 1", [5, 2, 8, 1]),
+    ("5,2\n8\t1,", [5, 2, 8, 1]),
+    ("-3, 0, -3, 7.0", [-3, 0, -3, 7]),
+    ("1.5, -2.25", [1.5, -2.25]),
+    ("1e3, 2", [1000, 2]),
+])
+def test_parsers_agree_on_numbers(text, expected):
+    for parse in (parse_input, parse_bulk):
+        numbers, error = parse(text)
+        assert error is None
+        assert as_list(numbers) == expected
+
+
+@pytest.mark.parametrize("text, error", [
+    ("", "Error: Enter numbers"),
+    ("   ", "Error: Enter numbers"),
+    (", ,", "Error: No numbers found"),
+    ("5, x, 2", "Error: 'x' not a number"),
+    ("3, nan, 2, 1", "Error: 'nan' not a number"),
+    ("1, inf", "Error: 'inf' not a number"),
+    ("-inf 2", "Error: '-inf' not a number"),
+    ("1, NaN, 2.5", "Error: 'NaN' not a number"),
+])
+def test_parsers_agree_on_errors(text, error):
+    for parse in (parse_input, parse_bulk):
+        assert parse(text) == (None, error)
+
+
+def test_npy_file_keeps_its_values(tmp_path):
+    path = str(tmp_path / "numbers.npy")
+    np.save(path, np.array([3, -1, 2 ** 62], dtype=np.int64))
+    numbers, error = load_numbers_file(path)
+    
+    assert error is None
+    assert numbers.dtype == np.int64 and numbers.tolist() == [3, -1, 2 ** 62]
+
+
+@pytest.mark.parametrize("values, error", [
+    (np.array([1, 2 ** 63], dtype=np.uint64),
+     "Error: '9223372036854775808' is too large (the largest allowed is 2**63 - 1)"),
+    (np.zeros((2, 2)), "Error: .npy file must hold a 1-D array"),
+    (np.array(["a", "b"]), "Error: .npy file does not hold numbers"),
+    (np.array([], dtype=np.int64), "Error: No numbers found"),
+])
+def test_npy_file_errors(tmp_path, values, error):
+    path = str(tmp_path / "numbers.npy")
+    np.save(path, values)
+    assert load_numbers_file(path) == (None, error)
+
+
+def test_text_file_is_parsed_like_the_text_box(tmp_path):
+    path = tmp_path / "numbers.csv"
+    path.write_text("5\n2\n8\n1\n", encoding="utf-8")
+    numbers, error = load_numbers_file(str(path))
+    
+    assert error is None
+    assert numbers.tolist() == [5, 2, 8, 1]
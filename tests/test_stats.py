@@ -0,0 +1,101 @@
+"""
+Statistics Tests
+================
+bubble_sort_stats counts passes, comparisons, swaps and steps without
+sorting. The counts must be exactly those of the trace generate_steps
+records, for every variant and for lists and typed arrays alike.
+
+Usage:
+    python -m pytest tests
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from bubble_sort import (
+    STEP_COMPARE,
+    STEP_SWAP,
+    BubbleSortVisualizer,
+    SortStopped,
+    bubble_sort_stats,
+)
+
+
+def make_inputs():
+    """
+    Build the test inputs.
+    
+    Returns:
+        list: (name, list of numbers) pairs
+    """
+    rng = random.Random(207)
+    inputs = [
+        ("empty", []),
+        ("single", [7]),
+        ("pair", [2, 1]),
+        ("sorted", list(range(-5, 20))),
+        # n - 1 swapping passes: the sort ends without a "Sorted!" pass
+        ("reversed", list(range(20, -5, -1))),
+        ("smallest_last", list(range(1, 15)) + [0]),
+        ("equal", [3] * 12),
+        ("floats", [2.5, -1.25, 0.0, 2.5, -7.5, 1e-3, 100.0]),
+    ]
+    for index in range(10):
+        n = rng.randint(2, 80)
+        spread = rng.choice([3, n, 10 * n])
+        inputs.append((f"random{index}", [rng.randint(-spread, spread) for _ in range(n)]))
+    return inputs
+
+
+INPUTS = make_inputs()
+INPUT_IDS = [name for name, _ in INPUTS]
+
+
+def count_trace(numbers, variant):
+    """
+    Sort numbers and count what the recorded trace holds.
+    
+    Args:
+        numbers (list): Input
+        variant (str): Bubble sort variant
+    
+    Returns:
+        dict: 'n', 'passes', 'comparisons', 'swaps' and 'steps'
+    """
+    visualizer = BubbleSortVisualizer()
+    visualizer.generate_steps(numbers, variant=variant)
+    steps = list(visualizer.iter_steps())
+    return {
+        'n': len(numbers),
+        'passes': len({step.pass_index for step in steps if step.kind == STEP_COMPARE}),
+        'comparisons': sum(1 for step in steps if step.kind == STEP_COMPARE),
+        'swaps': sum(1 for step in steps if step.kind == STEP_SWAP),
+        'steps': len(steps)
+    }
+
+
+@pytest.mark.parametrize("variant", ["classic", "last_swap", "cocktail"])
+@pytest.mark.parametrize("numbers", [numbers for _, numbers in INPUTS], ids=INPUT_IDS)
+def test_stats_match_trace(numbers, variant):
+    expected = count_trace(numbers, variant)
+    
+    for given in [numbers, np.array(numbers)]:
+        stats = bubble_sort_stats(given, variant)
+        assert {key: stats[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize("variant", ["last_swap", "cocktail"])
+@pytest.mark.parametrize("numbers", [numbers for _, numbers in INPUTS], ids=INPUT_IDS)
+def test_variant_saved_comparisons(numbers, variant):
+    stats = bubble_sort_stats(numbers, variant)
+    
+    classic = bubble_sort_stats(numbers)['comparisons']
+    assert stats['saved'] == classic - stats['comparisons']
+    assert stats['saved'] >= 0
+
+
+def test_variant_count_can_be_stopped():
+    with pytest.raises(SortStopped):
+        bubble_sort_stats(list(range(50, 0, -1)), "cocktail", should_stop=lambda: True)
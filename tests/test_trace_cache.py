@@ -0,0 +1,105 @@
+"""
+Trace Cache Tests
+=================
+TraceCache keeps finished traces within a memory budget and a cap on open
+trace files, evicting the least recently used ones first. An evicted trace
+is closed right away, unless a session still holds it: then it stays
+usable until the last hold is released.
+
+Usage:
+    python -m pytest tests
+"""
+
+import pytest
+
+import app
+from bubble_sort import BubbleSortVisualizer
+
+
+def finished(numbers, path=None):
+    """
+    Sort numbers to the end, in memory or into a trace file.
+    
+    Args:
+        numbers (list): Input
+        path (str): Trace file to write, or None
+    
+    Returns:
+        BubbleSortVisualizer: The finished visualizer
+    """
+    visualizer = BubbleSortVisualizer()
+    visualizer.generate_steps(numbers, path=path)
+    return visualizer
+
+
+def is_closed(visualizer):
+    """Check whether close_visualizer has freed a trace."""
+    return visualizer.step_count == 0
+
+
+@pytest.fixture
+def traces():
+    """Three finished in-memory traces of the same size, and that size."""
+    visualizers = [finished([start + 9, start + 3, start + 7, start + 1]) for start in range(3)]
+    sizes = {app.trace_nbytes(visualizer) for visualizer in visualizers}
+    assert len(sizes) == 1
+    return visualizers, sizes.pop()
+
+
+def test_least_recently_used_is_evicted(traces):
+    (first, second, third), size = traces
+    cache = app.TraceCache(max_bytes=2 * size)
+    cache.put("first", first)
+    cache.put("second", second)
+    assert cache.get("first") is first  # Now "second" is the oldest
+    
+    assert cache.put("third", third)
+    assert cache.get("second") is None and is_closed(second)
+    assert cache.get("first") is first and cache.get("third") is third
+    assert len(cache) == 2 and cache.nbytes == 2 * size
+
+
+def test_held_trace_is_closed_after_the_last_release(traces):
+    (first, second, _), size = traces
+    cache = app.TraceCache(max_bytes=size)
+    cache.put("first", first, hold=True)
+    assert cache.get("first", hold=True) is first  # Two sessions hold it
+    
+    cache.put("second", second)
+    assert cache.get("first") is None and not is_closed(first)
+    cache.release(first)
+    assert not is_closed(first)
+    cache.release(first)
+    assert is_closed(first)
+
+
+def test_release_keeps_a_cached_trace(traces):
+    (first, _, _), size = traces
+    cache = app.TraceCache(max_bytes=size)
+    cache.put("first", first, hold=True)
+    
+    cache.release(first)
+    assert cache.get("first") is first and not is_closed(first)
+
+
+def test_open_trace_files_are_capped(tmp_path):
+    visualizers = [finished([4, 3, 2, 1, index], path=str(tmp_path / f"{index}.trace"))
+                   for index in range(3)]
+    cache = app.TraceCache(max_files=2)
+    for index, visualizer in enumerate(visualizers):
+        cache.put(str(index), visualizer)
+    
+    assert len(cache) == 2 and cache.files == 2
+    assert is_closed(visualizers[0]) and visualizers[0].trace_file is None
+    assert not is_closed(visualizers[2])
+
+
+def test_unfinished_and_oversized_traces_are_not_cached(traces):
+    (first, _, _), size = traces
+    lazy = BubbleSortVisualizer()
+    lazy.generate_steps(list(range(30, 0, -1)), lazy=True)
+    cache = app.TraceCache(max_bytes=size - 1)
+    
+    assert not cache.put("lazy", lazy)
+    assert not cache.put("first", first)
+    assert len(cache) == 0 and not first.shared
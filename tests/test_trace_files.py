@@ -0,0 +1,131 @@
+"""
+Trace File Tests
+================
+A trace written to a trace file must read back as the same trace, for
+lists and typed arrays and every variant. prune_trace_dir must delete the
+least recently used files first and never one that is still open, and
+trace_id must give the same numbers the same ID whichever parser read them.
+
+Usage:
+    python -m pytest tests
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import app
+from bubble_sort import BubbleSortVisualizer, trace_id
+
+NUMBERS = [5, -2, 8, 1, 9, 3, 3, 0]
+
+
+def trace(visualizer):
+    """
+    Read a whole trace, step by step.
+    
+    Args:
+        visualizer (BubbleSortVisualizer): A visualizer with a finished sort
+    
+    Returns:
+        list: (kind, pass number, left index, array as a list) per step
+    """
+    return [(step.kind, step.pass_index, step.j, np.asarray(step.arr).tolist())
+            for step in visualizer.iter_steps()]
+
+
+def write_trace(numbers, path, variant="classic"):
+    """
+    Sort numbers into a trace file and let go of it.
+    
+    Args:
+        numbers (list or ndarray): Input
+        path (str): Trace file to write
+        variant (str): Bubble sort variant
+    
+    Returns:
+        list: The trace, as read by trace
+    """
+    visualizer = BubbleSortVisualizer()
+    visualizer.generate_steps(numbers, variant=variant, path=path)
+    steps = trace(visualizer)
+    visualizer.clear()
+    return steps
+
+
+@pytest.fixture
+def trace_dir(tmp_path, monkeypatch):
+    """An empty TRACE_DIR of the test's own (its usage count is restored after)."""
+    monkeypatch.setattr(app, "TRACE_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "TRACE_DIR_USED", app.TRACE_DIR_USED)
+    monkeypatch.setattr(app, "TRACE_DIR_SCANNED", app.TRACE_DIR_SCANNED)
+    return tmp_path
+
+
+@pytest.mark.parametrize("variant", ["classic", "last_swap", "cocktail"])
+@pytest.mark.parametrize("numbers", [NUMBERS, np.array(NUMBERS), np.array(NUMBERS, dtype=float)],
+                         ids=["list", "int64", "float64"])
+def test_trace_file_round_trip(numbers, variant, tmp_path):
+    path = str(tmp_path / "sort.trace")
+    expected = write_trace(numbers, path, variant)
+    
+    visualizer = BubbleSortVisualizer()
+    visualizer.open_trace(path)
+    try:
+        assert visualizer.variant == variant and visualizer.trace_file == path
+        assert trace(visualizer) == expected
+        assert visualizer.get_stats()['steps'] == len(expected)
+    finally:
+        visualizer.clear()
+
+
+def test_open_trace_rejects_other_files(tmp_path):
+    path = tmp_path / "notes.trace"
+    path.write_bytes(b"not a trace file at all")
+    
+    with pytest.raises(ValueError, match="Not a trace file"):
+        BubbleSortVisualizer().open_trace(str(path))
+
+
+def test_open_stored_trace(trace_dir):
+    key = trace_id(NUMBERS)
+    expected = write_trace(NUMBERS, app.trace_file_path(key))
+    
+    visualizer = app.open_stored_trace(key)
+    try:
+        assert trace(visualizer) == expected
+    finally:
+        visualizer.clear()
+    assert app.open_stored_trace(trace_id(NUMBERS, "cocktail")) is None
+
+
+def test_prune_deletes_oldest_unused_files(trace_dir):
+    paths = [str(trace_dir / f"{index}.trace") for index in range(4)]
+    for index, path in enumerate(paths):
+        write_trace(NUMBERS, path)
+        os.utime(path, (1000 + index, 1000 + index))  # 0.trace is the oldest
+    other = trace_dir / "notes.txt"
+    other.write_text("not a trace")
+    size = os.path.getsize(paths[0])
+    
+    # The oldest file is open, so the next two go instead
+    visualizer = BubbleSortVisualizer()
+    visualizer.open_trace(paths[0])
+    try:
+        app.prune_trace_dir(max_bytes=2 * size)
+    finally:
+        visualizer.clear()
+    
+    assert [os.path.exists(path) for path in paths] == [True, False, False, True]
+    assert other.exists()
+    assert app.TRACE_DIR_USED == 2 * size
+
+
+def test_trace_id_is_the_same_for_every_parser():
+    assert trace_id([1, 2, 3]) == trace_id(np.array([1, 2, 3], dtype=np.int64))
+    assert trace_id([1.5, 2.0]) == trace_id(np.array([1.5, 2.0]))
+    # Same values, but shown differently or sorted differently
+    assert trace_id([2, 1]) != trace_id([2.0, 1.0])
+    assert trace_id([2, 1]) != trace_id([2, 1], "cocktail")
+    assert trace_id([1, 2.5]) != trace_id([1.0, 2.5])